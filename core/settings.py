@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -56,8 +58,17 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend' # Enable django-filter
-    ]
+    ],
+    # Lists are paged by cursor on an indexed key (see project.pagination)
+    'DEFAULT_PAGINATION_CLASS': 'project.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
+API_MAX_PAGE_SIZE = 500 # Largest ?page_size= accepted by the list endpoints
+
+BULK_SALES_MAX_ROWS = 10000 # Largest batch accepted by /api/sales/bulk/
+STOCK_SERIES_MAX_PRODUCTS = 50 # Products per /api/stock/over-time/ request
+STOCK_SERIES_MAX_DAYS = 366 # Longest range of /api/stock/over-time/
+EXPORT_CHUNK_SIZE = 2000 # Rows fetched and written per piece of a streamed export
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -92,14 +103,79 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuning, applied to every new connection by project.db. Pick one with the
+# SQLITE_PROFILE environment variable (deployments opt in to `production`);
+# `benchmark_sqlite_profiles` compares them.
+SQLITE_PROFILES = {
+    # SQLite's own behaviour: rollback journal (readers wait for writers), an fsync
+    # per commit, and a new connection per request
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
+        'PRAGMAS': {'journal_mode': 'delete'},
+    },
+    'production': {
+        'CONN_MAX_AGE': 600, # Reuse each worker's connection for up to 10 minutes
+        # Take the write lock when the transaction starts, so a read-then-write
+        # transaction waits for its turn instead of failing with "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        'PRAGMAS': {
+            'busy_timeout': 5000, # ms to wait for a lock; first, so the statements below wait too
+            'journal_mode': 'wal', # Readers no longer block on the writer, nor it on them
+            'synchronous': 'normal', # Safe with WAL; fsyncs at checkpoints instead of every commit
+            'cache_size': -65536, # 64 MB page cache per connection
+            'mmap_size': 268435456, # Read up to 256 MB of the file through memory mapping
+            'temp_store': 'memory',
+        },
+    },
+}
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+if SQLITE_PROFILE not in SQLITE_PROFILES:
+    raise ImproperlyConfigured(f'SQLITE_PROFILE must be one of {sorted(SQLITE_PROFILES)}, not {SQLITE_PROFILE!r}.')
+
+# Funnel sale registrations and product stock edits from the API through one writer
+# thread that commits them in small batches (project.write_queue). Off by default
+WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED') == '1'
+WRITE_QUEUE_BATCH_WINDOW = 0.002 # Seconds the writer waits for more writes to join a batch
+WRITE_QUEUE_MAX_BATCH = 200 # Writes committed together at most
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': SQLITE_PROFILES[SQLITE_PROFILE]['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': SQLITE_PROFILES[SQLITE_PROFILE]['OPTIONS'],
+        'PRAGMAS': SQLITE_PROFILES[SQLITE_PROFILE]['PRAGMAS'],
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process; point this at Redis/Memcached when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vendedores-fornecedores',
+    }
+}
+
+# Dashboard metrics cache (seconds)
+DASHBOARD_CACHE_TIMEOUT = 300 # Entries are fresh for this long
+DASHBOARD_CACHE_STALE_TIMEOUT = 600 # ...and may be served stale this much longer while one worker recomputes
+DASHBOARD_CACHE_LOCK_TIMEOUT = 30 # Longest a recompute may hold the lock
+
+# API list response cache (see project.response_cache)
+API_CACHE_TIMEOUT = 300 # Entries are dropped after this long even if nothing changed; also how stale other workers can be with LocMem
+API_CACHE_MAX_ENTRY_BYTES = 512 * 1024 # Compressed bodies larger than this are not stored
+
+# Seconds a process reuses the platform fee configuration before reading it again.
+# Saving it also refreshes every process sharing the cache above at once
+PLATFORM_FEE_CONFIG_TTL = 30
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -143,6 +219,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Stock history older than this is compacted into monthly summaries by
+# `archive_stock_history`, with the raw rows kept in compressed files here
+STOCK_HISTORY_HORIZON_DAYS = 365
+STOCK_HISTORY_ARCHIVE_DIR = os.path.join(MEDIA_ROOT, 'var', 'stock_history')
+STOCK_HISTORY_INLINE_ROWS = 20 # Latest movements shown on the product admin page
+
+# WebP variants generated for product and vendor images (project.thumbnails)
+THUMBNAIL_SIZES = (64, 160, 320, 640) # Widths in px; srcset lets the browser pick one
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = 2 # Background threads resizing uploads
+THUMBNAIL_ASYNC = True # False builds variants inline, right after the commit (tests)
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -261,4 +349,13 @@ ADMIN_EMAIL = 'admin@example.com'
 
 # Low stock threshold
 LOW_STOCK_THRESHOLD = 5
+# False rejects sales (and their ledger rows) that would leave the stock below zero
+ALLOW_NEGATIVE_STOCK = True
+# Low-stock alerts are queued in LowStockAlert and mailed as a digest by
+# `python manage.py send_low_stock_alerts --loop`
+LOW_STOCK_DIGEST_INTERVAL = 900 # Seconds between two digests
+# Backend for the digest; None uses EMAIL_BACKEND. Set it to
+# 'django.core.mail.backends.console.EmailBackend' or '...locmem.EmailBackend'
+# to keep alerts off the real mail server (development, tests)
+LOW_STOCK_ALERT_EMAIL_BACKEND = None
 
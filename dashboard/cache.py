@@ -0,0 +1,185 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from project.models import Product, Sale, StockHistory, Supplier, Vendor, products_bulk_changed, sales_bulk_registered
+
+KEY_PREFIX = 'dashboard'
+STATS = ('hits', 'misses', 'stale', 'waits')
+LOCK_POLL_INTERVAL = 0.05
+
+# Every dashboard shows catalog data (counts, product lists); sales data is per scope.
+CATALOG_GENERATION = 'catalog'
+# The sales charts name products and vendors; renaming them must reach those entries too
+SALES_LABELS_GENERATION = 'sales:labels'
+
+
+def _generation_key(name):
+    return f'{KEY_PREFIX}:gen:{name}'
+
+
+def _sales_generation(scope, scope_id=None):
+    return f'sales:{scope}' if scope_id is None else f'sales:{scope}:{scope_id}'
+
+
+def _generations(*names):
+    keys = [_generation_key(name) for name in names]
+    found = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        if key not in found:
+            # Seed with the clock so an evicted counter never resurrects an old entry
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        generations.append(str(found[key]))
+    return generations
+
+
+def bump_generation(*names):
+    for name in names:
+        key = _generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_generation_on_commit(*names):
+    """
+    bump_generation() once the current transaction commits (at once outside one). A bump
+    made before the commit would let a read still seeing the old rows store them under
+    the new generation.
+    """
+    transaction.on_commit(lambda: bump_generation(*names))
+
+
+def _count(stat):
+    key = f'{KEY_PREFIX}:stats:{stat}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cache_stats():
+    keys = {f'{KEY_PREFIX}:stats:{stat}': stat for stat in STATS}
+    found = cache.get_many(keys)
+    return {stat: found.get(key, 0) for key, stat in keys.items()}
+
+
+def reset_cache_stats():
+    cache.delete_many([f'{KEY_PREFIX}:stats:{stat}' for stat in STATS])
+
+
+def metrics_cache_key(query, parts=None):
+    """
+    The key of `parts` of `query`, built from the generations of the data those parts
+    show only: a sale leaves the catalog and product list entries of other scopes alone,
+    and a catalog change leaves the sales entries alone.
+    """
+    parts = parts or query.PARTS
+    scope_id = query.scope_obj.pk if query.scope_obj is not None else None
+    names = []
+    if query.CATALOG in parts or query.PRODUCTS in parts:
+        names.append(CATALOG_GENERATION)
+    if query.SALES in parts:
+        names.extend([_sales_generation(query.scope, scope_id), SALES_LABELS_GENERATION])
+    return ':'.join([
+        KEY_PREFIX, 'metrics', query.scope, str(scope_id or '-'),
+        query.start.isoformat(), query.end.isoformat(), '+'.join(parts), *_generations(*names),
+    ])
+
+
+def get_dashboard_metrics(query, parts=None):
+    """
+    Returns query.run(parts) through the cache. When an entry is missing or past its
+    freshness window only one worker recomputes it; the others serve the stale
+    entry if there is one, or wait for the recompute to land.
+    """
+    parts = parts or query.PARTS
+    key = metrics_cache_key(query, parts)
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry[0] > now:
+        _count('hits')
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    lock_timeout = settings.DASHBOARD_CACHE_LOCK_TIMEOUT
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            metrics = query.run(parts)
+            timeout = settings.DASHBOARD_CACHE_TIMEOUT
+            cache.set(key, (time.time() + timeout, metrics), timeout + settings.DASHBOARD_CACHE_STALE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        _count('misses')
+        return metrics
+
+    if entry is not None:
+        _count('stale')
+        return entry[1]
+
+    deadline = now + lock_timeout
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            _count('waits')
+            return entry[1]
+
+    # The recomputing worker died or is too slow; don't keep the request hanging
+    _count('misses')
+    return query.run(parts)
+
+
+def _bump_sales(sales):
+    names = {_sales_generation('global')}
+    for sale in sales:
+        if sale is None:
+            continue
+        if sale.vendor_id:
+            names.add(_sales_generation('vendor', sale.vendor_id))
+        if sale.supplier_id:
+            names.add(_sales_generation('supplier', sale.supplier_id))
+    # Sales move their products' stock (and its ledger) too
+    bump_generation_on_commit(CATALOG_GENERATION, *names)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def invalidate_sales(sender, instance, **kwargs):
+    _bump_sales((instance, getattr(instance, '_rollup_previous', None)))
+
+
+@receiver(sales_bulk_registered, sender=Sale)
+def invalidate_bulk_sales(sender, sales, **kwargs):
+    _bump_sales(sales)
+
+
+@receiver(products_bulk_changed)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def invalidate_catalog(sender, **kwargs):
+    bump_generation_on_commit(CATALOG_GENERATION)
+
+
+@receiver(post_save, sender=StockHistory)
+@receiver(post_delete, sender=StockHistory)
+def invalidate_stock(sender, instance, **kwargs):
+    # The sale's own signal covers the entries it writes
+    if instance.reason != 'sale':
+        bump_generation_on_commit(CATALOG_GENERATION)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def invalidate_names(sender, **kwargs):
+    bump_generation_on_commit(CATALOG_GENERATION, SALES_LABELS_GENERATION)
@@ -0,0 +1,178 @@
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import CharField, Count, F, Q, Sum, Value, Window, prefetch_related_objects
+from django.db.models.functions import Cast, Coalesce, RowNumber
+from django.utils import timezone
+
+from project.models import Product, Supplier, Vendor, SalesDailyRollup
+
+TOP_N = 5
+
+CATALOG_COUNTS = {
+    'products': 'product_count',
+    'suppliers': 'supplier_count',
+    'vendors': 'vendor_count',
+    'scoped_products': 'scoped_product_count',
+}
+
+
+@dataclass
+class DashboardMetrics:
+    start_date: date
+    end_date: date
+    product_count: int = 0
+    supplier_count: int = 0
+    vendor_count: int = 0
+    scoped_product_count: int = 0
+    total_sales_value: Decimal = Decimal('0.00')
+    sales_count: int = 0
+    recent_products: list = field(default_factory=list)
+    low_stock_products: list = field(default_factory=list)
+    most_active_products: list = field(default_factory=list)
+    least_active_products: list = field(default_factory=list)
+    top_stock_products: list = field(default_factory=list)
+    products_by_supplier: list = field(default_factory=list)  # [(supplier name, product count)]
+    sales_by_day: list = field(default_factory=list)  # [(day, revenue)] for every day in range
+    top_vendors: list = field(default_factory=list)  # [(vendor name, revenue)]
+    top_products: list = field(default_factory=list)  # [(product name, quantity)]
+
+    @property
+    def average_sale_value(self):
+        return self.total_sales_value / self.sales_count if self.sales_count > 0 else 0
+
+
+class DashboardQuery:
+    """
+    Computes every dashboard KPI for one scope in four round-trips:
+    catalog counts, the product lists plus their images, and the sales rollup.
+    """
+    GLOBAL = 'global'
+    VENDOR = 'vendor'
+    SUPPLIER = 'supplier'
+    SCOPES = (GLOBAL, VENDOR, SUPPLIER)
+
+    CATALOG = 'catalog'
+    PRODUCTS = 'products'
+    SALES = 'sales'
+    PARTS = (CATALOG, PRODUCTS, SALES)
+
+    def __init__(self, scope=GLOBAL, start=None, end=None, scope_obj=None):
+        if scope not in self.SCOPES:
+            raise ValueError(f'Escopo de dashboard inválido: {scope}')
+        if scope != self.GLOBAL and scope_obj is None:
+            raise ValueError(f'O escopo "{scope}" exige um vendedor ou fornecedor.')
+        self.scope = scope
+        self.scope_obj = scope_obj
+        self.end = end or timezone.localdate()
+        self.start = start or self.end - timedelta(days=29)
+        if self.start > self.end:
+            self.start = self.end - timedelta(days=29)
+
+    def products(self):
+        products = Product.objects.all()
+        if self.scope == self.SUPPLIER:
+            products = products.filter(supplier=self.scope_obj)
+        return products
+
+    def rollup(self):
+        rollup = SalesDailyRollup.objects.filter(day__range=[self.start, self.end])
+        if self.scope == self.VENDOR:
+            rollup = rollup.filter(vendor=self.scope_obj)
+        elif self.scope == self.SUPPLIER:
+            rollup = rollup.filter(supplier=self.scope_obj)
+        return rollup
+
+    def run(self, parts=PARTS):
+        """Loads only the requested parts; the others keep their empty defaults."""
+        metrics = DashboardMetrics(start_date=self.start, end_date=self.end)
+        if self.CATALOG in parts:
+            self._load_catalog(metrics)
+        if self.PRODUCTS in parts:
+            self._load_product_lists(metrics)
+        if self.SALES in parts:
+            self._load_sales(metrics)
+        return metrics
+
+    def _load_catalog(self, metrics):
+        def counted(queryset, kind, label=Value('')):
+            return queryset.order_by().values(kind=Value(kind), label=label).annotate(n=Count('pk'))
+
+        catalog = counted(Product.objects.all(), 'products').union(
+            counted(Supplier.objects.all(), 'suppliers'),
+            counted(Vendor.objects.all(), 'vendors'),
+            counted(self.products(), 'scoped_products'),
+            counted(self.products(), 'supplier_share', Coalesce('supplier__name', Value('Sem Fornecedor'))),
+            all=True,
+        )
+        for row in catalog:
+            if row['kind'] == 'supplier_share':
+                metrics.products_by_supplier.append((row['label'], row['n']))
+            else:
+                setattr(metrics, CATALOG_COUNTS[row['kind']], row['n'])
+        metrics.products_by_supplier.sort(key=lambda item: -item[1])
+
+    def _load_product_lists(self, metrics):
+        def rank(*order_by):
+            return Window(RowNumber(), order_by=order_by)
+
+        threshold = settings.LOW_STOCK_THRESHOLD
+        products = list(
+            self.products().annotate(
+                recent_rank=rank(F('created_at').desc()),
+                most_active_rank=rank(F('updated_at').desc()),
+                least_active_rank=rank(F('updated_at').asc()),
+                stock_rank=rank(F('stock').desc()),
+            ).filter(
+                Q(recent_rank__lte=TOP_N) | Q(most_active_rank__lte=TOP_N) | Q(least_active_rank__lte=TOP_N)
+                | Q(stock_rank__lte=TOP_N) | Q(stock__lt=threshold)
+            ).order_by()
+        )
+        prefetch_related_objects(products, 'images')
+
+        def ranked(attr):
+            return sorted((p for p in products if getattr(p, attr) <= TOP_N), key=lambda p: getattr(p, attr))
+
+        metrics.recent_products = ranked('recent_rank')
+        metrics.most_active_products = ranked('most_active_rank')
+        metrics.least_active_products = ranked('least_active_rank')
+        metrics.top_stock_products = ranked('stock_rank')
+        metrics.low_stock_products = sorted((p for p in products if p.stock < threshold), key=lambda p: p.stock)
+
+    def _load_sales(self, metrics):
+        def grouped(kind, label, rank_by=None):
+            queryset = self.rollup().order_by().values(kind=Value(kind), label=label).annotate(
+                revenue=Sum('revenue'), quantity=Sum('quantity'), sale_count=Sum('sale_count'),
+            )
+            if rank_by is not None:
+                queryset = queryset.alias(rank=Window(RowNumber(), order_by=F(rank_by).desc())).filter(rank__lte=TOP_N)
+            return queryset
+
+        sales = grouped('total', Value('')).union(
+            grouped('day', Cast('day', CharField())),
+            grouped('vendor', Coalesce('vendor__name', Value('N/A')), rank_by='revenue'),
+            grouped('product', F('product__name'), rank_by='quantity'),
+            all=True,
+        )
+
+        revenue_by_day = {}
+        for row in sales:
+            if row['kind'] == 'total':
+                metrics.total_sales_value = row['revenue'] or 0
+                metrics.sales_count = row['sale_count'] or 0
+            elif row['kind'] == 'day':
+                revenue_by_day[date.fromisoformat(str(row['label']))] = row['revenue']
+            elif row['kind'] == 'vendor':
+                metrics.top_vendors.append((row['label'], row['revenue']))
+            else:
+                metrics.top_products.append((row['label'], row['quantity']))
+
+        metrics.top_vendors.sort(key=lambda item: -item[1])
+        metrics.top_products.sort(key=lambda item: -item[1])
+        days = (self.end - self.start).days + 1
+        metrics.sales_by_day = [
+            (day, revenue_by_day.get(day, 0))
+            for day in (self.start + timedelta(days=i) for i in range(days))
+        ]
@@ -1,3 +1,200 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from project.models import Product, Supplier, Vendor, Sale
+from .cache import cache_stats, get_dashboard_metrics, metrics_cache_key
+from .metrics import DashboardQuery
+from .views import CHARTS
+
+# Session and user lookups done by login_required on every request
+AUTH_QUERIES = 2
+
+
+class DashboardQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'senha')
+        cls.suppliers = [Supplier.objects.create(name=f'Fornecedor {i}') for i in range(3)]
+        cls.vendors = [Vendor.objects.create(name=f'Vendedor {i}') for i in range(3)]
+        cls.products = [
+            Product.objects.create(
+                product_code=f'P{i:03d}',
+                name=f'Produto {i}',
+                supplier=cls.suppliers[i % 3] if i % 4 else None,
+                recommended_price=Decimal('10.00'),
+                stock=1000 + i if i % 5 else 2,
+            )
+            for i in range(12)
+        ]
+        now = timezone.now()
+        for i in range(40):
+            Sale.objects.create(
+                product=cls.products[i % 12],
+                vendor=cls.vendors[i % 3] if i % 7 else None,
+                quantity=1 + i % 3,
+                total_price=Decimal('10.00') * (1 + i % 4),
+                sale_date=now - timedelta(days=i % 20),
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_global_metrics_match_direct_queries(self):
+        with self.assertNumQueries(4):
+            metrics = DashboardQuery(DashboardQuery.GLOBAL).run()
+
+        sales = Sale.objects.all()
+        self.assertEqual(metrics.product_count, 12)
+        self.assertEqual(metrics.supplier_count, 3)
+        self.assertEqual(metrics.vendor_count, 3)
+        self.assertEqual(metrics.sales_count, sales.count())
+        self.assertEqual(metrics.total_sales_value, sum(s.total_price for s in sales))
+        self.assertEqual(len(metrics.sales_by_day), 30)
+        self.assertEqual(sum(total for _, total in metrics.sales_by_day), metrics.total_sales_value)
+        self.assertEqual(len(metrics.recent_products), 5)
+        self.assertEqual([p.pk for p in metrics.recent_products], [p.pk for p in Product.objects.order_by('-created_at')[:5]])
+        self.assertEqual([p.stock for p in metrics.top_stock_products], sorted((p.stock for p in self.products), reverse=True)[:5])
+        self.assertTrue(all(p.stock < 5 for p in metrics.low_stock_products))
+        self.assertEqual(sum(count for _, count in metrics.products_by_supplier), 12)
+        self.assertLessEqual(len(metrics.top_vendors), 5)
+        self.assertLessEqual(len(metrics.top_products), 5)
+
+    def test_scoped_metrics(self):
+        vendor = self.vendors[1]
+        metrics = DashboardQuery(DashboardQuery.VENDOR, scope_obj=vendor).run()
+        self.assertEqual(metrics.sales_count, Sale.objects.filter(vendor=vendor).count())
+        self.assertEqual([name for name, _ in metrics.top_vendors], [vendor.name])
+
+        supplier = self.suppliers[2]
+        metrics = DashboardQuery(DashboardQuery.SUPPLIER, scope_obj=supplier).run()
+        self.assertEqual(metrics.scoped_product_count, supplier.products.count())
+        self.assertEqual(metrics.product_count, 12)
+        self.assertEqual(metrics.sales_count, Sale.objects.filter(product__supplier=supplier).count())
+        self.assertTrue(all(p.supplier_id == supplier.pk for p in metrics.recent_products))
+
+    def test_dashboard_pages_render_within_query_budget(self):
+        urls = [
+            reverse('dashboard'),
+            reverse('vendor_dashboard', args=[self.vendors[0].pk]),
+            reverse('supplier_dashboard', args=[self.suppliers[0].pk]),
+        ]
+        for url in urls:
+            # Catalog + product lists + images; scoped dashboards also load their vendor/supplier
+            budget = AUTH_QUERIES + 3 + (url != urls[0])
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(queries), budget)
+            # Sales are only aggregated by the chart endpoints, after first paint
+            self.assertFalse(any('salesdailyrollup' in q['sql'] for q in queries))
+
+    def test_chart_endpoints(self):
+        expected_sales = float(sum(s.total_price for s in Sale.objects.all()))
+        for chart in CHARTS:
+            with self.subTest(chart=chart):
+                response = self.client.get(reverse('dashboard_chart', kwargs={'chart': chart}))
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('ETag', response)
+                self.assertIn('no-cache', response['Cache-Control'])
+                payload = response.json()
+                if chart == 'sales-summary':
+                    self.assertEqual(payload['total_sales_value'], expected_sales)
+                else:
+                    self.assertEqual(len(payload['labels']), len(payload['data']))
+
+        url = reverse('dashboard_chart', kwargs={'chart': 'top-vendors', 'vendor_id': self.vendors[0].pk})
+        response = self.client.get(url)
+        self.assertEqual(response.json()['labels'], [self.vendors[0].name])
+        etag = response['ETag']
+        # Unchanged: answered from the cache generations, without loading the metrics
+        cache.delete(metrics_cache_key(DashboardQuery(DashboardQuery.VENDOR, scope_obj=self.vendors[0]), (DashboardQuery.SALES,)))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(any('salesdailyrollup' in q['sql'] for q in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(product=self.products[0], vendor=self.vendors[0], quantity=1, total_price=Decimal('10.00'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        response = self.client.get(reverse('dashboard_chart', kwargs={'chart': 'unknown'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class DashboardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Supplier.objects.create(name='Fornecedor')
+        cls.vendor = Vendor.objects.create(name='Vendedor')
+        cls.other_vendor = Vendor.objects.create(name='Outro Vendedor')
+        cls.product = Product.objects.create(
+            product_code='P001', name='Produto', supplier=cls.supplier,
+            recommended_price=Decimal('10.00'), stock=100,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_lookup_is_served_from_cache(self):
+        get_dashboard_metrics(DashboardQuery())
+        with self.assertNumQueries(0):
+            get_dashboard_metrics(DashboardQuery())
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1, 'stale': 0, 'waits': 0})
+
+    def test_sale_invalidates_affected_scopes(self):
+        vendor_query = lambda vendor: DashboardQuery(DashboardQuery.VENDOR, scope_obj=vendor)
+        self.assertEqual(get_dashboard_metrics(DashboardQuery()).sales_count, 0)
+        self.assertEqual(get_dashboard_metrics(vendor_query(self.vendor)).sales_count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(product=self.product, vendor=self.vendor, quantity=1, total_price=Decimal('10.00'))
+
+        self.assertEqual(get_dashboard_metrics(DashboardQuery()).sales_count, 1)
+        self.assertEqual(get_dashboard_metrics(vendor_query(self.vendor)).sales_count, 1)
+        self.assertEqual(get_dashboard_metrics(vendor_query(self.other_vendor)).sales_count, 0)
+
+    def test_generations_move_when_the_write_commits(self):
+        key = metrics_cache_key(DashboardQuery())
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'))
+            # A read before the commit may still see the old rows; it must not fill the new key
+            self.assertEqual(metrics_cache_key(DashboardQuery()), key)
+        self.assertNotEqual(metrics_cache_key(DashboardQuery()), key)
+
+    def test_sale_keeps_the_sales_entries_of_other_scopes(self):
+        other_sales = DashboardQuery(DashboardQuery.VENDOR, scope_obj=self.other_vendor)
+        sales_key = metrics_cache_key(other_sales, (DashboardQuery.SALES,))
+        catalog_key = metrics_cache_key(other_sales, (DashboardQuery.CATALOG,))
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(product=self.product, vendor=self.vendor, quantity=1, total_price=Decimal('10.00'))
+        self.assertEqual(metrics_cache_key(other_sales, (DashboardQuery.SALES,)), sales_key)
+        # The stock moved
+        self.assertNotEqual(metrics_cache_key(other_sales, (DashboardQuery.CATALOG,)), catalog_key)
+
+        # The sales charts show product names
+        self.product.name = 'Renomeado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertNotEqual(metrics_cache_key(other_sales, (DashboardQuery.SALES,)), sales_key)
+
+    def test_stale_entry_is_served_while_another_worker_recomputes(self):
+        query = DashboardQuery()
+        get_dashboard_metrics(query)
+        key = metrics_cache_key(query)
+        fresh_until, metrics = cache.get(key)
+        cache.set(key, (fresh_until - 10 ** 6, metrics))
+        cache.add(f'{key}:lock', 1)
 
-# Create your tests here.
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_metrics(query), metrics)
+        self.assertEqual(cache_stats()['stale'], 1)
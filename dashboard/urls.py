@@ -1,8 +1,12 @@
 from django.urls import path
-from .views import dashboard_view, vendor_dashboard_view, supplier_dashboard_view
+from .views import dashboard_view, vendor_dashboard_view, supplier_dashboard_view, chart_data_view, dashboard_cache_stats_view
 
 urlpatterns = [
     path('', dashboard_view, name='dashboard'),
     path('vendor/<int:vendor_id>/', vendor_dashboard_view, name='vendor_dashboard'),
     path('supplier/<int:supplier_id>/', supplier_dashboard_view, name='supplier_dashboard'),
+    path('charts/<slug:chart>/', chart_data_view, name='dashboard_chart'),
+    path('vendor/<int:vendor_id>/charts/<slug:chart>/', chart_data_view, name='dashboard_chart'),
+    path('supplier/<int:supplier_id>/charts/<slug:chart>/', chart_data_view, name='dashboard_chart'),
+    path('cache-stats/', dashboard_cache_stats_view, name='dashboard_cache_stats'),
 ]
@@ -1,8 +1,16 @@
+import csv
+from django.conf import settings
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.http import urlencode
 from import_export.admin import ImportExportModelAdmin
 from django.utils.html import format_html
-from .models import Supplier, Vendor, Product, ProductImage, PlatformFeeConfig, Sale, StockHistory
-from .resources import ProductResource
+from . import pricing, thumbnails
+from .models import Supplier, Vendor, Product, ProductImage, PlatformFeeConfig, Sale, StockHistory, LowStockAlert
+from .resources import ProductResource, SaleResource, StockHistoryResource
 
 
 @admin.register(Supplier)
@@ -33,7 +41,7 @@ class VendorAdmin(admin.ModelAdmin):
 
     def vendor_profile_thumbnail(self, obj):
         if obj.profile_image:
-            return format_html('<img src="{}" width="50" style="border-radius:50%;" />', obj.profile_image.url)
+            return thumbnails.responsive_img(obj.profile_image, obj.profile_image_variants, '50px', width='50', style='border-radius:50%;')
         return '(Sem Imagem)'
     vendor_profile_thumbnail.short_description = 'Imagem de Perfil'
 
@@ -54,16 +62,26 @@ class ProductImageInline(admin.TabularInline):
 
     def preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="80" style="border-radius:8px;" />', obj.image.url)
+            return thumbnails.responsive_img(obj.image, obj.image_variants, '80px', width='80', style='border-radius:8px;')
         return '(sem imagem)'
     preview.short_description = 'Pré-visualização'
 
 
+class RecentStockHistoryFormSet(BaseInlineFormSet):
+    def get_queryset(self):
+        # The ledger grows forever; the full, paginated list is linked from the product
+        if not hasattr(self, '_recent_queryset'):
+            self._recent_queryset = super().get_queryset()[:settings.STOCK_HISTORY_INLINE_ROWS]
+        return self._recent_queryset
+
+
 class StockHistoryInline(admin.TabularInline):
     model = StockHistory
+    formset = RecentStockHistoryFormSet
     extra = 0
-    readonly_fields = ('change', 'reason', 'timestamp')
+    readonly_fields = ('change', 'balance', 'reason', 'timestamp')
     can_delete = False
+    verbose_name_plural = 'Movimentações de estoque recentes'
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -87,12 +105,13 @@ class ProductAdmin(ImportExportModelAdmin): # Inherit from ImportExportModelAdmi
     )
     list_filter = ('is_active', 'supplier', 'created_at')
     search_fields = ('product_code', 'name', 'supplier__name')
-    readonly_fields = ('created_at', 'updated_at', 'vf_fisica', 'vf_shopee', 'min_price_allowed')
+    readonly_fields = ('created_at', 'updated_at', 'vf_fisica', 'vf_shopee', 'min_price_allowed', 'stock_history_link')
     inlines = [ProductImageInline, StockHistoryInline]
+    actions = ['export_repricing_csv']
 
     fieldsets = (
         ('Informações do Produto', {
-            'fields': ('product_code', 'name', 'description', 'supplier', 'stock', 'is_active')
+            'fields': ('product_code', 'name', 'description', 'supplier', 'stock', 'stock_history_link', 'is_active')
         }),
         ('Preços e Margens', {
             'fields': ('cost_price', 'recommended_price', 'negotiation_margin', 'vf_fisica', 'vf_shopee', 'min_price_allowed')
@@ -105,12 +124,38 @@ class ProductAdmin(ImportExportModelAdmin): # Inherit from ImportExportModelAdmi
         }),
     )
 
+    def get_queryset(self, request):
+        # First image path as a column, so the thumbnail costs no query per row
+        first_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by('position', 'created_at')
+        return super().get_queryset(request).select_related('supplier').annotate(
+            first_image=Subquery(first_image.values('image')[:1]),
+            first_image_variants=Subquery(first_image.values('image_variants')[:1]),
+        )
+
     def product_image_thumbnail(self, obj):
-        if obj.images.first():
-            return format_html('<img src="{}" width="50" style="border-radius:8px;" />', obj.images.first().image.url)
+        if obj.first_image:
+            image = ProductImage(image=obj.first_image).image
+            return thumbnails.responsive_img(image, obj.first_image_variants, '50px', width='50', style='border-radius:8px;')
         return '(Sem Imagem)'
     product_image_thumbnail.short_description = 'Imagem'
 
+    def stock_history_link(self, obj):
+        if not obj.pk:
+            return '-'
+        url = reverse('admin:project_stockhistory_changelist') + '?' + urlencode({'product__id__exact': obj.pk})
+        return format_html('<a href="{}">Ver histórico completo de estoque</a>', url)
+    stock_history_link.short_description = 'Histórico de Estoque'
+
+    @admin.action(description='Exportar preços recalculados (CSV)')
+    def export_repricing_csv(self, request, queryset):
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="precos_recalculados.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['Código', 'Nome', 'Preço de Custo', 'VF Física', 'VF Shopee', 'Preço Mínimo'])
+        for row in pricing.reprice(queryset, PlatformFeeConfig.current()):
+            writer.writerow([row['product_code'], row['name'], row['cost_price'], row['vf_fisica'], row['vf_shopee'], row['min_price_allowed']])
+        return response
+
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
@@ -151,16 +196,18 @@ class PlatformFeeConfigAdmin(admin.ModelAdmin):
 
 
 @admin.register(Sale)
-class SaleAdmin(admin.ModelAdmin):
+class SaleAdmin(ImportExportModelAdmin):
+    resource_class = SaleResource
     list_display = ('product', 'vendor', 'quantity', 'total_price', 'platform', 'sale_date')
-    list_filter = ('platform', 'sale_date', 'vendor')
+    list_filter = ('platform', 'sale_day', 'vendor')
     search_fields = ('product__name', 'vendor__name')
-    date_hierarchy = 'sale_date'
+    date_hierarchy = 'sale_day'
 
 
 @admin.register(StockHistory)
-class StockHistoryAdmin(admin.ModelAdmin):
-    list_display = ('product', 'change', 'reason', 'timestamp')
+class StockHistoryAdmin(ImportExportModelAdmin):
+    resource_class = StockHistoryResource
+    list_display = ('product', 'change', 'balance', 'reason', 'timestamp')
     list_filter = ('reason', 'timestamp')
     search_fields = ('product__name',)
     date_hierarchy = 'timestamp'
@@ -173,3 +220,17 @@ class StockHistoryAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'stock', 'event_count', 'created_at', 'sent_at')
+    list_filter = (('sent_at', admin.EmptyFieldListFilter),)
+    search_fields = ('product__name', 'product__product_code')
+    list_select_related = ('product',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,9 +1,11 @@
-from django.urls import path
+from django.urls import path, re_path
 from .api_views import (
     ProductListAPIView, ProductDetailAPIView,
     SupplierListAPIView, SupplierDetailAPIView,
     VendorListAPIView, VendorDetailAPIView,
-    SaleListAPIView, SaleDetailAPIView
+    SaleListAPIView, SaleDetailAPIView, SaleBulkCreateAPIView,
+    StockOverTimeAPIView, PricingSimulationAPIView,
+    ProductExportAPIView, SaleExportAPIView, StockHistoryExportAPIView,
 )
 
 urlpatterns = [
@@ -15,4 +17,10 @@ urlpatterns = [
     path('vendors/<int:pk>/', VendorDetailAPIView.as_view(), name='vendor-detail'),
     path('sales/', SaleListAPIView.as_view(), name='sale-list'),
     path('sales/<int:pk>/', SaleDetailAPIView.as_view(), name='sale-detail'),
+    path('sales/bulk/', SaleBulkCreateAPIView.as_view(), name='sale-bulk'),
+    path('stock/over-time/', StockOverTimeAPIView.as_view(), name='stock-over-time'),
+    path('pricing/simulate/', PricingSimulationAPIView.as_view(), name='pricing-simulate'),
+    re_path(r'^products/export\.(?P<export_format>csv|jsonl)$', ProductExportAPIView.as_view(), name='product-export'),
+    re_path(r'^sales/export\.(?P<export_format>csv|jsonl)$', SaleExportAPIView.as_view(), name='sale-export'),
+    re_path(r'^stock/history/export\.(?P<export_format>csv|jsonl)$', StockHistoryExportAPIView.as_view(), name='stock-history-export'),
 ]
@@ -1,45 +1,376 @@
-from rest_framework import generics
+import hashlib
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max, Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import generics, serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Product, Supplier, Vendor, Sale
-from .serializers import ProductSerializer, SupplierSerializer, VendorSerializer, SaleSerializer
-from .filters import ProductFilter, SupplierFilter, VendorFilter, SaleFilter
+from . import exports, pricing, write_queue
+from .response_cache import CachedListMixin
+from .models import Product, Supplier, Vendor, Sale, PlatformFeeConfig, StockHistory, StockSnapshot
+from .serializers import ProductSerializer, SupplierSerializer, VendorSerializer, SaleSerializer, BulkSaleSerializer, PlatformFeeConfigSerializer
+from .filters import ProductFilter, SupplierFilter, VendorFilter, SaleFilter, StockHistoryFilter
 
-class ProductListAPIView(generics.ListCreateAPIView):
+def _split_param(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+class ShapedResponseMixin:
+    """
+    Reads ?fields= and ?expand= (see ExpandableModelSerializer) and loads exactly the
+    relations that will be expanded: select_related for foreign keys, prefetch_related
+    for reverse relations. Foreign keys not expanded are returned as ids and cost no
+    query; to-many relations returned as id lists prefetch their keys only. Writes
+    take and return plain ids, so both parameters only apply to reads.
+    """
+
+    def get_shape(self):
+        if not hasattr(self, '_shape'):
+            params = self.request.query_params if self.request.method in ('GET', 'HEAD') else {}
+            fields = _split_param(params.get('fields')) or None
+            expand = self.get_serializer_class().resolve_expand(_split_param(params.get('expand')))
+            self._shape = (fields, expand)
+        return self._shape
+
+    def get_id_list_paths(self):
+        return self.get_serializer_class().id_list_paths(*self.get_shape())
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for path in self.get_id_list_paths():
+            model = queryset.model
+            for name in path.split('.'):
+                field = model._meta.get_field(name)
+                model = field.related_model
+            queryset = queryset.prefetch_related(Prefetch(path.replace('.', '__'), queryset=model.objects.only('pk', field.field.attname)))
+        select, prefetch = [], []
+        for path in self.get_shape()[1]:
+            model = queryset.model
+            many = False
+            for name in path.split('.'):
+                field = model._meta.get_field(name)
+                many = many or field.one_to_many or field.many_to_many
+                model = field.related_model
+            (prefetch if many else select).append(path.replace('.', '__'))
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_shape()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETag for GET, worked out without loading the rows: one aggregate gives the
+    count and latest updated_at of the rows the response would show, and of their
+    expanded relations. A client sending that ETag back in If-None-Match gets 304 Not
+    Modified. Detail endpoints also send Last-Modified; lists do not, since deleting
+    a row changes the count but not the latest updated_at.
+    """
+
+    def get_validators(self):
+        """Returns (etag, last modified datetime or None), or (None, None) for a missing object."""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        detail = lookup_url_kwarg in self.kwargs
+        if detail:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+        related = [*self.get_shape()[1], *self.get_id_list_paths()]
+        # Expanded relations and id lists are joined in, so rows are only counted once each
+        aggregates = {'count': Count('pk', distinct=bool(related)), 'modified': Max('updated_at')}
+        for position, path in enumerate(related):
+            lookup = path.replace('.', '__')
+            aggregates[f'count_{position}'] = Count(f'{lookup}__pk', distinct=True)
+            aggregates[f'modified_{position}'] = Max(f'{lookup}__updated_at')
+        state = queryset.aggregate(**aggregates)
+        if detail and not state['count']:
+            return None, None
+
+        key = '|'.join([self.request.get_full_path(), self.request.accepted_renderer.format, *map(str, state.values())])
+        etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+        modified = [value for name, value in state.items() if name.startswith('modified') and value is not None]
+        return etag, max(modified) if detail and modified else None
+
+    def get(self, request, *args, **kwargs):
+        # Worked out before the rows are read: a write in between only makes the next
+        # request download again, never a stale body look current
+        etag, last_modified = self.get_validators()
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            # A cached body keeps the ETag it was first sent with
+            response.setdefault('ETag', etag)
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            # Cacheable, but to be revalidated every time
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ProductListAPIView(ConditionalGetMixin, CachedListMixin, ShapedResponseMixin, generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
+    ordering = ('-created_at', '-id') # Page key, see project.pagination
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailAPIView(ConditionalGetMixin, ShapedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
-class SupplierListAPIView(generics.ListCreateAPIView):
+    def perform_update(self, serializer):
+        # Stock edits write the product, its stock history and snapshot
+        write_queue.run(serializer.save)
+
+class SupplierListAPIView(ConditionalGetMixin, CachedListMixin, ShapedResponseMixin, generics.ListCreateAPIView):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = SupplierFilter
 
-class SupplierDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class SupplierDetailAPIView(ConditionalGetMixin, ShapedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
 
-class VendorListAPIView(generics.ListCreateAPIView):
+class VendorListAPIView(ConditionalGetMixin, CachedListMixin, ShapedResponseMixin, generics.ListCreateAPIView):
     queryset = Vendor.objects.all()
     serializer_class = VendorSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = VendorFilter
 
-class VendorDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class VendorDetailAPIView(ConditionalGetMixin, ShapedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Vendor.objects.all()
     serializer_class = VendorSerializer
 
-class SaleListAPIView(generics.ListCreateAPIView):
+class SaleListAPIView(CachedListMixin, ShapedResponseMixin, generics.ListCreateAPIView):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = SaleFilter
+    ordering = ('-sale_date', '-id') # Page key, see project.pagination
 
-class SaleDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+    def perform_create(self, serializer):
+        # With the write queue on, concurrent sales are registered together by one Sale.bulk_register()
+        try:
+            serializer.instance = write_queue.run_batched(
+                Sale.bulk_register, Sale(**serializer.validated_data), inline=serializer.save,
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'quantity': exc.messages})
+
+class SaleDetailAPIView(ShapedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
+
+
+class SaleBulkCreateAPIView(APIView):
+    """
+    POST a list of sales (see BulkSaleSerializer) to register them all in one
+    transaction via Sale.bulk_register(). All or nothing: if any row is invalid the
+    response is 400 with the errors keyed by row index and nothing is saved.
+    """
+
+    def post(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise serializers.ValidationError({'non_field_errors': ['Envie uma lista de vendas.']})
+        if len(rows) > settings.BULK_SALES_MAX_ROWS:
+            raise serializers.ValidationError({'non_field_errors': [f'Envie no máximo {settings.BULK_SALES_MAX_ROWS} vendas por lote.']})
+
+        errors = {}
+        validated = []
+        row_serializer = BulkSaleSerializer()
+        for index, row in enumerate(rows):
+            try:
+                validated.append((index, row_serializer.run_validation(row)))
+            except serializers.ValidationError as exc:
+                errors[index] = exc.detail
+
+        # One query per model for the whole batch instead of one per row
+        product_fields = ('id', 'product_code', 'name', 'supplier_id')
+        by_id = Product.objects.only(*product_fields).in_bulk({data['product'] for _, data in validated if data.get('product')})
+        by_code = Product.objects.only(*product_fields).in_bulk(
+            {data['product_code'] for _, data in validated if not data.get('product')}, field_name='product_code',
+        )
+        vendor_ids = set(Vendor.objects.filter(pk__in={data['vendor'] for _, data in validated if data.get('vendor')}).values_list('pk', flat=True))
+
+        now = timezone.now()
+        sales, indexes = [], []
+        for index, data in validated:
+            product = by_id.get(data['product']) if data.get('product') else by_code.get(data['product_code'])
+            row_errors = {}
+            if product is None:
+                row_errors['product'] = ['Produto não encontrado.']
+            if data.get('vendor') and data['vendor'] not in vendor_ids:
+                row_errors['vendor'] = ['Vendedor não encontrado.']
+            if row_errors:
+                errors[index] = row_errors
+                continue
+            sales.append(Sale(
+                product=product,
+                vendor_id=data.get('vendor'),
+                quantity=data['quantity'],
+                total_price=data['total_price'],
+                platform=data['platform'],
+                sale_date=data.get('sale_date') or now,
+            ))
+            indexes.append(index)
+
+        if not errors:
+            try:
+                created = write_queue.run(Sale.bulk_register, sales)
+            except DjangoValidationError as exc:
+                if not hasattr(exc, 'error_dict'):
+                    raise serializers.ValidationError({'non_field_errors': exc.messages})
+                errors = {indexes[position]: {'quantity': messages} for position, messages in exc.message_dict.items()}
+        if errors:
+            return Response({'errors': dict(sorted(errors.items()))}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': len(created), 'ids': [sale.pk for sale in created]}, status=status.HTTP_201_CREATED)
+
+
+class StockOverTimeAPIView(APIView):
+    """
+    GET the daily closing stock of up to STOCK_SERIES_MAX_PRODUCTS products, read
+    from StockSnapshot. Parameters: `product` (id or product_code; repeat it or
+    separate with commas), `start_date` and `end_date` (AAAA-MM-DD, default the
+    last 30 days, at most STOCK_SERIES_MAX_DAYS).
+    """
+
+    def get(self, request):
+        references = [value for param in request.query_params.getlist('product') for value in param.split(',') if value]
+        if not references:
+            raise serializers.ValidationError({'product': ['Informe ao menos um produto.']})
+        if len(references) > settings.STOCK_SERIES_MAX_PRODUCTS:
+            raise serializers.ValidationError({'product': [f'Informe no máximo {settings.STOCK_SERIES_MAX_PRODUCTS} produtos.']})
+
+        today = timezone.localdate()
+        dates = serializers.DateField()
+        try:
+            end = dates.to_internal_value(request.query_params['end_date']) if 'end_date' in request.query_params else today
+            start = dates.to_internal_value(request.query_params['start_date']) if 'start_date' in request.query_params else end - timedelta(days=29)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({'date': exc.detail})
+        if start > end or (end - start).days >= settings.STOCK_SERIES_MAX_DAYS:
+            raise serializers.ValidationError({'date': [f'Use um intervalo de 1 a {settings.STOCK_SERIES_MAX_DAYS} dias.']})
+
+        ids = set()
+        for reference in references:
+            try:
+                ids.add(uuid.UUID(reference))
+            except ValueError:
+                pass
+        products = list(
+            Product.objects.filter(Q(pk__in=ids) | Q(product_code__in=references)).only('id', 'product_code', 'name')
+        )
+        series = StockSnapshot.series([product.pk for product in products], start, end)
+        return Response({
+            'start_date': start,
+            'end_date': end,
+            'products': [
+                {
+                    'id': product.pk,
+                    'product_code': product.product_code,
+                    'name': product.name,
+                    'series': [{'date': day, 'stock': stock} for day, stock in series[product.pk]],
+                }
+                for product in products
+            ],
+        })
+
+
+class PricingSimulationAPIView(APIView):
+    """
+    POST a (partial) PlatformFeeConfig to reprice the catalog under it without saving.
+    Omitted fields keep their current values; ProductFilter query parameters
+    narrow the products that are repriced.
+    """
+
+    def post(self, request):
+        current = PlatformFeeConfig.current() or PlatformFeeConfig()
+        config_serializer = PlatformFeeConfigSerializer(current, data=request.data, partial=True)
+        config_serializer.is_valid(raise_exception=True)
+        hypothetical = PlatformFeeConfig(**{
+            field: config_serializer.validated_data.get(field, getattr(current, field))
+            for field in pricing.PRICING_FIELDS
+        })
+
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.all())
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+
+        results, summary = pricing.simulate(filterset.qs, current, hypothetical)
+        as_text = lambda row: {key: str(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+        return Response({
+            'current_config': PlatformFeeConfigSerializer(current).data,
+            'simulated_config': PlatformFeeConfigSerializer(hypothetical).data,
+            'summary': as_text(summary),
+            'results': [as_text(row) for row in results],
+        })
+
+
+class StreamingExportAPIView(APIView):
+    """
+    GET the rows matching the filterset's query parameters as a CSV or JSON Lines
+    download (the URL picks the format), streamed EXPORT_CHUNK_SIZE rows at a time
+    so memory stays flat on any table size. Subclasses set queryset, filterset_class,
+    columns (see project.exports) and filename.
+    """
+    queryset = None
+    filterset_class = None
+    columns = None
+    filename = None
+
+    def perform_content_negotiation(self, request, force=False):
+        # The download is written by hand; a renderer is only needed for error responses
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, export_format):
+        filterset = self.filterset_class(request.query_params, queryset=self.queryset.all())
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        response = StreamingHttpResponse(
+            exports.stream_export(filterset.qs, self.columns, export_format, settings.EXPORT_CHUNK_SIZE),
+            content_type=exports.FORMATS[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}-{timezone.localdate():%Y%m%d}.{export_format}"'
+        return response
+
+
+class ProductExportAPIView(StreamingExportAPIView):
+    queryset = Product.objects.all()
+    filterset_class = ProductFilter
+    columns = exports.PRODUCT_COLUMNS
+    filename = 'produtos'
+
+
+class SaleExportAPIView(StreamingExportAPIView):
+    queryset = Sale.objects.all()
+    filterset_class = SaleFilter
+    columns = exports.SALE_COLUMNS
+    filename = 'vendas'
+
+
+class StockHistoryExportAPIView(StreamingExportAPIView):
+    queryset = StockHistory.objects.all()
+    filterset_class = StockHistoryFilter
+    columns = exports.STOCK_HISTORY_COLUMNS
+    filename = 'historico-estoque'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProjectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'project'
+
+    def ready(self):
+        from . import db  # noqa: F401  connects the connection_created receiver
+        from . import response_cache  # noqa: F401  connects the cache invalidation signals
@@ -0,0 +1,18 @@
+"""
+Per-connection SQLite settings.
+
+PRAGMAs only last as long as the connection (journal_mode=wal is the exception:
+it is stored in the file), so they are set every time Django opens one, from the
+database's PRAGMAS entry (see SQLITE_PROFILES in the settings).
+"""
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in connection.settings_dict.get('PRAGMAS', {}).items():
+        # journal_mode answers with a row; fetch it so the statement completes
+        connection.connection.execute(f'PRAGMA {name} = {value}').fetchall()
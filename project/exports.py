@@ -0,0 +1,96 @@
+"""
+Streaming CSV / JSON Lines exports.
+
+stream_export() reads a queryset with .values_list().iterator() and yields the
+file a chunk of rows at a time, so memory stays flat however many rows there are.
+The columns match the import resources, so an export can be imported back with
+`import_records`.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.utils import timezone
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# (column, values() lookup)
+PRODUCT_COLUMNS = [
+    ('id', 'id'),
+    ('product_code', 'product_code'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('supplier__name', 'supplier__name'),
+    ('cost_price', 'cost_price'),
+    ('recommended_price', 'recommended_price'),
+    ('negotiation_margin', 'negotiation_margin'),
+    ('stock', 'stock'),
+    ('is_active', 'is_active'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+SALE_COLUMNS = [
+    ('id', 'id'),
+    ('product_code', 'product__product_code'),
+    ('vendor', 'vendor__name'),
+    ('quantity', 'quantity'),
+    ('total_price', 'total_price'),
+    ('platform', 'platform'),
+    ('sale_date', 'sale_date'),
+]
+STOCK_HISTORY_COLUMNS = [
+    ('id', 'id'),
+    ('product_code', 'product__product_code'),
+    ('change', 'change'),
+    ('reason', 'reason'),
+    ('balance', 'balance'),
+    ('timestamp', 'timestamp'),
+]
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, (date, Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def _csv_chunks(headers, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(['' if value is None else _plain(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _jsonl_chunks(headers, rows, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(headers, map(_plain, row))), ensure_ascii=False))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_export(queryset, columns, export_format, chunk_size):
+    """Yields the rows of `queryset` as CSV or JSON Lines text, `chunk_size` rows per piece."""
+    headers = [column for column, lookup in columns]
+    # Primary key order walks the table instead of sorting it first
+    rows = queryset.order_by('pk').values_list(*(lookup for column, lookup in columns)).iterator(chunk_size=chunk_size)
+    chunks = _csv_chunks if export_format == 'csv' else _jsonl_chunks
+    return chunks(headers, rows, chunk_size)
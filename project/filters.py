@@ -1,5 +1,7 @@
 import django_filters
-from .models import Product, Supplier, Vendor, Sale
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import Product, Supplier, Vendor, Sale, StockHistory
 
 class ProductFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
@@ -31,14 +33,40 @@ class VendorFilter(django_filters.FilterSet):
         fields = ['name', 'phone']
 
 class SaleFilter(django_filters.FilterSet):
-    product = django_filters.NumberFilter(field_name='product__id')
+    product = django_filters.UUIDFilter(field_name='product__id')
     vendor = django_filters.NumberFilter(field_name='vendor__id')
     platform = django_filters.CharFilter(lookup_expr='exact')
     min_total_price = django_filters.NumberFilter(field_name='total_price', lookup_expr='gte')
     max_total_price = django_filters.NumberFilter(field_name='total_price', lookup_expr='lte')
-    start_date = django_filters.DateFilter(field_name='sale_date', lookup_expr='gte')
-    end_date = django_filters.DateFilter(field_name='sale_date', lookup_expr='lte')
+    # Both bounds are local calendar days and inclusive; they filter the indexed sale_day column
+    start_date = django_filters.DateFilter(field_name='sale_day', lookup_expr='gte')
+    end_date = django_filters.DateFilter(method='filter_end_date')
 
     class Meta:
         model = Sale
         fields = ['product', 'vendor', 'platform', 'min_total_price', 'max_total_price', 'start_date', 'end_date']
+
+    def filter_end_date(self, queryset, name, value):
+        return queryset.filter(sale_day__lt=value + timedelta(days=1))
+
+class StockHistoryFilter(django_filters.FilterSet):
+    product = django_filters.UUIDFilter(field_name='product__id')
+    product_code = django_filters.CharFilter(field_name='product__product_code')
+    reason = django_filters.ChoiceFilter(choices=StockHistory.REASON_CHOICES)
+    # Local calendar days, both inclusive
+    start_date = django_filters.DateFilter(method='filter_start_date')
+    end_date = django_filters.DateFilter(method='filter_end_date')
+
+    class Meta:
+        model = StockHistory
+        fields = ['product', 'product_code', 'reason', 'start_date', 'end_date']
+
+    def filter_start_date(self, queryset, name, value):
+        return queryset.filter(timestamp__gte=local_midnight(value))
+
+    def filter_end_date(self, queryset, name, value):
+        return queryset.filter(timestamp__lt=local_midnight(value + timedelta(days=1)))
+
+
+def local_midnight(day):
+    return datetime.combine(day, time.min, timezone.get_current_timezone())
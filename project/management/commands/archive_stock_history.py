@@ -0,0 +1,58 @@
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from project import stock_archive
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f'Mês inválido: {value}. Use o formato AAAA-MM.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacta o histórico de estoque anterior ao horizonte em um resumo mensal por produto, '
+        'guardando as movimentações originais em arquivos compactados por mês. '
+        'Com --restore, devolve as movimentações arquivadas de um mês ao banco.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon-days', type=int, default=settings.STOCK_HISTORY_HORIZON_DAYS,
+            help='Meses inteiramente anteriores a este número de dias são compactados.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Apenas lista os meses que seriam compactados.')
+        parser.add_argument('--restore', action='append', metavar='AAAA-MM', type=parse_month, help='Restaura um mês arquivado (pode repetir).')
+        parser.add_argument('--list', action='store_true', help='Lista os meses arquivados.')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for month in stock_archive.archived_months():
+                self.stdout.write(f'{month:%Y-%m}  {stock_archive.archive_path(month)}')
+            return
+
+        if options['restore']:
+            for month in options['restore']:
+                if not os.path.exists(stock_archive.archive_path(month)):
+                    raise CommandError(f'Não há arquivo para {month:%Y-%m}.')
+                restored = stock_archive.restore_month(month)
+                self.stdout.write(self.style.SUCCESS(f'{month:%Y-%m}: {restored} movimentação(ões) restaurada(s).'))
+            return
+
+        months = stock_archive.months_to_compact(options['horizon_days'])
+        if not months:
+            self.stdout.write('Nada a compactar.')
+            return
+        for month in months:
+            if options['dry_run']:
+                self.stdout.write(f'{month:%Y-%m} seria compactado.')
+                continue
+            archived, summaries = stock_archive.compact_month(month)
+            self.stdout.write(self.style.SUCCESS(
+                f'{month:%Y-%m}: {archived} movimentação(ões) arquivada(s) em {summaries} resumo(s).'
+            ))
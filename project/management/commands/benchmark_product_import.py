@@ -0,0 +1,73 @@
+import csv
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from project.models import Supplier
+from project.resources import ProductResource, iter_dataset_chunks
+
+HEADERS = ['product_code', 'name', 'description', 'supplier__name', 'cost_price', 'recommended_price', 'negotiation_margin', 'stock', 'is_active']
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera um CSV de produtos sintéticos e o importa com o ProductResource duas vezes dentro de uma '
+        'transação (desfeita ao final): primeiro criando os produtos, depois alterando estoque e preço. '
+        'Mostra o tempo e as consultas por linha de cada etapa.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Número de produtos (padrão: 100.000).')
+        parser.add_argument('--suppliers', type=int, default=50, help='Fornecedores distintos; metade já existe antes da importação.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Linhas por bloco, como no import_records.')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            created_csv = self._write_csv(os.path.join(tmp_dir, 'produtos.csv'), rows, options['suppliers'], stock=100, price='10.00')
+            updated_csv = self._write_csv(os.path.join(tmp_dir, 'produtos_alterados.csv'), rows, options['suppliers'], stock=107, price='12.50')
+            with transaction.atomic():
+                Supplier.objects.bulk_create(Supplier(name=f'Bench Fornecedor {i}') for i in range(0, options['suppliers'], 2))
+                for label, path in (('Criação', created_csv), ('Atualização', updated_csv)):
+                    self._import(label, path, rows, options['chunk_size'])
+                transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS('Dados sintéticos descartados.'))
+
+    def _write_csv(self, path, rows, supplier_count, stock, price):
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(HEADERS)
+            for i in range(rows):
+                writer.writerow([
+                    f'BENCH-{i}', f'Bench {i}', '', f'Bench Fornecedor {i % supplier_count}',
+                    '5.00', price, '0.00', stock + i, '1',
+                ])
+        return path
+
+    def _import(self, label, path, rows, chunk_size):
+        resource = ProductResource()
+        statements = {}
+        errors = False
+
+        def count_statement(execute, sql, params, many, context):
+            statement = sql.split(' ', 1)[0]
+            statements[statement] = statements.get(statement, 0) + 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_statement):
+            started = time.perf_counter()
+            for chunk in iter_dataset_chunks(path, chunk_size):
+                result = resource.import_data(chunk, dry_run=False, use_transactions=False)
+                errors = errors or result.has_errors() or result.has_validation_errors()
+            elapsed = time.perf_counter() - started
+
+        if errors:
+            self.stderr.write(self.style.ERROR(f'{label}: a importação teve erros.'))
+        total = sum(statements.values())
+        self.stdout.write(f'{label}: {rows} linhas em {elapsed:.1f}s ({elapsed / rows * 1000:.2f} ms/linha)')
+        self.stdout.write(f'  {total} consultas ({total / rows:.2f} por linha)')
+        for statement, count in sorted(statements.items()):
+            self.stdout.write(f'    {statement}: {count}')
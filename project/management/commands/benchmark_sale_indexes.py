@@ -0,0 +1,84 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from project.models import Product, Sale, Vendor, local_day
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera vendas sintéticas dentro de uma transação (desfeita ao final) e compara o plano '
+        '(EXPLAIN QUERY PLAN) e o tempo dos filtros por data antigos e indexados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=1_000_000, help='Número de vendas sintéticas (padrão: 1.000.000).')
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--vendors', type=int, default=20)
+        parser.add_argument('--days', type=int, default=730, help='Intervalo, em dias, em que as vendas são distribuídas.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            vendor, start, end = self._seed(options)
+            self._compare('Todas as vendas (30 dias)', Sale.objects.all(), start, end)
+            self._compare('Vendas de um vendedor (30 dias)', Sale.objects.filter(vendor=vendor), start, end)
+            self._compare('Vendas Shopee (30 dias)', Sale.objects.filter(platform='shopee'), start, end)
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS('Dados sintéticos descartados.'))
+
+    def _seed(self, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        run_id = f'{rng.getrandbits(32):08x}'
+        vendors = Vendor.objects.bulk_create(
+            Vendor(name=f'Bench {run_id} {i}') for i in range(options['vendors'])
+        )
+        products = Product.objects.bulk_create(
+            Product(product_code=f'BENCH-{run_id}-{i}', name=f'Bench {i}', recommended_price=Decimal('10.00'))
+            for i in range(options['products'])
+        )
+        platforms = [choice for choice, _ in Sale.PLATFORM_CHOICES]
+        now = timezone.now()
+        seconds = options['days'] * 86400
+
+        def sales():
+            for _ in range(options['sales']):
+                sale_date = now - timedelta(seconds=rng.randrange(seconds))
+                yield Sale(
+                    product=rng.choice(products),
+                    vendor=rng.choice(vendors),
+                    quantity=1,
+                    total_price=Decimal('10.00'),
+                    platform=rng.choice(platforms),
+                    sale_date=sale_date,
+                    sale_day=local_day(sale_date),
+                )
+
+        # bulk_create skips save() and the signal chain, so sale_day is set above
+        Sale.objects.bulk_create(sales(), batch_size=5000)
+        self.stdout.write(f"{options['sales']} vendas geradas em {time.perf_counter() - started:.1f}s")
+
+        end = local_day(now)
+        return vendors[0], end - timedelta(days=29), end
+
+    def _compare(self, title, queryset, start, end):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        variants = [
+            ('sale_date__date__range (antigo)', queryset.filter(sale_date__date__range=[start, end])),
+            ('sale_day meio-aberto (indexado)', queryset.filter(sale_day__gte=start, sale_day__lt=end + timedelta(days=1))),
+        ]
+        for label, filtered in variants:
+            grouped = filtered.values('sale_day').annotate(total=Sum('total_price'), n=Count('id')).order_by()
+            started = time.perf_counter()
+            rows = len(list(grouped))
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(f'  {label}: {rows} dia(s) em {elapsed:.1f} ms')
+            for line in grouped.explain().splitlines():
+                self.stdout.write(f'    {line}')
@@ -0,0 +1,164 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from django.utils import timezone
+
+from dashboard.metrics import DashboardQuery
+from project import write_queue
+from project.models import Product, Sale, SalesDailyRollup, Vendor, local_day
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara os perfis de SQLite (SQLITE_PROFILES) com uma carga mista: threads lendo o dashboard '
+        'e threads registrando vendas ao mesmo tempo, cada operação como se fosse uma requisição. '
+        'Cada perfil roda em um banco temporário novo; o banco configurado não é tocado. '
+        'Com --write-queue, cada perfil roda também com as vendas passando pela fila de escrita.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', help='Perfis a comparar (padrão: todos).')
+        parser.add_argument('--seconds', type=float, default=10, help='Duração da carga em cada perfil.')
+        parser.add_argument('--readers', type=int, default=4, help='Threads lendo o dashboard.')
+        parser.add_argument('--writers', type=int, default=2, help='Threads registrando vendas.')
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--sales', type=int, default=50_000, help='Vendas geradas antes da carga.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--write-queue', action='store_true', help='Repete cada perfil com a fila de escrita (project.write_queue).')
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(settings.SQLITE_PROFILES)
+        unknown = set(profiles) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f'Perfil(is) desconhecido(s): {", ".join(sorted(unknown))}.')
+
+        original = connections.settings['default']
+        try:
+            for name in profiles:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    self._use_database(original, os.path.join(tmp_dir, 'bench.sqlite3'), settings.SQLITE_PROFILES[name])
+                    self._seed(options)
+                    self._report(f'Perfil {name}', self._run(options))
+                    if options['write_queue']:
+                        self._report(f'Perfil {name}, fila de escrita', self._run(options, use_queue=True))
+                    self._use_database(original)
+        finally:
+            connections.settings['default'] = original
+
+    def _use_database(self, original, path=None, profile=None):
+        # Threads build their connections from connections.settings, so swapping the
+        # entry (and dropping this thread's connection) points everything at `path`
+        connections['default'].close()
+        del connections['default']
+        if path is None:
+            connections.settings['default'] = original
+        else:
+            connections.settings['default'] = {
+                **original,
+                'NAME': path,
+                'CONN_MAX_AGE': profile['CONN_MAX_AGE'],
+                'OPTIONS': profile['OPTIONS'],
+                'PRAGMAS': profile['PRAGMAS'],
+            }
+
+    def _seed(self, options):
+        rng = random.Random(options['seed'])
+        call_command('migrate', verbosity=0, interactive=False)
+        vendors = Vendor.objects.bulk_create(Vendor(name=f'Bench {i}') for i in range(10))
+        products = Product.objects.bulk_create(
+            Product(product_code=f'BENCH-{i}', name=f'Bench {i}', recommended_price=Decimal('10.00'), stock=10 ** 6)
+            for i in range(options['products'])
+        )
+        platforms = [choice for choice, _ in Sale.PLATFORM_CHOICES]
+        now = timezone.now()
+
+        def sales():
+            for _ in range(options['sales']):
+                sale_date = now - timedelta(seconds=rng.randrange(30 * 86400))
+                yield Sale(
+                    product=rng.choice(products), vendor=rng.choice(vendors), quantity=1,
+                    total_price=Decimal('10.00'), platform=rng.choice(platforms),
+                    sale_date=sale_date, sale_day=local_day(sale_date),
+                )
+
+        # bulk_create skips the signal chain, so the rollup the dashboard reads is rebuilt after
+        Sale.objects.bulk_create(sales(), batch_size=5000)
+        SalesDailyRollup.rebuild()
+        connections['default'].close()
+
+    def _run(self, options, use_queue=False):
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        vendor_ids = list(Vendor.objects.values_list('pk', flat=True))
+        connections['default'].close()
+        deadline = time.perf_counter() + options['seconds']
+        results = {'read': [], 'write': [], 'errors': []}
+        lock = threading.Lock()
+
+        def read(rng):
+            DashboardQuery().run()
+
+        def write(rng):
+            # Registered the way POST /api/sales/ does, which loads the product while validating
+            sale = Sale(product=Product.objects.get(pk=rng.choice(product_ids)), vendor_id=rng.choice(vendor_ids), quantity=1, total_price=Decimal('10.00'))
+            if use_queue:
+                write_queue.writer.submit_batched(Sale.bulk_register, sale).result()
+            else:
+                sale.save()
+
+        def worker(kind, operation, seed):
+            rng = random.Random(seed)
+            latencies = []
+            errors = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    operation(rng)
+                    latencies.append(time.perf_counter() - started)
+                except OperationalError as exc:
+                    errors.append(f'{kind}: {exc}')
+                # End of the "request": closes the connection unless the profile keeps it
+                close_old_connections()
+            connections.close_all()
+            with lock:
+                results[kind].extend(latencies)
+                results['errors'].extend(errors)
+
+        threads = [threading.Thread(target=worker, args=('read', read, i)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write', write, 1000 + i)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        write_queue.writer.stop()
+        results['seconds'] = options['seconds']
+        return results
+
+    def _report(self, title, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for kind, label in (('read', 'Leituras do dashboard'), ('write', 'Vendas registradas')):
+            latencies = results[kind]
+            self.stdout.write(
+                f'  {label}: {len(latencies)} ({len(latencies) / results["seconds"]:.1f}/s), '
+                f'p50 {_percentile(latencies, 0.5) * 1000:.1f} ms, p95 {_percentile(latencies, 0.95) * 1000:.1f} ms'
+            )
+        errors = results['errors']
+        style = self.style.ERROR if errors else self.style.SUCCESS
+        self.stdout.write(style(f'  {len(errors)} operação(ões) falharam com o banco bloqueado.'))
+        for message in sorted(set(errors))[:5]:
+            self.stdout.write(f'    {message}')
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from project import thumbnails
+from project.models import ProductImage, Vendor
+
+TARGETS = ((ProductImage, 'image'), (Vendor, 'profile_image'))
+
+
+class Command(BaseCommand):
+    help = 'Gera as variantes WebP (miniaturas responsivas) das imagens de produtos e vendedores que ainda não as têm.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.THUMBNAIL_WORKERS, help='Número de threads gerando imagens em paralelo.')
+        parser.add_argument('--force', action='store_true', help='Regera também as variantes já existentes.')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, field_name in TARGETS:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for pk, name, variants in rows.values_list('pk', field_name, thumbnails.variants_field(field_name)).iterator():
+                if options['force'] or not variants or variants.get('source') != name:
+                    jobs.append((model, pk, field_name))
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            results = list(executor.map(
+                lambda job: thumbnails.build_variants_in_thread(*job, force=options['force']), jobs,
+            ))
+
+        generated = sum(results)
+        self.stdout.write(self.style.SUCCESS(f'{generated} imagem(ns) processada(s).'))
+        if generated < len(jobs):
+            self.stdout.write(self.style.WARNING(f'{len(jobs) - generated} imagem(ns) com falha; veja o log.'))
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from import_export.results import RowResult
+
+from project.resources import ProductResource, SaleResource, StockHistoryResource, iter_dataset_chunks
+
+RESOURCES = {
+    'products': ProductResource,
+    'sales': SaleResource,
+    'stock_history': StockHistoryResource,
+}
+MAX_LISTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa um arquivo CSV ou XLSX grande (produtos, vendas ou histórico de estoque) lendo-o em blocos, '
+        'cada bloco em sua própria transação, e mostra o progresso. Se um bloco tiver erros, a importação '
+        'para nele; os blocos anteriores ficam gravados e --start-row retoma do ponto de parada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(RESOURCES), help='O que importar.')
+        parser.add_argument('path', help='Arquivo .csv ou .xlsx com cabeçalho na primeira linha.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Linhas por bloco/transação.')
+        parser.add_argument('--start-row', type=int, default=1, help='Primeira linha de dados a importar (1 = logo após o cabeçalho).')
+        parser.add_argument('--dry-run', action='store_true', help='Valida tudo e desfaz cada bloco ao final.')
+
+    def handle(self, *args, **options):
+        resource = RESOURCES[options['resource']]()
+        offset = options['start_row'] - 1
+        totals = dict.fromkeys((RowResult.IMPORT_TYPE_NEW, RowResult.IMPORT_TYPE_SKIP), 0)
+        started = time.perf_counter()
+
+        try:
+            chunks = iter_dataset_chunks(options['path'], options['chunk_size'], skip_rows=offset)
+            for chunk in chunks:
+                result = resource.import_data(
+                    chunk, dry_run=options['dry_run'], use_transactions=True, rollback_on_validation_errors=True,
+                )
+                if result.has_errors() or result.has_validation_errors():
+                    self._report_errors(resource, result, offset)
+                    raise CommandError(
+                        f'Importação interrompida no bloco que começa na linha {offset + 1}; nada desse bloco foi gravado. '
+                        f'Corrija o arquivo e continue com --start-row {offset + 1}.'
+                    )
+                for import_type in totals:
+                    totals[import_type] += result.totals[import_type]
+                offset += len(chunk)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{offset} linha(s) processada(s) ({(offset - options["start_row"] + 1) / elapsed:.0f} linhas/s)')
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        verb = 'seriam importada(s)' if options['dry_run'] else 'importada(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f'{totals[RowResult.IMPORT_TYPE_NEW]} linha(s) {verb}, '
+            f'{totals[RowResult.IMPORT_TYPE_SKIP]} já existente(s) ignorada(s), em {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def _report_errors(self, resource, result, offset):
+        messages = [f'Erro: {error.error}' for error in result.base_errors]
+        for number, errors in result.row_errors():
+            messages.extend(f'Linha {offset + number}: {error.error}' for error in errors)
+        for invalid in result.invalid_rows:
+            for field, field_errors in invalid.error_dict.items():
+                # Name the file's column rather than the model field
+                column = resource.fields[field].column_name if field in resource.fields else field
+                messages.append(f'Linha {offset + invalid.number}: {column}: {"; ".join(field_errors)}')
+        for message in messages[:MAX_LISTED_ERRORS]:
+            self.stderr.write(message)
+        if len(messages) > MAX_LISTED_ERRORS:
+            self.stderr.write(f'... e mais {len(messages) - MAX_LISTED_ERRORS} erro(s).')
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from project.models import SalesDailyRollup
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Data inválida: {value}. Use o formato AAAA-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o resumo diário de vendas (SalesDailyRollup) a partir das vendas registradas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='Primeiro dia a recalcular (AAAA-MM-DD). Padrão: desde a primeira venda.')
+        parser.add_argument('--end-date', help='Último dia a recalcular (AAAA-MM-DD). Padrão: até a última venda.')
+
+    def handle(self, *args, **options):
+        start_date = parse_date(options['start_date']) if options['start_date'] else None
+        end_date = parse_date(options['end_date']) if options['end_date'] else None
+        if start_date and end_date and start_date > end_date:
+            raise CommandError('A data de início deve ser anterior ou igual à data de fim.')
+
+        written = SalesDailyRollup.rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f'{written} resumo(s) diário(s) recalculado(s).'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from project.models import Product, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os fechamentos diários de estoque (StockSnapshot) a partir dos saldos do histórico de estoque.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', action='append', dest='products', metavar='CODIGO', help='Código do produto a recalcular (pode repetir). Padrão: todos.')
+
+    def handle(self, *args, **options):
+        product_ids = None
+        if options['products']:
+            found = dict(Product.objects.filter(product_code__in=options['products']).values_list('product_code', 'pk'))
+            missing = sorted(set(options['products']) - set(found))
+            if missing:
+                raise CommandError(f'Produto(s) não encontrado(s): {", ".join(missing)}')
+            product_ids = list(found.values())
+
+        written = StockSnapshot.rebuild(product_ids)
+        self.stdout.write(self.style.SUCCESS(f'{written} fechamento(s) de estoque recalculado(s).'))
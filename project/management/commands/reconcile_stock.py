@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from project.models import Product, StockHistory, StockSnapshot, local_day, products_bulk_changed
+
+MAX_LISTED = 50
+
+
+def chunk_bounds(chunk_size):
+    """
+    (low, high) primary key ranges of `chunk_size` products each, in key order;
+    low is exclusive (None for the first chunk). Only the keys are streamed.
+    """
+    bounds = []
+    low = None
+    for position, pk in enumerate(Product.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)):
+        if position % chunk_size == chunk_size - 1:
+            bounds.append((low, pk))
+            low = pk
+    bounds.append((low, None))
+    return bounds
+
+
+def _in_range(queryset, field, low, high):
+    if low is not None:
+        queryset = queryset.filter(**{f'{field}__gt': low})
+    if high is not None:
+        queryset = queryset.filter(**{f'{field}__lte': high})
+    return queryset
+
+
+def ledger_drifts(products):
+    """
+    Returns (products checked, drifts), where drifts lists (product_id, product_code, stock, ledger_sum)
+    for the products whose stock differs from the sum of their ledger. One query, so a sale
+    landing meanwhile is seen in both the stock and the ledger or in neither.
+    """
+    ledger_sum = StockHistory.objects.filter(product=OuterRef('pk')).order_by() \
+        .values('product').annotate(total=Sum('change')).values('total')
+    rows = products.order_by('pk').annotate(ledger_sum=Coalesce(Subquery(ledger_sum), 0)) \
+        .values_list('pk', 'product_code', 'stock', 'ledger_sum')
+    checked = 0
+    drifts = []
+    for pk, code, stock, total in rows:
+        checked += 1
+        if stock != total:
+            drifts.append((pk, code, stock, total))
+    return checked, drifts
+
+
+def check_chunk(bounds):
+    low, high = bounds
+    return ledger_drifts(_in_range(Product.objects.all(), 'pk', low, high))
+
+
+def _close_connections():
+    # Forked workers must not share the parent's database handles
+    connections.close_all()
+
+
+def pool_context():
+    """
+    The fork context: workers inherit the configured apps, whereas spawned ones (the default
+    on macOS and Windows) would start without Django set up. None where fork is unavailable.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Confere se o estoque de cada produto é igual à soma do seu histórico de estoque, '
+        'processando os produtos em blocos em paralelo. Com --fix, registra um ajuste manual '
+        'no histórico de cada produto divergente para igualá-lo ao estoque atual.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processos em paralelo (1, ou sistemas sem fork como o Windows, roda no próprio processo).')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Produtos por bloco.')
+        parser.add_argument('--fix', action='store_true', help='Registra ajustes manuais corrigindo o histórico.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        bounds = chunk_bounds(options['chunk_size'])
+        checked = 0
+        drifts = []
+
+        context = pool_context() if options['workers'] > 1 else None
+        if context is not None:
+            _close_connections()
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context, initializer=_close_connections) as executor:
+                results = executor.map(check_chunk, bounds)
+                for count, chunk_drifts in results:
+                    checked += count
+                    drifts.extend(chunk_drifts)
+        else:
+            for chunk in bounds:
+                count, chunk_drifts = check_chunk(chunk)
+                checked += count
+                drifts.extend(chunk_drifts)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{checked} produto(s) conferido(s) em {len(bounds)} bloco(s), {elapsed:.1f}s.')
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS('Nenhuma divergência encontrada.'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'{len(drifts)} produto(s) com divergência:'))
+        for pk, code, stock, ledger_sum in drifts[:MAX_LISTED]:
+            self.stdout.write(f'  {code}: estoque {stock}, histórico {ledger_sum} (diferença {stock - ledger_sum:+d})')
+        if len(drifts) > MAX_LISTED:
+            self.stdout.write(f'  ... e mais {len(drifts) - MAX_LISTED}.')
+
+        if options['fix']:
+            fixed = self._fix([pk for pk, *_ in drifts])
+            self.stdout.write(self.style.SUCCESS(f'{fixed} ajuste(s) manual(is) registrado(s).'))
+
+    def _fix(self, product_ids):
+        fixed = 0
+        today = local_day(timezone.now())
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            with transaction.atomic():
+                # Check again: sales may have moved stock and ledger together meanwhile
+                checked, drifts = ledger_drifts(Product.objects.select_for_update().filter(pk__in=batch))
+                StockHistory.objects.bulk_create(
+                    StockHistory(product_id=pk, change=stock - ledger_sum, reason='manual_adjustment', balance=stock)
+                    for pk, code, stock, ledger_sum in drifts
+                )
+                StockSnapshot.record_many({(pk, today): stock for pk, code, stock, ledger_sum in drifts})
+                products_bulk_changed.send(sender=StockHistory, product_ids=[pk for pk, *_ in drifts])
+            fixed += len(drifts)
+        return fixed
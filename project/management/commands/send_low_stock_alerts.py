@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from project.utils import send_low_stock_digest
+
+
+class Command(BaseCommand):
+    help = (
+        'Envia os alertas de estoque baixo pendentes em um único e-mail de resumo. '
+        'Com --loop, continua rodando e envia um resumo a cada intervalo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Roda continuamente em vez de enviar uma única vez.')
+        parser.add_argument(
+            '--interval', type=int, default=settings.LOW_STOCK_DIGEST_INTERVAL,
+            help='Segundos entre dois resumos no modo --loop.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent = send_low_stock_digest()
+            except Exception as exc:
+                if not options['loop']:
+                    raise
+                # Alerts stay pending and go out with the next digest
+                self.stderr.write(f'Falha ao enviar o resumo: {exc}')
+            else:
+                if sent:
+                    self.stdout.write(self.style.SUCCESS(f'Resumo enviado com {sent} produto(s).'))
+                elif not options['loop']:
+                    self.stdout.write('Nenhum alerta pendente.')
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:32
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    Sale = apps.get_model('project', 'Sale')
+    SalesDailyRollup = apps.get_model('project', 'SalesDailyRollup')
+    rows = Sale.objects.annotate(day=TruncDate('sale_date')) \
+        .values('day', 'product_id', 'vendor_id', 'product__supplier_id', 'platform') \
+        .annotate(revenue=Sum('total_price'), quantity=Sum('quantity'), sale_count=Count('id')) \
+        .order_by()
+    SalesDailyRollup.objects.bulk_create(
+        (
+            SalesDailyRollup(
+                day=row['day'],
+                product_id=row['product_id'],
+                vendor_id=row['vendor_id'],
+                supplier_id=row['product__supplier_id'],
+                platform=row['platform'],
+                revenue=row['revenue'],
+                quantity=row['quantity'],
+                sale_count=row['sale_count'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0005_stockhistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Dia')),
+                ('platform', models.CharField(choices=[('loja_fisica', 'Loja Física'), ('shopee', 'Shopee'), ('outros', 'Outros')], max_length=20, verbose_name='Plataforma de Venda')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Receita')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Quantidade')),
+                ('sale_count', models.IntegerField(default=0, verbose_name='Número de Vendas')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='project.product')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_rollups', to='project.supplier')),
+                ('vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_rollups', to='project.vendor')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Vendas',
+                'verbose_name_plural': 'Resumos Diários de Vendas',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day', 'vendor', 'product', 'supplier', 'platform'], name='rollup_day_key_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_sale_day(apps, schema_editor):
+    Sale = apps.get_model('project', 'Sale')
+    # TruncDate converts to the active (project) time zone, matching Sale.save()
+    Sale.objects.update(sale_day=TruncDate('sale_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0006_salesdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='sale_day',
+            field=models.DateField(editable=False, null=True, verbose_name='Dia da Venda'),
+        ),
+        migrations.RunPython(backfill_sale_day, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='sale',
+            name='sale_day',
+            field=models.DateField(db_index=True, editable=False, verbose_name='Dia da Venda'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['vendor', 'sale_day'], name='sale_vendor_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['product', 'sale_day'], name='sale_product_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['platform', 'sale_day'], name='sale_platform_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['product', 'timestamp'], name='stockhistory_product_ts_idx'),
+        ),
+    ]
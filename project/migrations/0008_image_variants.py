@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0007_sale_sale_day_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='variantes da imagem'),
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='profile_image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='variantes da imagem de perfil'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Estoque no Último Alerta')),
+                ('event_count', models.PositiveIntegerField(default=1, verbose_name='Ocorrências')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Criado em')),
+                ('sent_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Enviado em')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='project.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Alerta de Estoque Baixo',
+                'verbose_name_plural': 'Alertas de Estoque Baixo',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
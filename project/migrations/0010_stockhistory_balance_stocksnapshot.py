@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_balances(apps, schema_editor):
+    """
+    Walks each product's ledger backwards from its current stock, so the latest
+    balance always matches Product.stock, and records the closing stock per day.
+    """
+    Product = apps.get_model('project', 'Product')
+    StockHistory = apps.get_model('project', 'StockHistory')
+    StockSnapshot = apps.get_model('project', 'StockSnapshot')
+
+    for product_id, stock in Product.objects.values_list('pk', 'stock').iterator():
+        balance = stock
+        rows = []
+        closing = {}
+        for row in StockHistory.objects.filter(product_id=product_id).order_by('-timestamp', '-id').only('id', 'change', 'timestamp'):
+            row.balance = balance
+            rows.append(row)
+            closing.setdefault(timezone.localdate(row.timestamp), balance)
+            balance -= row.change
+        StockHistory.objects.bulk_update(rows, ['balance'], batch_size=500)
+        StockSnapshot.objects.bulk_create(
+            [StockSnapshot(product_id=product_id, day=day, balance=value) for day, value in closing.items()],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0009_lowstockalert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockhistory',
+            name='balance',
+            field=models.IntegerField(editable=False, null=True, verbose_name='Saldo'),
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Dia')),
+                ('balance', models.IntegerField(verbose_name='Estoque no Fim do Dia')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='project.product')),
+            ],
+            options={
+                'verbose_name': 'Fechamento de Estoque',
+                'verbose_name_plural': 'Fechamentos de Estoque',
+                'ordering': ['-day'],
+                'unique_together': {('product', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='balance',
+            field=models.IntegerField(editable=False, verbose_name='Saldo'),
+        ),
+    ]
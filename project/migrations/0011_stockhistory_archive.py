@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0010_stockhistory_balance_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='reason',
+            field=models.CharField(choices=[('new_stock', 'Novo Estoque'), ('sale', 'Venda'), ('manual_adjustment', 'Ajuste Manual'), ('initial_stock', 'Estoque Inicial'), ('monthly_summary', 'Resumo Mensal (arquivado)')], max_length=20, verbose_name='Motivo'),
+        ),
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_sale_supplier(apps, schema_editor):
+    Sale = apps.get_model('project', 'Sale')
+    Product = apps.get_model('project', 'Product')
+    # Earlier sales only know their product's current supplier, which is what the rollup used
+    Sale.objects.update(supplier_id=models.Subquery(Product.objects.filter(pk=models.OuterRef('product_id')).values('supplier_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0013_updated_at_for_conditional_get'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='supplier',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='project.supplier', verbose_name='Fornecedor'),
+        ),
+        migrations.RunPython(backfill_sale_supplier, migrations.RunPython.noop),
+    ]
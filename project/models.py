@@ -1,11 +1,16 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator, MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from decimal import Decimal, ROUND_HALF_UP
+from datetime import timedelta
+from decimal import Decimal
+import time
 import uuid
 
+from . import pricing, thumbnails
+
 
 def product_image_upload_to(instance, filename):
     product_id = instance.product.id if instance and instance.product_id else 'unassigned'
@@ -21,12 +26,20 @@ def vendor_profile_image_upload_to(instance, filename):
     return f'vendors/{instance.id}/profile_image/{uuid.uuid4()}_{filename}'
 
 
+def local_day(value):
+    """Calendar day of a datetime in the project's TIME_ZONE."""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localdate(value)
+
+
 class Supplier(models.Model):
     name = models.CharField('nome', max_length=200)
     contact_email = models.EmailField('e-mail', blank=True, null=True)
     contact_phone = models.CharField('telefone', max_length=30, blank=True)
     document = models.CharField('documento (CNPJ/CPF)', max_length=40, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Fornecedor'
@@ -41,7 +54,10 @@ class Vendor(models.Model):
     name = models.CharField('nome', max_length=200)
     phone = models.CharField('telefone', max_length=30, blank=True)
     profile_image = models.ImageField('imagem de perfil', upload_to=vendor_profile_image_upload_to, blank=True, null=True, validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])])
+    # WebP sizes of profile_image, built in the background (see project.thumbnails)
+    profile_image_variants = models.JSONField('variantes da imagem de perfil', default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Vendedor'
@@ -60,6 +76,9 @@ class PlatformFeeConfig(models.Model):
     highlight_active = models.BooleanField('Campanha Destaque Ativa?', default=True)
     highlight_fee = models.DecimalField('Taxa Campanha Destaque (%)', max_digits=5, decimal_places=2, default=Decimal('3.00'))
 
+    # Shared version stamp, bumped whenever the configuration is saved or deleted
+    VERSION_CACHE_KEY = 'project:platform_fee_config:version'
+
     class Meta:
         verbose_name = 'Configuração de Taxas'
         verbose_name_plural = 'Configurações de Taxas'
@@ -67,8 +86,93 @@ class PlatformFeeConfig(models.Model):
     def __str__(self):
         return 'Configuração Padrão de Taxas'
 
+    @classmethod
+    def current_version(cls):
+        version = cache.get(cls.VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(cls.VERSION_CACHE_KEY, time.time_ns(), None)
+            version = cache.get(cls.VERSION_CACHE_KEY)
+        return version
+
+    @classmethod
+    def bump_version(cls):
+        cache.set(cls.VERSION_CACHE_KEY, time.time_ns(), None)
+
+    @classmethod
+    def current(cls):
+        """
+        The active configuration (or None), reused across calls in this process
+        until a save/delete bumps the version stamp or PLATFORM_FEE_CONFIG_TTL
+        seconds pass. The stamp only reaches other processes through a shared
+        cache; the TTL bounds how long they price with an old configuration.
+        """
+        global _current_fee_config
+        version = cls.current_version()
+        cached_version, loaded_at, config = _current_fee_config
+        if cached_version != version or time.monotonic() - loaded_at > settings.PLATFORM_FEE_CONFIG_TTL:
+            config = cls.objects.first()
+            _current_fee_config = (version, time.monotonic(), config)
+        return config
+
+
+# (version, time.monotonic() when loaded, PlatformFeeConfig or None) kept by PlatformFeeConfig.current()
+_current_fee_config = (None, 0.0, None)
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers the field values a row was loaded (or last saved) with, so changes can
+    be detected without re-reading the row. A plain save() of a loaded instance
+    writes only the changed columns; pass update_fields to override.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _field_value(self, field):
+        value = getattr(self, field.attname)
+        # FieldFile objects are updated in place when a file is saved; keep the name
+        return value.name if isinstance(value, models.fields.files.FieldFile) else value
+
+    def _remember_values(self, fields=None):
+        deferred = self.get_deferred_fields()
+        loaded = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if field.attname not in deferred and (fields is None or field.name in fields or field.attname in fields):
+                loaded[field.attname] = self._field_value(field)
+        self._loaded_values = loaded
+
+    def loaded_value(self, field_name, default=None):
+        """Value of `field_name` when the row was loaded or last saved."""
+        return getattr(self, '_loaded_values', {}).get(self._meta.get_field(field_name).attname, default)
+
+    def get_dirty_fields(self):
+        """Names of the loaded fields whose value changed since then."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return [field.name for field in self._meta.concrete_fields]
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and loaded[field.attname] != self._field_value(field)
+        ]
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not self._state.adding and hasattr(self, '_loaded_values') and not args:
+            # auto_now fields are always written, which also keeps an unchanged save from being a no-op
+            auto_now = [field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)]
+            kwargs['update_fields'] = {*self.get_dirty_fields(), *auto_now} - {self._meta.pk.name}
+        super().save(*args, **kwargs)
+        self._remember_values(kwargs.get('update_fields'))
 
-class Product(models.Model):
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self._remember_values(fields)
+
+
+class Product(TrackedFieldsMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product_code = models.CharField('código do produto', max_length=60, unique=True)
     name = models.CharField('nome', max_length=255)
@@ -91,6 +195,10 @@ class Product(models.Model):
         verbose_name = 'Produto'
         verbose_name_plural = 'Produtos'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of /api/products/
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product_code} — {self.name}"
@@ -102,32 +210,44 @@ class Product(models.Model):
             if self.video_file.size > max_mb * 1024 * 1024:
                 raise ValidationError({'video_file': f'Vídeo muito grande. Máximo {max_mb} MB.'})
 
+    def save(self, *args, **kwargs):
+        # The stock signals write the ledger; it commits or rolls back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def remove_stock(self, quantity):
+        """
+        Takes `quantity` units out with a single UPDATE ... SET stock = stock - n, so
+        concurrent sales never overwrite each other, then reloads self.stock.
+        Raises ValidationError, changing nothing, if settings.ALLOW_NEGATIVE_STOCK
+        is off and there are not enough units.
+        """
+        products = Product.objects.filter(pk=self.pk)
+        if not settings.ALLOW_NEGATIVE_STOCK:
+            products = products.filter(stock__gte=quantity)
+        # update() skips auto_now; updated_at is what the API's ETags are built from
+        if not products.update(stock=models.F('stock') - quantity, updated_at=timezone.now()):
+            self.refresh_from_db(fields=['stock'])
+            raise ValidationError({'quantity': f'Estoque insuficiente: {self.name} tem {self.stock} unidade(s).'})
+        self.refresh_from_db(fields=['stock'])
+
     @property
     def min_price_allowed(self):
-        if self.recommended_price is None:
-            return None
-        margin_fraction = (self.negotiation_margin / Decimal('100'))
-        min_price = (self.recommended_price * (Decimal('1.00') - margin_fraction)).quantize(Decimal('.01'), rounding=ROUND_HALF_UP)
-        return min_price
+        return pricing.min_price_allowed(self.recommended_price, self.negotiation_margin)
 
     @property
     def vf_fisica(self):
-        config = PlatformFeeConfig.objects.first()
+        config = PlatformFeeConfig.current()
         if not config:
             return None
-        custo_total = self.cost_price + config.cost_fixed
-        vf_fisica = custo_total * (1 + config.physical_margin / 100)
-        return vf_fisica.quantize(Decimal('0.01'))
+        return pricing.FeeFactors(config).vf_fisica(self.cost_price)
 
     @property
     def vf_shopee(self):
-        config = PlatformFeeConfig.objects.first()
+        config = PlatformFeeConfig.current()
         if not config:
             return None
-        custo_total = self.cost_price + config.cost_fixed
-        taxa_total = config.shopee_commission + config.free_shipping_fee + (config.highlight_fee if config.highlight_active else Decimal('0.00'))
-        vf_shopee = (custo_total + config.fixed_fee) * (1 + taxa_total / 100)
-        return vf_shopee.quantize(Decimal('0.01'))
+        return pricing.FeeFactors(config).vf_shopee(self.cost_price)
 
     def images_count(self):
         return self.images.count()
@@ -136,9 +256,12 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField('imagem', upload_to=product_image_upload_to, validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])])
+    # WebP sizes of image, built in the background (see project.thumbnails)
+    image_variants = models.JSONField('variantes da imagem', default=dict, blank=True, editable=False)
     alt_text = models.CharField('texto alternativo', max_length=255, blank=True)
     position = models.PositiveSmallIntegerField('posição', default=0)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Imagem do produto'
@@ -165,8 +288,8 @@ class ProductImage(models.Model):
         super().save(*args, **kwargs)
 
 
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import Signal, receiver
 
 @receiver(pre_save, sender=ProductImage)
 def ensure_image_position(sender, instance, **kwargs):
@@ -183,6 +306,16 @@ def ensure_image_position(sender, instance, **kwargs):
                     break
 
 
+@receiver(post_save, sender=ProductImage)
+def schedule_product_image_variants(sender, instance, **kwargs):
+    thumbnails.schedule_variants(instance, 'image')
+
+
+@receiver(post_save, sender=Vendor)
+def schedule_vendor_image_variants(sender, instance, **kwargs):
+    thumbnails.schedule_variants(instance, 'profile_image')
+
+
 class Sale(models.Model):
     PLATFORM_CHOICES = [
         ('loja_fisica', 'Loja Física'),
@@ -192,19 +325,109 @@ class Sale(models.Model):
 
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales', verbose_name='Produto')
     vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales', verbose_name='Vendedor')
+    # The product's supplier when it was sold; supplier rollups stay with it if the product changes supplier
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='sales', verbose_name='Fornecedor')
     quantity = models.PositiveIntegerField('Quantidade Vendida', default=1, validators=[MinValueValidator(1)])
     total_price = models.DecimalField('Preço Total da Venda', max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     platform = models.CharField('Plataforma de Venda', max_length=20, choices=PLATFORM_CHOICES, default='loja_fisica')
     sale_date = models.DateTimeField('Data da Venda', default=timezone.now)
+    # Local calendar day of sale_date, stored so date filters can use an index
+    sale_day = models.DateField('Dia da Venda', editable=False, db_index=True)
 
     class Meta:
         verbose_name = 'Venda'
         verbose_name_plural = 'Vendas'
         ordering = ['-sale_date']
+        indexes = [
+            models.Index(fields=['vendor', 'sale_day'], name='sale_vendor_day_idx'),
+            models.Index(fields=['product', 'sale_day'], name='sale_product_day_idx'),
+            models.Index(fields=['platform', 'sale_day'], name='sale_platform_day_idx'),
+            # Keyset pagination of /api/sales/
+            models.Index(fields=['sale_date', 'id'], name='sale_date_id_idx'),
+        ]
 
     def __str__(self):
         return f'Venda de {self.quantity}x {self.product.name} em {self.sale_date.strftime("%d/%m/%Y")}'
 
+    def clean(self):
+        super().clean()
+        if self._state.adding and self.product_id and self.quantity and not settings.ALLOW_NEGATIVE_STOCK:
+            if self.product.stock < self.quantity:
+                raise ValidationError({'quantity': f'Estoque insuficiente: {self.product.name} tem {self.product.stock} unidade(s).'})
+
+    def save(self, *args, **kwargs):
+        self.sale_day = local_day(self.sale_date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'sale_date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'sale_day'}
+        if update_fields is not None and 'product' in update_fields:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'supplier'}
+        # The post_save signals (stock, ledger, rollup) commit or roll back with the sale
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_register(cls, sales):
+        """
+        Saves many new, unsaved sales in one transaction without the per-sale signal
+        chain: bulk inserts for the sales and their StockHistory rows, one stock
+        UPDATE per product, one rollup pass and one low-stock check per product.
+        Each sale needs its `product` loaded (for its supplier).
+        Raises ValidationError keyed by position in `sales` when
+        settings.ALLOW_NEGATIVE_STOCK is off and a product runs out.
+        Returns the created sales.
+        """
+        quantities = {}
+        rollup = {}
+        for sale in sales:
+            sale.sale_day = local_day(sale.sale_date)
+            sale.supplier_id = sale.product.supplier_id
+            quantities[sale.product_id] = quantities.get(sale.product_id, 0) + sale.quantity
+            key = (sale.sale_day, sale.product_id, sale.vendor_id, sale.supplier_id, sale.platform)
+            revenue, quantity, sale_count = rollup.get(key, (Decimal('0.00'), 0, 0))
+            rollup[key] = (revenue + sale.total_price, quantity + sale.quantity, sale_count + 1)
+
+        with transaction.atomic():
+            created = cls.objects.bulk_create(sales, batch_size=1000)
+            # Read after the first write: the transaction now holds the write lock, so these
+            # stocks are the ones the UPDATEs below start from
+            stock = dict(Product.objects.select_for_update().filter(pk__in=quantities).values_list('pk', 'stock'))
+            if not settings.ALLOW_NEGATIVE_STOCK:
+                available = dict(stock)
+                errors = {}
+                for index, sale in enumerate(sales):
+                    if available[sale.product_id] < sale.quantity:
+                        errors[index] = [f'Estoque insuficiente: {sale.product.name} tem {available[sale.product_id]} unidade(s).']
+                    else:
+                        available[sale.product_id] -= sale.quantity
+                if errors:
+                    raise ValidationError(errors)
+
+            history = []
+            for sale in created:
+                stock[sale.product_id] -= sale.quantity
+                history.append(StockHistory(product_id=sale.product_id, change=-sale.quantity, reason='sale', balance=stock[sale.product_id]))
+            StockHistory.objects.bulk_create(history, batch_size=1000)
+            today = local_day(timezone.now())
+            StockSnapshot.record_many({(product_id, today): balance for product_id, balance in stock.items()})
+            # One UPDATE per distinct quantity rather than per product
+            by_quantity = {}
+            for product_id, quantity in quantities.items():
+                by_quantity.setdefault(quantity, []).append(product_id)
+            for quantity, product_ids in by_quantity.items():
+                products = Product.objects.filter(pk__in=product_ids)
+                if not settings.ALLOW_NEGATIVE_STOCK:
+                    products = products.filter(stock__gte=quantity)
+                if products.update(stock=models.F('stock') - quantity, updated_at=timezone.now()) != len(product_ids):
+                    # Another sale took the units after the check above
+                    raise ValidationError('O estoque mudou durante a importação. Tente novamente.')
+            SalesDailyRollup.apply_many(rollup)
+            for product in Product.objects.filter(pk__in=quantities, stock__lt=settings.LOW_STOCK_THRESHOLD):
+                LowStockAlert.record(product)
+
+        sales_bulk_registered.send(sender=cls, sales=created)
+        return created
+
 
 class StockHistory(models.Model):
     REASON_CHOICES = [
@@ -212,60 +435,390 @@ class StockHistory(models.Model):
         ('sale', 'Venda'),
         ('manual_adjustment', 'Ajuste Manual'),
         ('initial_stock', 'Estoque Inicial'),
+        ('monthly_summary', 'Resumo Mensal (arquivado)'),
     ]
 
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_history')
     change = models.IntegerField('Alteração no Estoque')
     reason = models.CharField('Motivo', max_length=20, choices=REASON_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Product stock right after this change, written in the same transaction
+    balance = models.IntegerField('Saldo', editable=False)
+    # Not auto_now_add: archived rows and monthly summaries keep their original time
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         verbose_name = 'Histórico de Estoque'
         verbose_name_plural = 'Históricos de Estoque'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['product', 'timestamp'], name='stockhistory_product_ts_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product.name}: {self.change} em {self.timestamp.strftime("%d/%m/%Y")}'
 
+    def save(self, *args, **kwargs):
+        if self.balance is None:
+            # The stock code paths pass the balance; anything else records the stored stock
+            self.balance = Product.objects.values_list('stock', flat=True).get(pk=self.product_id)
+        super().save(*args, **kwargs)
+
+
+class StockSnapshot(models.Model):
+    """
+    Closing stock of a product on each local day it moved, upserted with every
+    StockHistory row and rebuilt with `rebuild_stock_snapshots`. The stock on any day
+    is the latest snapshot up to that day: one index seek instead of summing the ledger.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    day = models.DateField('Dia')
+    balance = models.IntegerField('Estoque no Fim do Dia')
+
+    class Meta:
+        verbose_name = 'Fechamento de Estoque'
+        verbose_name_plural = 'Fechamentos de Estoque'
+        ordering = ['-day']
+        unique_together = (('product', 'day'),)
+
+    def __str__(self):
+        return f'{self.product.name}: {self.balance} em {self.day.strftime("%d/%m/%Y")}'
+
+    @classmethod
+    def record_many(cls, balances):
+        """Upserts {(product_id, day): balance} in one statement per batch."""
+        cls.objects.bulk_create(
+            [cls(product_id=product_id, day=day, balance=balance) for (product_id, day), balance in balances.items()],
+            update_conflicts=True, unique_fields=['product', 'day'], update_fields=['balance'], batch_size=500,
+        )
+
+    @classmethod
+    def as_of(cls, product_ids, day):
+        """{product_id: closing stock on `day`}, 0 before a product's first movement."""
+        from django.db.models.functions import Coalesce
+
+        latest = cls.objects.filter(product=models.OuterRef('pk'), day__lte=day).order_by('-day').values('balance')[:1]
+        products = Product.objects.filter(pk__in=product_ids).annotate(closing=Coalesce(models.Subquery(latest), 0))
+        return dict(products.values_list('pk', 'closing'))
+
+    @classmethod
+    def series(cls, product_ids, start, end):
+        """{product_id: [(day, closing stock), ...]} for every day from start to end (inclusive)."""
+        balances = cls.as_of(product_ids, start - timedelta(days=1))
+        moves = dict(
+            ((product_id, day), balance)
+            for product_id, day, balance in cls.objects.filter(product_id__in=balances, day__range=(start, end))
+            .values_list('product_id', 'day', 'balance')
+        )
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        series = {}
+        for product_id, balance in balances.items():
+            points = []
+            for day in days:
+                balance = moves.get((product_id, day), balance)
+                points.append((day, balance))
+            series[product_id] = points
+        return series
+
+    @classmethod
+    def rebuild(cls, product_ids=None):
+        """
+        Recomputes the snapshots (of the given products, or all) from the ledger
+        balances. Returns the number of snapshots written.
+        """
+        snapshots = cls.objects.all()
+        history = StockHistory.objects.order_by('product_id', 'timestamp', 'id')
+        if product_ids is not None:
+            snapshots = snapshots.filter(product_id__in=product_ids)
+            history = history.filter(product_id__in=product_ids)
+
+        closing = {}
+        for product_id, timestamp, balance in history.values_list('product_id', 'timestamp', 'balance').iterator(chunk_size=5000):
+            closing[(product_id, local_day(timestamp))] = balance
+        with transaction.atomic():
+            snapshots.delete()
+            cls.record_many(closing)
+        return len(closing)
+
+
+class SalesDailyRollup(models.Model):
+    """
+    Pre-aggregated sales per local day, vendor, product, supplier and platform.
+    Kept current by the Sale signals below and rebuilt with `rebuild_sales_rollup`.
+    """
+    day = models.DateField('Dia')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales_rollups')
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales_rollups')
+    platform = models.CharField('Plataforma de Venda', max_length=20, choices=Sale.PLATFORM_CHOICES)
+    revenue = models.DecimalField('Receita', max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    quantity = models.IntegerField('Quantidade', default=0)
+    sale_count = models.IntegerField('Número de Vendas', default=0)
+
+    class Meta:
+        verbose_name = 'Resumo Diário de Vendas'
+        verbose_name_plural = 'Resumos Diários de Vendas'
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['day', 'vendor', 'product', 'supplier', 'platform'], name='rollup_day_key_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.day.strftime("%d/%m/%Y")}: {self.sale_count} venda(s)'
+
+    @classmethod
+    def apply(cls, day, product_id, vendor_id, supplier_id, platform, revenue, quantity, sale_count):
+        """
+        Adds the given deltas to one row of the matching bucket, creating it for positive
+        deltas. Racing inserts can leave a bucket with two rows; readers always Sum() over
+        rows, so changing just one of them keeps the totals right.
+        """
+        key = dict(day=day, product_id=product_id, vendor_id=vendor_id, supplier_id=supplier_id, platform=platform)
+        row = cls.objects.filter(**key).values_list('pk', flat=True)[:1]
+        updated = cls.objects.filter(pk__in=models.Subquery(row)).update(
+            revenue=models.F('revenue') + revenue,
+            quantity=models.F('quantity') + quantity,
+            sale_count=models.F('sale_count') + sale_count,
+        )
+        if not updated and sale_count > 0:
+            cls.objects.create(revenue=revenue, quantity=quantity, sale_count=sale_count, **key)
+
+    @classmethod
+    def apply_sale(cls, sale, sign=1):
+        cls.apply(
+            day=local_day(sale.sale_date),
+            product_id=sale.product_id,
+            vendor_id=sale.vendor_id,
+            supplier_id=sale.supplier_id,
+            platform=sale.platform,
+            revenue=sign * sale.total_price,
+            quantity=sign * sale.quantity,
+            sale_count=sign,
+        )
+
+    @classmethod
+    def apply_many(cls, deltas):
+        """
+        apply() for many buckets: one read per day plus bulk writes. `deltas` maps
+        (day, product_id, vendor_id, supplier_id, platform) to (revenue, quantity, sale_count).
+        Call it inside a transaction.
+        """
+        existing = {}
+        products_by_day = {}
+        for day, product_id, vendor_id, supplier_id, platform in deltas:
+            products_by_day.setdefault(day, set()).add(product_id)
+        for day, product_ids in products_by_day.items():
+            # Per day: filtering on all the days at once would read every bucket of those days
+            for bucket in cls.objects.select_for_update().filter(day=day, product_id__in=product_ids):
+                existing.setdefault((bucket.day, bucket.product_id, bucket.vendor_id, bucket.supplier_id, bucket.platform), bucket)
+
+        to_update, to_create = [], []
+        for key, (revenue, quantity, sale_count) in deltas.items():
+            bucket = existing.get(key)
+            if bucket is not None:
+                bucket.revenue += revenue
+                bucket.quantity += quantity
+                bucket.sale_count += sale_count
+                to_update.append(bucket)
+            elif sale_count > 0:
+                day, product_id, vendor_id, supplier_id, platform = key
+                to_create.append(cls(
+                    day=day, product_id=product_id, vendor_id=vendor_id, supplier_id=supplier_id, platform=platform,
+                    revenue=revenue, quantity=quantity, sale_count=sale_count,
+                ))
+        cls.objects.bulk_update(to_update, ['revenue', 'quantity', 'sale_count'], batch_size=500)
+        cls.objects.bulk_create(to_create, batch_size=1000)
+
+    @classmethod
+    def rebuild(cls, start_date=None, end_date=None):
+        """
+        Recomputes the buckets for the given local-day range (inclusive) from Sale.
+        Returns the number of buckets written.
+        """
+        from django.db.models import Count, Sum
+
+        buckets = cls.objects.all()
+        sales = Sale.objects.all()
+        if start_date:
+            buckets = buckets.filter(day__gte=start_date)
+            sales = sales.filter(sale_day__gte=start_date)
+        if end_date:
+            buckets = buckets.filter(day__lte=end_date)
+            sales = sales.filter(sale_day__lte=end_date)
+
+        rows = sales.values('sale_day', 'product_id', 'vendor_id', 'supplier_id', 'platform') \
+            .annotate(revenue=Sum('total_price'), quantity=Sum('quantity'), sale_count=Count('id')) \
+            .order_by()
+
+        with transaction.atomic():
+            buckets.delete()
+            created = cls.objects.bulk_create(
+                (
+                    cls(
+                        day=row['sale_day'],
+                        product_id=row['product_id'],
+                        vendor_id=row['vendor_id'],
+                        supplier_id=row['supplier_id'],
+                        platform=row['platform'],
+                        revenue=row['revenue'],
+                        quantity=row['quantity'],
+                        sale_count=row['sale_count'],
+                    )
+                    for row in rows.iterator()
+                ),
+                batch_size=1000,
+            )
+        return len(created)
+
+
+
+class LowStockAlert(models.Model):
+    """
+    Outbox of low-stock events. Signals only record them (one pending row per product);
+    `send_low_stock_alerts` delivers the pending ones as a single digest email.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_alerts', verbose_name='Produto')
+    stock = models.IntegerField('Estoque no Último Alerta')
+    event_count = models.PositiveIntegerField('Ocorrências', default=1)
+    created_at = models.DateTimeField('Criado em', default=timezone.now)
+    sent_at = models.DateTimeField('Enviado em', null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Alerta de Estoque Baixo'
+        verbose_name_plural = 'Alertas de Estoque Baixo'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.product.name}: estoque {self.stock}'
+
+    @classmethod
+    def record(cls, product):
+        """Queues an alert for `product`, folding it into the pending one if there is one."""
+        updated = cls.objects.filter(product_id=product.pk, sent_at__isnull=True).update(
+            stock=product.stock, event_count=models.F('event_count') + 1,
+        )
+        if not updated:
+            cls.objects.create(product=product, stock=product.stock)
+
+    @classmethod
+    def claim(cls, alerts):
+        """
+        Marks the still-pending `alerts` as sent and returns those this call claimed, so
+        digests running at the same time never mail the same alert twice.
+        """
+        now = timezone.now()
+        ids = [alert.pk for alert in alerts]
+        cls.objects.filter(pk__in=ids, sent_at__isnull=True).update(sent_at=now)
+        claimed = set(cls.objects.filter(pk__in=ids, sent_at=now).values_list('pk', flat=True))
+        return [alert for alert in alerts if alert.pk in claimed]
+
+    @classmethod
+    def release(cls, alerts):
+        """
+        Puts claimed `alerts` back in the queue after their digest failed. Where an alert
+        for the same product was queued meanwhile, the claimed one is folded into it
+        instead, so each product keeps a single pending row.
+        """
+        claimed = {alert.product_id: alert for alert in alerts}
+        with transaction.atomic():
+            for pending in cls.objects.select_for_update().filter(product_id__in=claimed, sent_at__isnull=True):
+                alert = claimed.pop(pending.product_id)
+                pending.event_count += alert.event_count
+                pending.created_at = min(pending.created_at, alert.created_at)
+                pending.save(update_fields=['event_count', 'created_at'])
+                alert.delete()
+            cls.objects.filter(pk__in=[alert.pk for alert in claimed.values()]).update(sent_at=None)
+
+
+from django.db.models.signals import post_save, post_delete, pre_delete
+
+# Sent by Sale.bulk_register(), whose sales never go through post_save
+sales_bulk_registered = Signal()
+# Sent after bulk writes to products or their stock history (imports, reconcile_stock --fix),
+# which never go through post_save
+products_bulk_changed = Signal()
+
+@receiver(post_save, sender=PlatformFeeConfig)
+@receiver(post_delete, sender=PlatformFeeConfig)
+def bump_platform_fee_config_version(sender, instance, **kwargs):
+    PlatformFeeConfig.bump_version()
+
+
+@receiver(pre_delete, sender=Supplier)
+def touch_products_of_deleted_supplier(sender, instance, **kwargs):
+    # SET_NULL clears their supplier with a queryset update, which skips auto_now
+    instance.products.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Sale)
+def remember_sale_for_rollup(sender, instance, **kwargs):
+    # Keep the stored version so post_save can move its totals to the new bucket
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = Sale.objects.filter(pk=instance.pk).first()
+    previous = instance._rollup_previous
+    if previous is None or previous.product_id != instance.product_id:
+        instance.supplier_id = instance.product.supplier_id
+
+
+@receiver(post_save, sender=Sale)
+def update_sales_rollup(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        SalesDailyRollup.apply_sale(previous, sign=-1)
+    SalesDailyRollup.apply_sale(instance)
+
+
+@receiver(post_delete, sender=Sale)
+def remove_sale_from_rollup(sender, instance, **kwargs):
+    SalesDailyRollup.apply_sale(instance, sign=-1)
+
+
+@receiver(post_save, sender=StockHistory)
+def update_stock_snapshot(sender, instance, created, **kwargs):
+    if created:
+        StockSnapshot.record_many({(instance.product_id, local_day(instance.timestamp)): instance.balance})
 
-from django.db.models.signals import post_save
-from .utils import send_low_stock_notification
 
 @receiver(post_save, sender=Sale)
 def record_sale_in_stock_history(sender, instance, created, **kwargs):
     if created:
+        # Runs inside Sale.save()'s transaction: a rejected decrement undoes the sale
+        product = instance.product
+        product.remove_stock(instance.quantity)
         StockHistory.objects.create(
-            product=instance.product,
+            product=product,
             change=-instance.quantity,
-            reason='sale'
+            reason='sale',
+            balance=product.stock,
         )
-        # Update product stock
-        product = instance.product
-        product.stock -= instance.quantity
-        product.save(update_fields=['stock'])
 
         # Check for low stock
         if product.stock < settings.LOW_STOCK_THRESHOLD:
-            send_low_stock_notification(product)
+            LowStockAlert.record(product)
 
 
 @receiver(pre_save, sender=Product)
-def record_manual_stock_adjustment(sender, instance, **kwargs):
-    if instance.pk:
+def record_manual_stock_adjustment(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'stock' not in update_fields:
+        return
+    if not instance._state.adding:
         try:
-            old_instance = Product.objects.get(pk=instance.pk)
-            if old_instance.stock != instance.stock:
-                change = instance.stock - old_instance.stock
+            # Locked and read in save()'s transaction: the stock the instance was loaded with
+            # misses the sales committed since, and the ledger would record the wrong change
+            old_stock = Product.objects.select_for_update().values_list('stock', flat=True).get(pk=instance.pk)
+            if old_stock != instance.stock:
+                change = instance.stock - old_stock
                 reason = 'manual_adjustment' # Corrected line
                 if change != 0:
                     StockHistory.objects.create(
                         product=instance,
                         change=change,
-                        reason=reason
+                        reason=reason,
+                        balance=instance.stock,
                     )
                     # Check for low stock after manual adjustment
                     if instance.stock < settings.LOW_STOCK_THRESHOLD:
-                        send_low_stock_notification(instance)
+                        LowStockAlert.record(instance)
         except Product.DoesNotExist:
             pass # New product, initial stock will be handled separately if needed
     else:
@@ -280,5 +833,6 @@ def record_initial_stock(sender, instance, created, **kwargs):
         StockHistory.objects.create(
             product=instance,
             change=instance.stock,
-            reason='initial_stock'
+            reason='initial_stock',
+            balance=instance.stock,
         )
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Each page is read as "the next page_size rows after this key" on an indexed
+ordering that ends in the primary key, e.g. (-sale_date, -id): the database
+seeks into the index and reads only that page, however deep the client is, and
+rows inserted meanwhile never shift or repeat the rows of later pages. The
+cursor is the key of the last (or, going back, the first) row, base64-encoded.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    # Views set `ordering`; it must end in a unique field (the primary key)
+    ordering = ('-id',)
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = tuple(getattr(view, 'ordering', None) or self.ordering)
+        fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+        key, self.backwards = self.decode_cursor(request, fields)
+
+        # Going back reads the rows before the cursor in reverse, then flips them
+        descending = [name.startswith('-') != self.backwards for name in ordering]
+        queryset = queryset.order_by(*(
+            f'-{field.name}' if desc else field.name for field, desc in zip(fields, descending)
+        ))
+        if key is not None:
+            queryset = queryset.filter(self._after(fields, descending, key))
+
+        rows = list(queryset[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.backwards:
+            rows.reverse()
+
+        self.fields = fields
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        # A cursor proves there are rows on the side it came from
+        self.has_next = more if not self.backwards else key is not None
+        self.has_previous = more if self.backwards else key is not None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(requested, settings.API_MAX_PAGE_SIZE))
+
+    def _after(self, fields, descending, key):
+        """
+        Rows past `key` in the given order. The leading bound is written on its own
+        (sale_date <= x AND (sale_date < x OR id < y)) so the index range scan can start at the key.
+        """
+        first, desc = fields[0], descending[0]
+        condition = Q()
+        for position in reversed(range(len(fields))):
+            name = fields[position].name
+            step = Q(**{f'{name}__{"lt" if descending[position] else "gt"}': key[position]})
+            if position < len(fields) - 1:
+                step |= Q(**{name: key[position]}) & condition
+            condition = step
+        return Q(**{f'{first.name}__{"lte" if desc else "gte"}': key[0]}) & condition
+
+    def encode_cursor(self, row, backwards):
+        values = [field.value_to_string(row) for field in self.fields]
+        payload = json.dumps({'k': values, 'b': backwards} if backwards else {'k': values})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            values = payload['k']
+            if len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(fields, values)], bool(payload.get('b'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, backwards=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,103 @@
+"""
+Pricing formulas shared by the Product properties and the batch repricing engine,
+so both always produce identical Decimal results.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+PRICING_FIELDS = ('cost_fixed', 'physical_margin', 'shopee_commission', 'free_shipping_fee', 'fixed_fee', 'highlight_active', 'highlight_fee')
+
+
+class FeeFactors:
+    """Config-derived terms of the pricing formulas, computed once per config."""
+
+    def __init__(self, config):
+        self.cost_fixed = config.cost_fixed
+        self.fixed_fee = config.fixed_fee
+        self.fisica_factor = 1 + config.physical_margin / 100
+        taxa_total = config.shopee_commission + config.free_shipping_fee + (config.highlight_fee if config.highlight_active else Decimal('0.00'))
+        self.shopee_factor = 1 + taxa_total / 100
+
+    def total_cost(self, cost_price):
+        return cost_price + self.cost_fixed
+
+    def vf_fisica(self, cost_price):
+        return (self.total_cost(cost_price) * self.fisica_factor).quantize(CENT)
+
+    def vf_shopee(self, cost_price):
+        return ((self.total_cost(cost_price) + self.fixed_fee) * self.shopee_factor).quantize(CENT)
+
+
+def min_price_allowed(recommended_price, negotiation_margin):
+    if recommended_price is None:
+        return None
+    margin_fraction = (negotiation_margin / Decimal('100'))
+    return (recommended_price * (Decimal('1.00') - margin_fraction)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+CHUNK_SIZE = 5000
+
+
+def reprice(products, config):
+    """
+    Yields one dict per product with the prices under `config` (None prices
+    when there is no config, like the Product properties).
+    `products` is a Product queryset; only the pricing columns are read. Rows are
+    keyed by product_code: converting UUID keys costs more than the pricing itself.
+    """
+    factors = FeeFactors(config) if config is not None else None
+    prices = {}  # cost_price -> (vf_fisica, vf_shopee); catalogs repeat prices a lot
+    rows = products.order_by().values_list('product_code', 'name', 'cost_price', 'recommended_price', 'negotiation_margin')
+    for code, name, cost_price, recommended_price, negotiation_margin in rows.iterator(chunk_size=CHUNK_SIZE):
+        if factors is None:
+            vf_fisica = vf_shopee = None
+        elif cost_price in prices:
+            vf_fisica, vf_shopee = prices[cost_price]
+        else:
+            vf_fisica, vf_shopee = prices[cost_price] = factors.vf_fisica(cost_price), factors.vf_shopee(cost_price)
+        yield {
+            'product_code': code,
+            'name': name,
+            'cost_price': cost_price,
+            'vf_fisica': vf_fisica,
+            'vf_shopee': vf_shopee,
+            'min_price_allowed': min_price_allowed(recommended_price, negotiation_margin),
+        }
+
+
+def simulate(products, current, hypothetical):
+    """
+    Reprices `products` under both configs. Margin is the unit price minus the
+    total cost (cost price + fixed cost) of that config.
+    Returns (results, summary).
+    """
+    current_factors = FeeFactors(current)
+    new_factors = FeeFactors(hypothetical)
+    deltas = ('vf_fisica_delta', 'vf_shopee_delta', 'fisica_margin_delta', 'shopee_margin_delta')
+    totals = dict.fromkeys(deltas, Decimal('0.00'))
+    prices = {}  # cost_price -> computed columns
+    results = []
+
+    rows = products.order_by().values_list('product_code', 'name', 'cost_price')
+    for code, name, cost_price in rows.iterator(chunk_size=CHUNK_SIZE):
+        priced = prices.get(cost_price)
+        if priced is None:
+            fisica, shopee = current_factors.vf_fisica(cost_price), current_factors.vf_shopee(cost_price)
+            new_fisica, new_shopee = new_factors.vf_fisica(cost_price), new_factors.vf_shopee(cost_price)
+            cost, new_cost = current_factors.total_cost(cost_price), new_factors.total_cost(cost_price)
+            priced = prices[cost_price] = {
+                'vf_fisica': fisica,
+                'vf_shopee': shopee,
+                'new_vf_fisica': new_fisica,
+                'new_vf_shopee': new_shopee,
+                'vf_fisica_delta': new_fisica - fisica,
+                'vf_shopee_delta': new_shopee - shopee,
+                'fisica_margin_delta': (new_fisica - new_cost) - (fisica - cost),
+                'shopee_margin_delta': (new_shopee - new_cost) - (shopee - cost),
+            }
+        for key in deltas:
+            totals[key] += priced[key]
+        results.append({'product_code': code, 'name': name, **priced})
+
+    summary = {'product_count': len(results), **{f'total_{key}': value for key, value in totals.items()}}
+    return results, summary
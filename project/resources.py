@@ -1,7 +1,166 @@
-from import_export import resources
-from .models import Product, Supplier
+import csv
+import os
+from abc import ABCMeta, abstractmethod
+
+import tablib
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from import_export import fields, resources, widgets
+from import_export.declarative import ModelDeclarativeMetaclass
+from import_export.instance_loaders import ModelInstanceLoader
+
+from .models import LowStockAlert, Product, Sale, StockHistory, StockSnapshot, Supplier, Vendor, local_day, products_bulk_changed
+
+LOOKUP_BATCH_SIZE = 500
+
+
+class CachedForeignKeyWidget(widgets.ForeignKeyWidget):
+    """
+    ForeignKeyWidget that looks each distinct value up once per import instead of once
+    per row. Resources copy their fields per instance, so the cache lives as long as the resource.
+    With create_missing, values not found are created (as objects with only that field set).
+    """
+
+    def __init__(self, model, field='pk', create_missing=False, **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.create_missing = create_missing
+        self._cache = {}
+
+    def prefetch(self, values):
+        """Loads the given values ahead of clean(), one query per LOOKUP_BATCH_SIZE of them."""
+        keys = list({str(value).strip() for value in values if value is not None} - {''} - self._cache.keys())
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            found = {}
+            for obj in self.get_queryset(None, None).filter(**{f'{self.field}__in': batch}):
+                found.setdefault(str(getattr(obj, self.field)), []).append(obj)
+            missing = [key for key in batch if key not in found]
+            if self.create_missing and missing:
+                for obj in self.model.objects.bulk_create(self.model(**{self.field: key}) for key in missing):
+                    found[str(getattr(obj, self.field))] = [obj]
+            self._cache.update({key: found.get(key, []) for key in batch})
+
+    def clean(self, value, row=None, **kwargs):
+        if value is None or str(value).strip() == '':
+            return None
+        key = str(value).strip()
+        if key not in self._cache:
+            matches = list(self.get_queryset(value, row, **kwargs).filter(**{self.field: key})[:2])
+            if not matches and self.create_missing:
+                matches = [self.model.objects.create(**{self.field: key})]
+            self._cache[key] = matches
+        matches = self._cache[key]
+        if not matches:
+            raise ValueError(f'{self.model._meta.verbose_name} "{key}" não encontrado.')
+        if len(matches) > 1:
+            raise ValueError(f'Há mais de um {self.model._meta.verbose_name} com {self.field} "{key}".')
+        return matches[0]
+
+
+class IsoDateTimeWidget(widgets.DateTimeWidget):
+    """DateTimeWidget that also reads ISO 8601 with an offset, as the streaming exports write it."""
+
+    def clean(self, value, row=None, **kwargs):
+        parsed = parse_datetime(value.strip()) if isinstance(value, str) else None
+        if parsed is None:
+            return super().clean(value, row, **kwargs)
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class BatchedInstanceLoader(ModelInstanceLoader):
+    """
+    Loads the existing rows of a whole dataset up front, LOOKUP_BATCH_SIZE keys per
+    query (CachedInstanceLoader's single IN list overflows SQLite's parameter limit
+    on large files). Needs exactly one import_id_field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pk_field = self.resource.fields[self.resource.get_import_id_fields()[0]]
+        self.all_instances = {}
+        if self.dataset.headers and self.pk_field.column_name in self.dataset.headers:
+            column = self.pk_field.column_name
+            keys = list({self.pk_field.clean({column: value}) for value in self.dataset[column]} - {None, ''})
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                instances = self.get_queryset().filter(**{f'{self.pk_field.attribute}__in': keys[start:start + LOOKUP_BATCH_SIZE]})
+                self.all_instances.update((self.pk_field.get_value(instance), instance) for instance in instances)
+
+    def get_instance(self, row):
+        return self.all_instances.get(self.pk_field.clean(row))
+
+
+class BulkImportMetaclass(ABCMeta, ModelDeclarativeMetaclass):
+    """Lets BulkImportMixin declare abstract hooks on resources, which have a metaclass of their own."""
+
+
+class BulkImportMixin(metaclass=BulkImportMetaclass):
+    """
+    For resources that take large files (see `import_records`): rows are saved in
+    batches through save_batch()/update_batch(), existing rows are loaded with
+    BatchedInstanceLoader, lookups are prefetched once per dataset, and model
+    validation leaves out the foreign keys, which their widgets already resolved.
+    With append_only, rows that already exist are skipped.
+    Meta needs use_bulk, batch_size, skip_diff and instance_loader_class = BatchedInstanceLoader.
+    """
+    append_only = False
+    WIDGETS_MAP = {**resources.ModelResource.WIDGETS_MAP, 'DateTimeField': IsoDateTimeWidget}
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        for field in self.fields.values():
+            if isinstance(field.widget, CachedForeignKeyWidget) and field.column_name in dataset.headers:
+                field.widget.prefetch(dataset[field.column_name])
+
+    def skip_row(self, instance, original, row, import_validation_errors=None):
+        if self.append_only:
+            return not instance._state.adding
+        return super().skip_row(instance, original, row, import_validation_errors)
+
+    def validate_instance(self, instance, import_validation_errors=None, validate_unique=True):
+        errors = dict(import_validation_errors or {})
+        exclude = [*errors, *(f.name for f in instance._meta.fields if f.is_relation or not f.editable)]
+        try:
+            instance.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+
+    def bulk_create(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        if self.create_instances and (using_transactions or not dry_run):
+            try:
+                self.save_batch(self.create_instances)
+            except Exception as e:
+                self.handle_import_error(result, e, raise_errors)
+            finally:
+                self.create_instances.clear()
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        if self.update_instances and (using_transactions or not dry_run):
+            try:
+                self.update_batch(self.update_instances)
+            except Exception as e:
+                self.handle_import_error(result, e, raise_errors)
+            finally:
+                self.update_instances.clear()
+
+    @abstractmethod
+    def save_batch(self, instances):
+        """Inserts a batch of new, unsaved instances, doing what their save signals would."""
+
+    def update_batch(self, instances):
+        """Writes a batch of changed existing instances; by default a plain bulk_update() of the imported fields."""
+        self._meta.model.objects.bulk_update(instances, self.get_bulk_update_fields(), batch_size=self._meta.batch_size)
+
+
+class ProductResource(BulkImportMixin, resources.ModelResource):
+    id = fields.Field(attribute='id', column_name='id', readonly=True) # Exported only: rows are matched by product_code
+    # Supplier by name; names not registered yet are created in one insert per import
+    supplier = fields.Field(attribute='supplier', column_name='supplier__name', widget=CachedForeignKeyWidget(Supplier, 'name', create_missing=True))
 
-class ProductResource(resources.ModelResource):
     class Meta:
         model = Product
         fields = (
@@ -9,7 +168,7 @@ class ProductResource(resources.ModelResource):
             'product_code',
             'name',
             'description',
-            'supplier__name', # Export supplier name instead of ID
+            'supplier', # Export supplier name instead of ID
             'cost_price',
             'recommended_price',
             'negotiation_margin',
@@ -19,12 +178,182 @@ class ProductResource(resources.ModelResource):
             'updated_at',
         )
         export_order = fields # Maintain the order of fields during export
+        import_id_fields = ('product_code',)
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+        instance_loader_class = BatchedInstanceLoader
+
+    def filter_export(self, queryset, **kwargs):
+        return queryset.select_related('supplier')
+
+    def save_batch(self, products):
+        # What Product's post_save signals do one by one: the initial stock entry and its snapshot
+        Product.objects.bulk_create(products, batch_size=1000)
+        stocked = [product for product in products if product.stock > 0]
+        StockHistory.objects.bulk_create(
+            (StockHistory(product=product, change=product.stock, reason='initial_stock', balance=product.stock) for product in stocked),
+            batch_size=1000,
+        )
+        today = local_day(timezone.now())
+        StockSnapshot.record_many({(product.pk, today): product.stock for product in stocked})
+        for product in products:
+            product._state.adding = False
+            product._remember_values()
+        products_bulk_changed.send(sender=Product, product_ids=[product.pk for product in products])
+
+    def update_batch(self, products):
+        # Grouped by the set of changed fields, so no product gets a column written back that it did not change
+        groups = {}
+        for product in products:
+            # Timestamps read back from an export never quite match the stored ones (they lose
+            # their microseconds): updated_at is set below, created_at stays as it was
+            for name in ('created_at', 'updated_at'):
+                setattr(product, name, product.loaded_value(name))
+            dirty = frozenset(product.get_dirty_fields()) - {'id'}
+            if dirty:
+                groups.setdefault(dirty, []).append(product)
+        if not groups:
+            return
+        now = timezone.now()
+        for dirty, group in groups.items():
+            # One UPDATE per distinct set of new values (prices and stock levels repeat a lot
+            # across a catalog); bulk_update()'s per-row CASE expressions cost more than that
+            attnames = [Product._meta.get_field(name).attname for name in dirty]
+            by_values = {}
+            for product in group:
+                product.updated_at = now
+                by_values.setdefault(tuple(getattr(product, attname) for attname in attnames), []).append(product.pk)
+            for values, pks in by_values.items():
+                for start in range(0, len(pks), LOOKUP_BATCH_SIZE):
+                    Product.objects.filter(pk__in=pks[start:start + LOOKUP_BATCH_SIZE]).update(updated_at=now, **dict(zip(attnames, values)))
+
+        # What record_manual_stock_adjustment does one by one
+        adjusted = [product for dirty, group in groups.items() if 'stock' in dirty for product in group]
+        StockHistory.objects.bulk_create(
+            (
+                StockHistory(product=product, change=product.stock - product.loaded_value('stock'), reason='manual_adjustment', balance=product.stock)
+                for product in adjusted
+            ),
+            batch_size=1000,
+        )
+        today = local_day(timezone.now())
+        StockSnapshot.record_many({(product.pk, today): product.stock for product in adjusted})
+        for product in adjusted:
+            if product.stock < settings.LOW_STOCK_THRESHOLD:
+                LowStockAlert.record(product)
+        for group in groups.values():
+            for product in group:
+                product._remember_values()
+        products_bulk_changed.send(sender=Product, product_ids=[product.pk for group in groups.values() for product in group])
+
+
+class SaleResource(BulkImportMixin, resources.ModelResource):
+    append_only = True
+    product = fields.Field(attribute='product', column_name='product_code', widget=CachedForeignKeyWidget(Product, 'product_code'))
+    vendor = fields.Field(attribute='vendor', column_name='vendor', widget=CachedForeignKeyWidget(Vendor, 'name'))
+
+    class Meta:
+        model = Sale
+        fields = ('id', 'product', 'vendor', 'quantity', 'total_price', 'platform', 'sale_date')
+        export_order = fields
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+        instance_loader_class = BatchedInstanceLoader
+
+    def save_batch(self, instances):
+        # Same path as the bulk sales API: stock, ledger, rollup and alerts included
+        Sale.bulk_register(instances)
+
+
+class StockHistoryResource(BulkImportMixin, resources.ModelResource):
+    """
+    Imports ledger rows as they are; product stock is not touched (reconcile_stock
+    reports any difference). A blank balance is filled with the running sum of the
+    product's ledger, so rows should come in chronological order, after the
+    existing history.
+    """
+    append_only = True
+    product = fields.Field(attribute='product', column_name='product_code', widget=CachedForeignKeyWidget(Product, 'product_code'))
+
+    class Meta:
+        model = StockHistory
+        fields = ('id', 'product', 'change', 'reason', 'balance', 'timestamp')
+        export_order = fields
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+        instance_loader_class = BatchedInstanceLoader
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._balances = {}
+        self._imported_products = set()
+
+    def save_batch(self, instances):
+        missing = {row.product_id for row in instances if row.product_id not in self._balances}
+        if missing:
+            sums = StockHistory.objects.filter(product_id__in=missing).values('product_id').annotate(total=Sum('change')).order_by()
+            self._balances.update({product_id: 0 for product_id in missing})
+            self._balances.update(sums.values_list('product_id', 'total'))
+        for row in instances:
+            if row.balance is None:
+                row.balance = self._balances[row.product_id] + row.change
+            self._balances[row.product_id] = row.balance
+        StockHistory.objects.bulk_create(instances, batch_size=1000)
+        self._imported_products.update(row.product_id for row in instances)
+        products_bulk_changed.send(sender=StockHistory, product_ids=list({row.product_id for row in instances}))
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if self._imported_products:
+            StockSnapshot.rebuild(self._imported_products)
+            self._imported_products = set()
+
+
+def iter_dataset_chunks(path, chunk_size, skip_rows=0):
+    """
+    Reads a CSV or XLSX file (first row: headers) as it goes and yields tablib
+    Datasets of up to `chunk_size` rows, so a file of any size imports in bounded
+    memory. The first `skip_rows` data rows are skipped. Raises ValueError for
+    unsupported files.
+    """
+    rows = _iter_file_rows(path)
+    headers = next(rows, None)
+    if headers is None:
+        return
+    headers = ['' if header is None else str(header).strip() for header in headers]
+    width = len(headers)
+    chunk = []
+    for number, row in enumerate(rows, 1):
+        if number <= skip_rows:
+            continue
+        row = list(row[:width]) + [None] * (width - len(row))
+        if all(cell in (None, '') for cell in row):
+            continue
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield tablib.Dataset(*chunk, headers=headers)
+            chunk = []
+    if chunk:
+        yield tablib.Dataset(*chunk, headers=headers)
+
 
-    def before_import_row(self, row, **kwargs):
-        # Handle supplier by name
-        supplier_name = row.get('supplier__name')
-        if supplier_name:
-            supplier, created = Supplier.objects.get_or_create(name=supplier_name)
-            row['supplier'] = supplier.pk # Set supplier to its primary key for import
-        else:
-            row['supplier'] = None # Handle cases where supplier name is not provided
+def _iter_file_rows(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as csv_file:
+            yield from csv.reader(csv_file)
+    elif extension == '.xlsx':
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValueError('Para importar arquivos .xlsx instale o openpyxl (pip install openpyxl).')
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f'Formato não suportado: {extension or path}. Use .csv ou .xlsx.')
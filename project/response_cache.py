@@ -0,0 +1,157 @@
+"""
+Response cache for the filtered API list endpoints.
+
+An entry is keyed on the endpoint, the normalised query string (parameters sorted,
+blank ones dropped, as the pagination links write them), the host, the user's
+permission scope and the generation of every model the response shows: the
+endpoint's own and those of its expanded relations. Saving or deleting one of those
+models bumps its generation, one cache.incr once the write commits, so the entries
+built from the old data are never looked up again and expire after API_CACHE_TIMEOUT.
+Entries hold the rendered JSON zlib-compressed, with the ETag it was sent with;
+bodies compressing to more than API_CACHE_MAX_ENTRY_BYTES are not stored.
+
+Generations and entries live in the `default` cache. With the per-process LocMem
+backend a bump only reaches the process that made the write, and the other workers
+may serve their entries for up to API_CACHE_TIMEOUT; use a shared cache (Redis,
+Memcached) when running several workers.
+"""
+import hashlib
+import time
+import zlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from .models import Product, ProductImage, Sale, StockHistory, Supplier, Vendor, products_bulk_changed, sales_bulk_registered
+
+KEY_PREFIX = 'api'
+CACHE_HEADER = 'X-Cache'
+
+
+def _generation_key(model):
+    return f'{KEY_PREFIX}:gen:{model._meta.label_lower}'
+
+
+def _generations(models):
+    keys = [_generation_key(model) for model in models]
+    found = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        if key not in found:
+            # Seed with the clock so an evicted counter never resurrects an old entry
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        generations.append(str(found[key]))
+    return generations
+
+
+def bump_generation(*models):
+    for model in models:
+        key = _generation_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_generation_on_commit(*models):
+    # A bump before the commit would let a read still seeing the old rows store them
+    # under the new generation
+    transaction.on_commit(lambda: bump_generation(*models))
+
+
+def permission_scope(user):
+    # The list endpoints show the same rows to every user who may call them; the
+    # flags keep entries apart should staff ever be shown more
+    return f'staff={int(user.is_staff)}:superuser={int(user.is_superuser)}'
+
+
+def normalized_query(request):
+    params = sorted((name, value) for name, values in request.query_params.lists() for value in values if value != '')
+    return urlencode(params)
+
+
+def response_cache_key(request, name, models):
+    query = hashlib.md5(f'{request.get_host()}?{normalized_query(request)}'.encode()).hexdigest()
+    return ':'.join([KEY_PREFIX, 'response', name, permission_scope(request.user), query, *_generations(models)])
+
+
+class CachedListMixin:
+    """
+    Serves GET from the response cache (see the module docstring) for JSON requests,
+    reporting `X-Cache: HIT` or `MISS`. Other formats, e.g. the browsable API, whose
+    page shows the user, are never cached.
+    """
+
+    def get_cache_models(self):
+        """The endpoint's model and those of the relations being expanded or listed by id."""
+        models = [self.get_queryset().model]
+        for path in [*self.get_shape()[1], *self.get_id_list_paths()]:
+            model = models[0]
+            for name in path.split('.'):
+                model = model._meta.get_field(name).related_model
+            models.append(model)
+        return list(dict.fromkeys(models))
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+
+        key = response_cache_key(request, type(self).__name__, self.get_cache_models())
+        entry = cache.get(key)
+        if entry is not None:
+            content_type, etag, body = entry
+            response = HttpResponse(zlib.decompress(body), content_type=content_type)
+            if etag:
+                # The body may predate the rows' current ETag (ConditionalGetMixin keeps this one)
+                response['ETag'] = etag
+            response[CACHE_HEADER] = 'HIT'
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(lambda rendered: self._store(key, rendered))
+        response[CACHE_HEADER] = 'MISS'
+        return response
+
+    def _store(self, key, response):
+        body = zlib.compress(response.content)
+        if len(body) <= settings.API_CACHE_MAX_ENTRY_BYTES:
+            cache.set(key, (response['Content-Type'], response.get('ETag'), body), settings.API_CACHE_TIMEOUT)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(sales_bulk_registered, sender=Sale)
+def invalidate_sales(sender, **kwargs):
+    # Sales take their units out of the products' stock
+    bump_generation_on_commit(Sale, Product)
+
+
+@receiver(products_bulk_changed)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Supplier)
+@receiver(post_save, sender=Vendor)
+def invalidate_model(sender, **kwargs):
+    # products_bulk_changed may be sent for StockHistory; the stock is on the product
+    bump_generation_on_commit(Product if sender is StockHistory else sender)
+
+
+# Deleting them clears the foreign key of the rows pointing at them (SET_NULL)
+@receiver(post_delete, sender=Supplier)
+def invalidate_deleted_supplier(sender, **kwargs):
+    # Sales keep the supplier they were made under
+    bump_generation_on_commit(Supplier, Product, Sale)
+
+
+@receiver(post_delete, sender=Vendor)
+def invalidate_deleted_vendor(sender, **kwargs):
+    bump_generation_on_commit(Vendor, Sale)
@@ -1,45 +1,155 @@
+from decimal import Decimal
 from rest_framework import serializers
 from .models import Product, Supplier, Vendor, Sale, ProductImage, PlatformFeeConfig, StockHistory
 
-class SupplierSerializer(serializers.ModelSerializer):
+
+def _under(paths, name):
+    """The parts of dotted `paths` below `name`: ['product.images', 'vendor'] -> ['images'] for 'product'."""
+    return [path[len(name) + 1:] for path in paths if path.startswith(f'{name}.')]
+
+
+class ExpandableModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer whose relations are plain ids unless expanded.
+
+    Meta.expandable_fields maps a field to the serializer (or (serializer, kwargs))
+    that replaces it when expanded; to-many relations declared as
+    PrimaryKeyRelatedField(many=True) are lists of ids until then. `expand` takes dotted paths ('product',
+    'product.images') and `fields` limits the output to the given names
+    ('id', 'product', 'product.name'). Expanded relations are read-only, so the
+    views only expand on reads.
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        self.requested_fields = fields
+        self.expand = expand
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def nested_serializer(cls, name):
+        target = getattr(cls.Meta, 'expandable_fields', {})[name]
+        return target if isinstance(target, tuple) else (target, {})
+
+    @classmethod
+    def id_list_paths(cls, fields, expand):
+        """
+        Dotted paths of the to-many relations a response shaped by `fields` and (resolved)
+        `expand` shows as lists of ids: 'images' for a product, 'product.images' for a
+        sale expanding its product.
+        """
+        paths = []
+        for prefix in ['', *expand]:
+            serializer_class = cls
+            for name in filter(None, prefix.split('.')):
+                serializer_class = serializer_class.nested_serializer(name)[0]
+            requested = (_under(fields, prefix) if prefix else fields) if fields is not None else None
+            wanted = {field.split('.')[0] for field in requested} if requested else None
+            for name, field in serializer_class._declared_fields.items():
+                path = f'{prefix}.{name}' if prefix else name
+                if isinstance(field, serializers.ManyRelatedField) and path not in expand and (wanted is None or name in wanted):
+                    paths.append(path)
+        return paths
+
+    @classmethod
+    def resolve_expand(cls, paths):
+        """
+        Returns the dotted `paths` with their parents ('product.images' needs 'product'),
+        raising ValidationError for any that cannot be expanded.
+        """
+        resolved = []
+        for path in paths:
+            serializer_class = cls
+            parts = path.split('.')
+            for depth, name in enumerate(parts):
+                if name not in getattr(serializer_class.Meta, 'expandable_fields', {}):
+                    raise serializers.ValidationError({'expand': [f'Não é possível expandir "{path}".']})
+                serializer_class = serializer_class.nested_serializer(name)[0]
+                prefix = '.'.join(parts[:depth + 1])
+                if prefix not in resolved:
+                    resolved.append(prefix)
+        return resolved
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in dict.fromkeys(path.split('.')[0] for path in self.expand):
+            serializer_class, kwargs = self.nested_serializer(name)
+            sub_fields = _under(self.requested_fields or (), name) or None
+            fields[name] = serializer_class(read_only=True, fields=sub_fields, expand=_under(self.expand, name), **kwargs)
+
+        if self.requested_fields is not None:
+            wanted = dict.fromkeys(field.split('.')[0] for field in self.requested_fields)
+            unknown = [name for name in wanted if name not in fields]
+            if unknown:
+                raise serializers.ValidationError({'fields': [f'Campo desconhecido: {", ".join(unknown)}.']})
+            not_expanded = [name for name in wanted if _under(self.requested_fields, name) and name not in self.expand]
+            if not_expanded:
+                raise serializers.ValidationError({'fields': [f'Expanda {", ".join(not_expanded)} para escolher os campos.']})
+            fields = {name: field for name, field in fields.items() if name in wanted}
+        return fields
+
+
+class SupplierSerializer(ExpandableModelSerializer):
     class Meta:
         model = Supplier
         fields = '__all__'
 
-class VendorSerializer(serializers.ModelSerializer):
+class VendorSerializer(ExpandableModelSerializer):
     class Meta:
         model = Vendor
         fields = '__all__'
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(ExpandableModelSerializer):
     class Meta:
         model = ProductImage
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
-    images = ProductImageSerializer(many=True, read_only=True)
-    supplier = SupplierSerializer(read_only=True) # Nested serializer for supplier details
+class ProductSerializer(ExpandableModelSerializer):
+    images = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
         model = Product
         fields = '__all__'
+        expandable_fields = {
+            'supplier': SupplierSerializer,
+            'images': (ProductImageSerializer, {'many': True}),
+        }
 
-class SaleSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True) # Nested serializer for product details
-    vendor = VendorSerializer(read_only=True) # Nested serializer for vendor details
-
+class SaleSerializer(ExpandableModelSerializer):
     class Meta:
         model = Sale
         fields = '__all__'
+        expandable_fields = {
+            'product': ProductSerializer,
+            'vendor': VendorSerializer,
+        }
+
+class BulkSaleSerializer(serializers.Serializer):
+    """
+    One row of a bulk sale import. The product is given by id or product_code and
+    the vendor by id; both are resolved for the whole batch at once by the view.
+    """
+    product = serializers.UUIDField(required=False)
+    product_code = serializers.CharField(required=False, max_length=60)
+    vendor = serializers.IntegerField(required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    platform = serializers.ChoiceField(choices=Sale.PLATFORM_CHOICES, default='loja_fisica')
+    sale_date = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get('product') and not attrs.get('product_code'):
+            raise serializers.ValidationError({'product': 'Informe o produto (product ou product_code).'})
+        return attrs
 
 class PlatformFeeConfigSerializer(serializers.ModelSerializer):
     class Meta:
         model = PlatformFeeConfig
         fields = '__all__'
 
-class StockHistorySerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True) # Nested serializer for product details
-
+class StockHistorySerializer(ExpandableModelSerializer):
     class Meta:
         model = StockHistory
         fields = '__all__'
+        expandable_fields = {
+            'product': ProductSerializer,
+        }
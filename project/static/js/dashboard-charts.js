@@ -1,11 +1,53 @@
+// Chart series are served by the dashboard JSON endpoints so the page renders
+// before any sales aggregation runs; every request below is issued in parallel.
+function fetchJson(url) {
+    return fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error('Falha ao carregar ' + url + ': ' + response.status);
+            }
+            return response.json();
+        });
+}
+
+function loadChartData(canvas, render) {
+    if (!canvas || !canvas.dataset.url) {
+        return;
+    }
+    fetchJson(canvas.dataset.url).then(render).catch(function (error) {
+        console.error(error);
+    });
+}
+
+function loadSalesSummary() {
+    const fields = document.querySelectorAll('[data-summary]');
+    if (!fields.length) {
+        return;
+    }
+    fetchJson(fields[0].dataset.summary).then(function (summary) {
+        fields.forEach(function (field) {
+            const value = summary[field.dataset.summaryField];
+            if (field.dataset.summaryFormat === 'currency') {
+                field.textContent = 'R$ ' + value.toLocaleString('pt-BR', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+            } else {
+                field.textContent = value;
+            }
+        });
+    }).catch(function (error) {
+        console.error(error);
+    });
+}
+
 document.addEventListener('DOMContentLoaded', function() {
+    loadSalesSummary();
+
     // Chart.js global settings for light theme
     Chart.defaults.color = '#212529'; // Dark text for light background
     Chart.defaults.borderColor = '#DEE2E6'; // Light border for light background
 
     // Pie Chart: Products by Supplier
     const supplierPieCtx = document.getElementById('supplierPieChart');
-    if (supplierPieCtx && typeof pieChartData !== 'undefined') {
+    loadChartData(supplierPieCtx, function (pieChartData) {
         new Chart(supplierPieCtx, {
             type: 'pie',
             data: {
@@ -41,11 +83,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
-    }
+    });
 
     // Bar Chart: Top 5 Products by Stock
     const stockBarCtx = document.getElementById('stockBarChart');
-    if (stockBarCtx && typeof barChartData !== 'undefined') {
+    loadChartData(stockBarCtx, function (barChartData) {
         new Chart(stockBarCtx, {
             type: 'bar',
             data: {
@@ -101,11 +143,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
-    }
+    });
 
     // Line Chart: Sales over time
     const salesLineCtx = document.getElementById('salesLineChart');
-    if (salesLineCtx && typeof salesChartData !== 'undefined') {
+    loadChartData(salesLineCtx, function (salesChartData) {
         new Chart(salesLineCtx, {
             type: 'line',
             data: {
@@ -160,11 +202,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
-    }
+    });
 
     // Bar Chart: Top 5 Vendors by Sales
     const vendorSalesBarCtx = document.getElementById('vendorSalesBarChart');
-    if (vendorSalesBarCtx && typeof vendorSalesChartData !== 'undefined') {
+    loadChartData(vendorSalesBarCtx, function (vendorSalesChartData) {
         new Chart(vendorSalesBarCtx, {
             type: 'bar',
             data: {
@@ -217,11 +259,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
-    }
+    });
 
     // Doughnut Chart: Top 5 Selling Products
     const topProductsDoughnutCtx = document.getElementById('topProductsDoughnutChart');
-    if (topProductsDoughnutCtx && typeof topProductsChartData !== 'undefined') {
+    loadChartData(topProductsDoughnutCtx, function (topProductsChartData) {
         new Chart(topProductsDoughnutCtx, {
             type: 'doughnut',
             data: {
@@ -256,5 +298,5 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
-    }
+    });
 });
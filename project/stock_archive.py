@@ -0,0 +1,175 @@
+"""
+Cold storage for old StockHistory rows.
+
+compact_month() moves the raw rows of a month into a gzip'd JSON-lines file
+(<archive dir>/<YYYY>/<YYYY-MM>.jsonl.gz) and replaces them with one 'monthly_summary'
+row per product carrying the month's net change and closing balance.
+restore_month() puts the raw rows back.
+StockSnapshot is left alone, so stock-as-of queries keep working on compacted months.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Product, StockHistory, products_bulk_changed
+
+SUMMARY_REASON = 'monthly_summary'
+ARCHIVE_FIELDS = ('id', 'product_id', 'change', 'reason', 'balance', 'timestamp')
+DELETE_BATCH_SIZE = 5000
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def month_bounds(month):
+    tz = timezone.get_current_timezone()
+    return datetime.combine(month, time.min, tz), datetime.combine(next_month(month), time.min, tz)
+
+
+def archive_path(month, archive_dir=None):
+    archive_dir = archive_dir or settings.STOCK_HISTORY_ARCHIVE_DIR
+    return os.path.join(archive_dir, f'{month:%Y}', f'{month:%Y-%m}.jsonl.gz')
+
+
+def archived_months(archive_dir=None):
+    archive_dir = archive_dir or settings.STOCK_HISTORY_ARCHIVE_DIR
+    months = []
+    if os.path.isdir(archive_dir):
+        for year in sorted(os.listdir(archive_dir)):
+            for name in sorted(os.listdir(os.path.join(archive_dir, year))):
+                if name.endswith('.jsonl.gz'):
+                    months.append(datetime.strptime(name[:7], '%Y-%m').date())
+    return months
+
+
+def _read_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            yield json.loads(line)
+
+
+def _raw_rows(month):
+    start, end = month_bounds(month)
+    return StockHistory.objects.filter(timestamp__gte=start, timestamp__lt=end).exclude(reason=SUMMARY_REASON)
+
+
+def _delete_in_batches(queryset):
+    """
+    Deletes the rows of `queryset` with one DELETE per DELETE_BATCH_SIZE ids, without
+    loading them: the StockHistory post_delete receivers rule out Django's fast delete.
+    Callers send products_bulk_changed instead. Returns the rows deleted.
+    """
+    deleted = 0
+    while True:
+        bounds = queryset.order_by('pk').values_list('pk', flat=True)[DELETE_BATCH_SIZE - 1:DELETE_BATCH_SIZE]
+        high = next(iter(bounds), None)
+        batch = queryset.order_by() if high is None else queryset.filter(pk__lte=high).order_by()
+        deleted += batch._raw_delete(batch.db)
+        if high is None:
+            return deleted
+
+
+def compact_month(month, archive_dir=None):
+    """
+    Archives and summarizes the raw rows of one month. Returns (archived rows, summary rows).
+    The file is written (and merged with an earlier archive of the month) before the
+    database changes, so an interrupted run loses nothing and can simply be repeated.
+    """
+    rows = _raw_rows(month).order_by('product_id', 'timestamp', 'id')
+    path = archive_path(month, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+
+    summaries = {}
+    archived = 0
+    max_id = None
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as archive:
+        known_ids = set()
+        if os.path.exists(path):
+            for record in _read_archive(path):
+                known_ids.add(record['id'])
+                archive.write(json.dumps(record) + '\n')
+        for row in rows.values_list(*ARCHIVE_FIELDS).iterator(chunk_size=5000):
+            record = dict(zip(ARCHIVE_FIELDS, row))
+            product_id = str(record['product_id'])
+            summary = summaries.setdefault(product_id, {'change': 0})
+            summary['change'] += record['change']
+            summary['balance'] = record['balance']
+            summary['timestamp'] = record['timestamp']
+            max_id = record['id'] if max_id is None else max(max_id, record['id'])
+            archived += 1
+            if record['id'] not in known_ids:
+                record['product_id'] = product_id
+                record['timestamp'] = record['timestamp'].isoformat()
+                archive.write(json.dumps(record) + '\n')
+    if not archived:
+        os.remove(temp_path)
+        return 0, 0
+    os.replace(temp_path, path)
+
+    with transaction.atomic():
+        # Only the rows that were written to the file
+        _delete_in_batches(_raw_rows(month).filter(id__lte=max_id))
+        StockHistory.objects.bulk_create(
+            (
+                StockHistory(product_id=product_id, change=summary['change'], reason=SUMMARY_REASON,
+                             balance=summary['balance'], timestamp=summary['timestamp'])
+                for product_id, summary in summaries.items()
+            ),
+            batch_size=1000,
+        )
+        products_bulk_changed.send(sender=StockHistory, product_ids=list(summaries))
+    return archived, len(summaries)
+
+
+def months_to_compact(horizon_days):
+    """Months that ended before the horizon and still have raw rows, oldest first."""
+    cutoff = month_start(timezone.localdate() - timedelta(days=horizon_days))
+    oldest = StockHistory.objects.exclude(reason=SUMMARY_REASON).aggregate(oldest=Min('timestamp'))['oldest']
+    months = []
+    if oldest is not None:
+        month = month_start(timezone.localdate(oldest))
+        while month < cutoff:
+            months.append(month)
+            month = next_month(month)
+    return months
+
+
+def restore_month(month, archive_dir=None):
+    """
+    Puts a month's archived rows back in place of its summaries and removes the file.
+    Rows of products deleted since then are dropped. Returns the rows restored.
+    """
+    path = archive_path(month, archive_dir)
+    if not os.path.exists(path):
+        return 0
+    start, end = month_bounds(month)
+    product_ids = {record['product_id'] for record in _read_archive(path)}
+    existing = {str(pk) for pk in Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)}
+    restored = 0
+    with transaction.atomic():
+        _delete_in_batches(StockHistory.objects.filter(reason=SUMMARY_REASON, timestamp__gte=start, timestamp__lt=end))
+        batch = []
+        for record in _read_archive(path):
+            if record['product_id'] not in existing:
+                continue
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            batch.append(StockHistory(**record))
+            if len(batch) == 1000:
+                restored += len(StockHistory.objects.bulk_create(batch))
+                batch = []
+        restored += len(StockHistory.objects.bulk_create(batch))
+        products_bulk_changed.send(sender=StockHistory, product_ids=list(existing))
+        transaction.on_commit(lambda: os.remove(path))
+    return restored
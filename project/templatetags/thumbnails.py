@@ -0,0 +1,13 @@
+from django import template
+
+from project.thumbnails import responsive_img
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, variants, sizes, alt='', **attrs):
+    """
+    {% responsive_image product_image.image product_image.image_variants "50px" alt=... class=... %}
+    """
+    return responsive_img(image, variants, sizes, alt, **attrs)
@@ -1,3 +1,1482 @@
-from django.test import TestCase
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import tablib
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import exports, pricing, stock_archive, thumbnails, write_queue
+from .models import LowStockAlert, PlatformFeeConfig, Product, ProductImage, Sale, SalesDailyRollup, StockHistory, StockSnapshot, Supplier, Vendor, sales_bulk_registered
+from .resources import ProductResource, SaleResource
+from .utils import send_low_stock_digest
+from .write_queue import WriteQueue
+
+
+class PricingEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Supplier.objects.create(name='Fornecedor')
+        cls.products = [
+            Product.objects.create(
+                product_code=f'P{i:03d}',
+                name=f'Produto {i}',
+                supplier=cls.supplier if i % 2 else None,
+                cost_price=Decimal('0.37') * (i * 13 + 1),
+                recommended_price=Decimal('1.99') * (i + 1),
+                negotiation_margin=Decimal('7.25') * (i % 5),
+            )
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.config = PlatformFeeConfig.objects.create(cost_fixed=Decimal('1.15'), physical_margin=Decimal('32.50'), highlight_active=True)
+
+    def test_reprice_matches_product_properties(self):
+        rows = {row['product_code']: row for row in pricing.reprice(Product.objects.all(), self.config)}
+        self.assertEqual(len(rows), len(self.products))
+        for product in Product.objects.all():
+            row = rows[product.product_code]
+            self.assertEqual(row['vf_fisica'], product.vf_fisica)
+            self.assertEqual(row['vf_shopee'], product.vf_shopee)
+            self.assertEqual(row['min_price_allowed'], product.min_price_allowed)
+
+    def test_current_config_is_reloaded_after_ttl(self):
+        self.assertEqual(PlatformFeeConfig.current(), self.config)
+        # As another process would save it: the version stamp in this process's cache stays
+        PlatformFeeConfig.objects.filter(pk=self.config.pk).update(shopee_commission=Decimal('20.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(PlatformFeeConfig.current().shopee_commission, Decimal('14.00'))
+        with override_settings(PLATFORM_FEE_CONFIG_TTL=-1):
+            self.assertEqual(PlatformFeeConfig.current().shopee_commission, Decimal('20.00'))
+
+    def test_reprice_without_config(self):
+        row = next(pricing.reprice(Product.objects.all(), None))
+        self.assertIsNone(row['vf_fisica'])
+        self.assertIsNone(row['vf_shopee'])
+
+    def test_simulate_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('user', password='senha'))
+        url = reverse('pricing-simulate')
+
+        response = client.post(f'{url}?supplier={self.supplier.pk}', {'shopee_commission': '16.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['simulated_config']['shopee_commission'], '16.00')
+        self.assertEqual(payload['summary']['product_count'], self.supplier.products.count())
+
+        simulated = PlatformFeeConfig(**{field: getattr(self.config, field) for field in pricing.PRICING_FIELDS})
+        simulated.shopee_commission = Decimal('16.00')
+        factors = pricing.FeeFactors(simulated)
+        for row in payload['results']:
+            product = Product.objects.get(product_code=row['product_code'])
+            self.assertEqual(Decimal(row['vf_shopee']), product.vf_shopee)
+            self.assertEqual(Decimal(row['new_vf_shopee']), factors.vf_shopee(product.cost_price))
+            self.assertEqual(Decimal(row['vf_fisica_delta']), Decimal('0.00'))
+            self.assertGreater(Decimal(row['shopee_margin_delta']), 0)
+
+        # Nothing is persisted
+        self.config.refresh_from_db()
+        self.assertEqual(self.config.shopee_commission, Decimal('14.00'))
+
+        response = client.post(url, {'shopee_commission': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductAdminQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'senha')
+        PlatformFeeConfig.objects.create()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add_products(self, count):
+        start = Product.objects.count()
+        for i in range(start, start + count):
+            product = Product.objects.create(
+                product_code=f'P{i:03d}', name=f'Produto {i}', recommended_price=Decimal('10.00'),
+                supplier=Supplier.objects.create(name=f'Fornecedor {i}'),
+            )
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=f'products/{product.pk}/images/{position}.png', position=position)
+                for position in range(2)
+            ])
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:project_product_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        self.add_products(3)
+        self.changelist_queries()  # loads the cached fee config
+        small_page = self.changelist_queries()
+        self.add_products(30)
+        self.assertEqual(self.changelist_queries(), small_page)
+
+    def test_changelist_shows_first_image(self):
+        self.add_products(1)
+        response = self.client.get(reverse('admin:project_product_changelist'))
+        self.assertContains(response, '/images/0.png')
+        self.assertNotContains(response, '/images/1.png')
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root, THUMBNAIL_ASYNC=False)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.product = Product.objects.create(product_code='P001', name='Produto', recommended_price=Decimal('10.00'))
+
+    def upload(self, width=800, height=400, name='foto.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def add_image(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=self.upload(**kwargs))
+        image.refresh_from_db()
+        return image
+
+    def test_variants_are_built_after_commit(self):
+        image = self.add_image()
+        self.assertEqual(image.image_variants['source'], image.image.name)
+        self.assertEqual(sorted(int(key) for key in image.image_variants if key != 'source'), [64, 160, 320, 640])
+        storage = image.image.storage
+        with storage.open(image.image_variants['160']) as variant:
+            self.assertEqual(Image.open(variant).size, (160, 80))
+
+    def test_small_images_are_not_upscaled(self):
+        image = self.add_image(width=200, height=100)
+        self.assertEqual(sorted(int(key) for key in image.image_variants if key != 'source'), [64, 160, 200])
+
+    def test_replaced_image_drops_old_variants(self):
+        image = self.add_image()
+        old_variants = dict(image.image_variants)
+        image.image = self.upload(name='outra.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        image.refresh_from_db()
+        self.assertEqual(image.image_variants['source'], image.image.name)
+        storage = image.image.storage
+        self.assertFalse(any(storage.exists(name) for key, name in old_variants.items() if key != 'source'))
+
+    def test_cleared_vendor_image_drops_its_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            vendor = Vendor.objects.create(name='Ana', profile_image=self.upload())
+        vendor.refresh_from_db()
+        storage = vendor.profile_image.storage
+        variants = [name for key, name in vendor.profile_image_variants.items() if key != 'source']
+        self.assertTrue(variants)
+
+        # Cleared straight in the column, as older rows and queryset updates leave it: NULL, not ''
+        Vendor.objects.filter(pk=vendor.pk).update(profile_image=None)
+        self.assertFalse(thumbnails.build_variants(Vendor, vendor.pk, 'profile_image'))
+        vendor.refresh_from_db()
+        self.assertEqual(vendor.profile_image_variants, {})
+        self.assertFalse(any(storage.exists(name) for name in variants))
+
+    def test_product_list_serves_srcset(self):
+        image = self.add_image()
+        self.client.force_login(get_user_model().objects.create_user('vendedor', password='senha'))
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, 'srcset="')
+        self.assertContains(response, image.image.storage.url(image.image_variants['320']) + ' 320w')
+
+
+@override_settings(LOW_STOCK_THRESHOLD=5, LOW_STOCK_ALERT_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class LowStockAlertTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=6)
+
+    def sell(self, quantity=1, product=None):
+        Sale.objects.create(product=product or self.product, quantity=quantity, total_price=Decimal('10.00') * quantity)
+
+    def test_sales_queue_one_alert_per_product_without_mailing(self):
+        for _ in range(4):
+            self.sell()
+        self.assertEqual(len(mail.outbox), 0)
+        alert = LowStockAlert.objects.get()
+        self.assertIsNone(alert.sent_at)
+        self.assertEqual(alert.stock, 2)
+
+    def test_digest_groups_products_in_one_email(self):
+        other = Product.objects.create(product_code='P002', name='Prato', recommended_price=Decimal('10.00'), stock=2)
+        self.sell(2)
+        self.sell(product=other)
+
+        self.assertEqual(send_low_stock_digest(), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Caneca', mail.outbox[0].body)
+        self.assertIn('Prato', mail.outbox[0].body)
+        self.assertFalse(LowStockAlert.objects.filter(sent_at__isnull=True).exists())
+
+        self.assertEqual(send_low_stock_digest(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_restocked_products_are_skipped(self):
+        self.sell(2)
+        Product.objects.filter(pk=self.product.pk).update(stock=50)
+        self.assertEqual(send_low_stock_digest(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_overlapping_digests_claim_each_alert_once(self):
+        self.sell(2)
+        # Both digests listed the alert before either claimed it
+        listed = list(LowStockAlert.objects.filter(sent_at__isnull=True))
+        self.assertEqual(LowStockAlert.claim(listed), listed)
+        self.assertEqual(LowStockAlert.claim(listed), [])
+
+        other = Product.objects.create(product_code='P002', name='Prato', recommended_price=Decimal('10.00'), stock=2)
+        self.sell(product=other)
+        self.assertEqual(send_low_stock_digest(), 1)
+        self.assertNotIn('Caneca', mail.outbox[0].body)
+
+    @override_settings(LOW_STOCK_ALERT_EMAIL_BACKEND='project.tests.FailingEmailBackend')
+    def test_failed_digest_keeps_alerts_pending(self):
+        self.sell(2)
+        with self.assertRaises(ConnectionError):
+            send_low_stock_digest()
+        self.assertTrue(LowStockAlert.objects.filter(sent_at__isnull=True).exists())
+
+    @override_settings(LOW_STOCK_ALERT_EMAIL_BACKEND='project.tests.AlertingThenFailingEmailBackend')
+    def test_failed_digest_folds_into_alerts_queued_meanwhile(self):
+        self.sell(2)
+        with self.assertRaises(ConnectionError):
+            send_low_stock_digest()
+        alert = LowStockAlert.objects.get()
+        self.assertIsNone(alert.sent_at)
+        self.assertEqual(alert.event_count, 2)
+
+
+class SaleStockTests(TransactionTestCase):
+    SALES = 300
+    THREADS = 16
+
+    def setUp(self):
+        self.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=1000)
+
+    def sell(self, quantity=1):
+        # SQLite lets one writer in at a time; retry when the lock wait gives up
+        for attempt in range(50):
+            try:
+                Sale.objects.create(product_id=self.product.pk, quantity=quantity, total_price=Decimal('10.00'))
+                return True
+            except OperationalError:
+                time.sleep(0.01 * (attempt + 1))
+            except ValidationError:
+                return False
+            finally:
+                close_old_connections()
+        raise AssertionError('venda não registrada')
+
+    def sell_in_parallel(self, count):
+        def sell(_):
+            try:
+                return self.sell()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            return sum(executor.map(sell, range(count)))
+
+    def assertLedgerMatchesStock(self):
+        self.product.refresh_from_db()
+        ledger = StockHistory.objects.filter(product=self.product).aggregate(total=Sum('change'))['total']
+        self.assertEqual(self.product.stock, ledger)
+        sold = Sale.objects.filter(product=self.product).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual(self.product.stock, 1000 - sold)
+
+    def test_parallel_sales_do_not_lose_updates(self):
+        self.assertEqual(self.sell_in_parallel(self.SALES), self.SALES)
+        self.assertLedgerMatchesStock()
+        self.assertEqual(self.product.stock, 1000 - self.SALES)
+        self.assertFalse(StockHistory.objects.filter(reason='manual_adjustment').exists())
+
+    @override_settings(ALLOW_NEGATIVE_STOCK=False)
+    def test_parallel_sales_never_oversell(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=40)
+        StockHistory.objects.create(product=self.product, change=-960, reason='manual_adjustment')
+        self.assertEqual(self.sell_in_parallel(100), 40)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 40)
+        ledger = StockHistory.objects.filter(product=self.product).aggregate(total=Sum('change'))['total']
+        self.assertEqual(ledger, 0)
+
+
+class SaleBulkAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        cls.supplier = Supplier.objects.create(name='Fornecedor')
+        cls.vendor = Vendor.objects.create(name='Vendedor')
+        cls.products = [
+            Product.objects.create(product_code=f'P{i:03d}', name=f'Produto {i}', recommended_price=Decimal('10.00'), stock=100, supplier=cls.supplier)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('sale-bulk')
+
+    def rows(self, count):
+        return [
+            {
+                'product_code': self.products[i % 3].product_code,
+                'vendor': self.vendor.pk if i % 2 else None,
+                'quantity': 1 + i % 2,
+                'total_price': '10.00',
+                'platform': 'shopee',
+                'sale_date': f'2026-03-{1 + i % 5:02d}T12:00:00-03:00',
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create_matches_per_sale_path(self):
+        rows = self.rows(60)
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 60)
+
+        for product in self.products:
+            product.refresh_from_db()
+            sold = Sale.objects.filter(product=product).aggregate(total=Sum('quantity'))['total']
+            ledger = StockHistory.objects.filter(product=product).aggregate(total=Sum('change'))['total']
+            self.assertEqual(product.stock, 100 - sold)
+            self.assertEqual(product.stock, ledger)
+
+        live = list(SalesDailyRollup.objects.values_list('day', 'product', 'vendor', 'platform', 'revenue', 'quantity', 'sale_count').order_by('day', 'product', 'vendor'))
+        SalesDailyRollup.rebuild()
+        rebuilt = list(SalesDailyRollup.objects.values_list('day', 'product', 'vendor', 'platform', 'revenue', 'quantity', 'sale_count').order_by('day', 'product', 'vendor'))
+        self.assertEqual(live, rebuilt)
+
+        # Per product and per insert batch, never per row
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(self.url, self.rows(600), format='json').status_code, 201)
+        self.assertLess(len(queries), 40)
+
+    def test_invalid_rows_are_reported_and_nothing_is_saved(self):
+        rows = self.rows(5)
+        rows[1]['product_code'] = 'NAO-EXISTE'
+        rows[3]['quantity'] = 0
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '3'})
+        self.assertFalse(Sale.objects.exists())
+
+    @override_settings(ALLOW_NEGATIVE_STOCK=False)
+    def test_rows_beyond_stock_are_rejected(self):
+        rows = [{'product': str(self.products[0].pk), 'quantity': 60, 'total_price': '10.00'} for _ in range(2)]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['1'])
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 100)
+
+    @override_settings(LOW_STOCK_THRESHOLD=5)
+    def test_one_low_stock_alert_per_product(self):
+        rows = [{'product_code': 'P000', 'quantity': 1, 'total_price': '10.00'} for _ in range(98)]
+        self.assertEqual(self.client.post(self.url, rows, format='json').status_code, 201)
+        alert = LowStockAlert.objects.get()
+        self.assertEqual((alert.product_id, alert.stock, alert.event_count), (self.products[0].pk, 2, 1))
+
+
+class ProductChangeTrackingTests(TestCase):
+    def setUp(self):
+        Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=10)
+        self.product = Product.objects.get(product_code='P001')
+
+    def product_reads(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "project_product"' in query['sql']]
+
+    def test_save_writes_changed_columns_only(self):
+        self.product.stock = 7
+        with CaptureQueriesContext(connection) as queries:
+            self.product.save()
+        # Only the stock is read back, for the ledger
+        self.assertEqual([sql.split(' FROM ')[0] for sql in self.product_reads(queries)], ['SELECT "project_product"."stock" AS "stock"'])
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE "project_product"'))
+        self.assertIn('"stock"', update)
+        self.assertNotIn('"name"', update)
+        self.assertEqual(StockHistory.objects.get(reason='manual_adjustment').change, -3)
+
+        # Tracking restarts from the saved values
+        self.product.name = 'Caneca Azul'
+        with CaptureQueriesContext(connection) as queries:
+            self.product.save()
+        self.assertEqual(self.product_reads(queries), [])
+        self.assertEqual(StockHistory.objects.filter(reason='manual_adjustment').count(), 1)
+
+    def test_stock_change_is_measured_from_the_committed_stock(self):
+        # A sale commits between loading the product and saving it
+        self.product.refresh_from_db()
+        Sale.objects.create(product=Product.objects.get(pk=self.product.pk), quantity=3, total_price=Decimal('30.00'))
+        self.product.stock = 12
+        self.product.save()
+        self.assertEqual(StockHistory.objects.get(reason='manual_adjustment').change, 5)
+        self.assertEqual(StockHistory.objects.filter(product=self.product).aggregate(total=Sum('change'))['total'], 12)
+
+    def test_save_does_not_overwrite_concurrent_stock_changes(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=4)
+        self.product.name = 'Caneca Azul'
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock), ('Caneca Azul', 4))
+        self.assertFalse(StockHistory.objects.filter(reason='manual_adjustment').exists())
+
+    def test_refresh_resets_tracking(self):
+        self.product.remove_stock(2)
+        self.assertEqual(self.product.get_dirty_fields(), [])
+        self.product.stock = 5
+        self.assertEqual(self.product.get_dirty_fields(), ['stock'])
+        self.product.save()
+        self.assertEqual(StockHistory.objects.get(reason='manual_adjustment').change, -3)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=10)
+
+    def test_every_change_records_the_resulting_balance(self):
+        Sale.objects.create(product=self.product, quantity=3, total_price=Decimal('30.00'))
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 20
+        product.save()
+        Sale.bulk_register([Sale(product=product, quantity=2, total_price=Decimal('20.00')) for _ in range(2)])
+
+        rows = list(StockHistory.objects.filter(product=product).order_by('timestamp', 'id').values_list('change', 'balance'))
+        self.assertEqual(rows, [(10, 10), (-3, 7), (13, 20), (-2, 18), (-2, 16)])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 16)
+        self.assertEqual(StockSnapshot.objects.get(product=product).balance, 16)
+
+    def move_history_to(self, *days):
+        # Spread the ledger rows over past days (timestamp is auto_now_add)
+        tz = timezone.get_current_timezone()
+        for row, day in zip(StockHistory.objects.order_by('timestamp', 'id'), days):
+            StockHistory.objects.filter(pk=row.pk).update(timestamp=datetime.combine(day, datetime.min.time().replace(hour=12), tz))
+        StockSnapshot.rebuild()
+
+    def test_as_of_reads_one_snapshot_per_product(self):
+        for _ in range(3):
+            Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'))
+        self.move_history_to(date(2026, 3, 1), date(2026, 3, 1), date(2026, 3, 5), date(2026, 3, 9))
+
+        with self.assertNumQueries(1):
+            balances = StockSnapshot.as_of([self.product.pk], date(2026, 3, 6))
+        self.assertEqual(balances, {self.product.pk: 8})
+        self.assertEqual(StockSnapshot.as_of([self.product.pk], date(2026, 2, 28)), {self.product.pk: 0})
+
+    def test_stock_over_time_endpoint(self):
+        Sale.objects.create(product=self.product, quantity=4, total_price=Decimal('40.00'))
+        self.move_history_to(date(2026, 3, 1), date(2026, 3, 3))
+
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('user', password='senha'))
+        response = client.get(reverse('stock-over-time'), {'product': 'P001', 'start_date': '2026-02-28', 'end_date': '2026-03-04'})
+        self.assertEqual(response.status_code, 200)
+        series = response.json()['products'][0]['series']
+        self.assertEqual([point['stock'] for point in series], [0, 10, 10, 6, 6])
+
+        self.assertEqual(client.get(reverse('stock-over-time')).status_code, 400)
+        response = client.get(reverse('stock-over-time'), {'product': 'P001', 'start_date': '2026-03-04', 'end_date': '2026-03-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StockArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        override = override_settings(STOCK_HISTORY_ARCHIVE_DIR=self.archive_dir, STOCK_HISTORY_HORIZON_DAYS=365)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=50)
+        for _ in range(4):
+            Sale.objects.create(product=self.product, quantity=2, total_price=Decimal('20.00'))
+        # initial stock and two sales in March 2024, two sales in April 2024, one recent sale
+        tz = timezone.get_current_timezone()
+        days = [date(2024, 3, 1), date(2024, 3, 10), date(2024, 3, 20), date(2024, 4, 2), date(2024, 4, 30)]
+        for row, day in zip(StockHistory.objects.order_by('timestamp', 'id'), days):
+            StockHistory.objects.filter(pk=row.pk).update(timestamp=datetime.combine(day, datetime.min.time(), tz))
+        StockSnapshot.rebuild()
+        Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'))
+
+    def test_compact_and_restore(self):
+        raw = list(StockHistory.objects.order_by('id').values_list('id', 'change', 'balance', 'reason'))
+        as_of = StockSnapshot.as_of([self.product.pk], date(2024, 3, 31))
+
+        call_command('archive_stock_history', stdout=StringIO())
+        summaries = list(StockHistory.objects.filter(reason='monthly_summary').order_by('timestamp').values_list('change', 'balance'))
+        self.assertEqual(summaries, [(46, 46), (-4, 42)])
+        self.assertEqual(StockHistory.objects.exclude(reason='monthly_summary').count(), 1)
+        self.assertEqual(StockSnapshot.as_of([self.product.pk], date(2024, 3, 31)), as_of)
+        self.assertEqual(len(os.listdir(os.path.join(self.archive_dir, '2024'))), 2)
+
+        # Running again changes nothing
+        call_command('archive_stock_history', stdout=StringIO())
+        self.assertEqual(StockHistory.objects.count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_stock_history', restore=[date(2024, 3, 1), date(2024, 4, 1)], stdout=StringIO())
+        self.assertEqual(list(StockHistory.objects.order_by('id').values_list('id', 'change', 'balance', 'reason')), raw)
+        self.assertEqual(os.listdir(os.path.join(self.archive_dir, '2024')), [])
+
+    def test_compaction_deletes_in_batches_without_row_signals(self):
+        deleted = []
+        receiver = lambda sender, instance, **kwargs: deleted.append(instance)
+        post_delete.connect(receiver, sender=StockHistory)
+        self.addCleanup(post_delete.disconnect, receiver, sender=StockHistory)
+        self.addCleanup(setattr, stock_archive, 'DELETE_BATCH_SIZE', stock_archive.DELETE_BATCH_SIZE)
+        stock_archive.DELETE_BATCH_SIZE = 2
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(stock_archive.compact_month(date(2024, 3, 1), self.archive_dir), (3, 1))
+        self.assertEqual(deleted, [])
+        self.assertEqual(sum(query['sql'].startswith('DELETE') for query in queries), 2)
+        self.assertEqual(StockHistory.objects.filter(timestamp__month=3).values_list('reason', flat=True).get(), 'monthly_summary')
+
+    def test_product_page_shows_recent_history_only(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'senha')
+        self.client.force_login(user)
+        with override_settings(STOCK_HISTORY_INLINE_ROWS=2):
+            response = self.client.get(reverse('admin:project_product_change', args=[self.product.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['inline_admin_formsets'][1].formset.initial_form_count(), 2)
+        link = reverse('admin:project_stockhistory_changelist') + f'?product__id__exact={self.product.pk}'
+        self.assertContains(response, link)
+        response = self.client.get(link)
+        self.assertEqual(response.context['cl'].result_count, 6)
+
+
+def use_file_database(test_case, profile='production'):
+    """
+    Points the default alias at a migrated database file with the given SQLite profile
+    until the test ends, for other connections and processes to share.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, tmp_dir, True)
+    profile = settings.SQLITE_PROFILES[profile]
+    test_settings, test_connection = connections.settings['default'], connections['default']
+    connections.settings['default'] = {
+        **connection.settings_dict,
+        'NAME': os.path.join(tmp_dir, 'test.sqlite3'),
+        'OPTIONS': profile['OPTIONS'],
+        'PRAGMAS': profile['PRAGMAS'],
+    }
+    connections['default'] = connections.create_connection('default')
+
+    def restore():
+        connections['default'].close()
+        connections.settings['default'], connections['default'] = test_settings, test_connection
+    test_case.addCleanup(restore)
+    call_command('migrate', verbosity=0)
+
+
+class StockReconciliationTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(product_code=f'P00{i}', name=f'Produto {i}', recommended_price=Decimal('10.00'), stock=20)
+            for i in range(5)
+        ]
+        for product in self.products:
+            Sale.objects.create(product=product, quantity=3, total_price=Decimal('30.00'))
+        # Stock changed behind the ledger's back
+        Product.objects.filter(pk__in=[self.products[1].pk, self.products[3].pk]).update(stock=10)
+
+    def test_reports_and_fixes_drift(self):
+        out = StringIO()
+        with self.assertNumQueries(1 + 3):
+            call_command('reconcile_stock', workers=1, chunk_size=2, stdout=out)
+        self.assertIn('5 produto(s) conferido(s) em 3 bloco(s)', out.getvalue())
+        self.assertIn('2 produto(s) com divergência', out.getvalue())
+        self.assertIn('P001: estoque 10, histórico 17 (diferença -7)', out.getvalue())
+        self.assertEqual(StockHistory.objects.filter(reason='manual_adjustment').count(), 0)
+
+        call_command('reconcile_stock', workers=1, fix=True, stdout=StringIO())
+        adjustments = StockHistory.objects.filter(reason='manual_adjustment')
+        self.assertEqual(sorted(adjustments.values_list('change', 'balance')), [(-7, 10), (-7, 10)])
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock, 10)
+
+        out = StringIO()
+        call_command('reconcile_stock', workers=1, stdout=out)
+        self.assertIn('Nenhuma divergência encontrada.', out.getvalue())
+
+
+class ParallelReconciliationTests(TransactionTestCase):
+    def setUp(self):
+        use_file_database(self, 'default')
+        products = [
+            Product.objects.create(product_code=f'P00{i}', name=f'Produto {i}', recommended_price=Decimal('10.00'), stock=20)
+            for i in range(5)
+        ]
+        Product.objects.filter(pk=products[2].pk).update(stock=10)
+
+    def test_workers_run_where_spawn_is_the_default(self):
+        start_method = multiprocessing.get_start_method()
+        multiprocessing.set_start_method('spawn', force=True)
+        self.addCleanup(multiprocessing.set_start_method, start_method, force=True)
+
+        out = StringIO()
+        call_command('reconcile_stock', workers=2, chunk_size=2, stdout=out)
+        self.assertIn('5 produto(s) conferido(s) em 3 bloco(s)', out.getvalue())
+        self.assertIn('P002: estoque 10, histórico 20 (diferença -10)', out.getvalue())
+
+
+class RecordImportTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=100)
+        self.vendor = Vendor.objects.create(name='Ana')
+
+    def write_csv(self, name, header, rows):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            csv_file.write(header + '\n')
+            csv_file.writelines(row + '\n' for row in rows)
+        return path
+
+    def test_sales_import_in_chunks(self):
+        rows = [f'P001,Ana,2,20.00,shopee,2024-05-{day:02d} 10:00:00' for day in range(1, 13)]
+        path = self.write_csv('vendas.csv', 'product_code,vendor,quantity,total_price,platform,sale_date', rows)
+        out = StringIO()
+        call_command('import_records', 'sales', path, chunk_size=5, stdout=out)
+        self.assertIn('10 linha(s) processada(s)', out.getvalue())
+        self.assertIn('12 linha(s) importada(s)', out.getvalue())
+        self.assertEqual(Sale.objects.filter(vendor=self.vendor, platform='shopee').count(), 12)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 76)
+        self.assertEqual(StockHistory.objects.filter(reason='sale').order_by('id').last().balance, 76)
+        self.assertEqual(SalesDailyRollup.objects.aggregate(total=Sum('quantity'))['total'], 24)
+
+        # An export imported back is recognized by id and skipped
+        export = os.path.join(self.tmp_dir, 'export.csv')
+        with open(export, 'w', encoding='utf-8') as csv_file:
+            csv_file.write(SaleResource().export().csv)
+        out = StringIO()
+        call_command('import_records', 'sales', export, stdout=out)
+        self.assertIn('0 linha(s) importada(s), 12 já existente(s) ignorada(s)', out.getvalue())
+        self.assertEqual(Sale.objects.count(), 12)
+
+    def test_invalid_chunk_stops_the_import(self):
+        rows = ['P001,,1,10.00,loja_fisica,2024-05-01 10:00:00'] * 6 + ['P999,,1,10.00,loja_fisica,2024-05-01 10:00:00']
+        path = self.write_csv('vendas.csv', 'product_code,vendor,quantity,total_price,platform,sale_date', rows)
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '--start-row 6'):
+            call_command('import_records', 'sales', path, chunk_size=5, stdout=StringIO(), stderr=err)
+        self.assertIn('Linha 7: product_code', err.getvalue())
+        self.assertEqual(Sale.objects.count(), 5)
+
+    def test_stock_history_import_fills_balances(self):
+        rows = ['P001,10,new_stock,,2024-05-01 10:00:00', 'P001,-4,manual_adjustment,,2024-05-02 10:00:00']
+        path = self.write_csv('historico.csv', 'product_code,change,reason,balance,timestamp', rows)
+        call_command('import_records', 'stock_history', path, stdout=StringIO())
+        imported = StockHistory.objects.filter(reason__in=['new_stock', 'manual_adjustment']).order_by('timestamp')
+        self.assertEqual(list(imported.values_list('change', 'balance')), [(10, 110), (-4, 106)])
+        self.assertEqual(StockSnapshot.as_of([self.product.pk], date(2024, 5, 2)), {self.product.pk: 106})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 100)
+
+
+class ProductImportTests(TestCase):
+    def test_bulk_import_creates_and_updates_by_code(self):
+        existing_supplier = Supplier.objects.create(name='Acme')
+        product = Product.objects.create(product_code='P000', name='Caneca', recommended_price=Decimal('10.00'), stock=20, supplier=existing_supplier)
+        headers = ['product_code', 'name', 'supplier__name', 'recommended_price', 'stock']
+        rows = [['P000', 'Caneca', 'Nova Distribuidora', '12.00', '2']]
+        rows += [[f'P{i:03d}', f'Produto {i}', 'Acme' if i % 2 else 'Nova Distribuidora', '10.00', str(i)] for i in range(1, 41)]
+        dataset = tablib.Dataset(*rows, headers=headers)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = ProductResource().import_data(dataset)
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        self.assertEqual((result.totals['new'], result.totals['update']), (40, 1))
+        self.assertLess(len(queries), 25)
+
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.recommended_price, product.supplier.name), (2, Decimal('12.00'), 'Nova Distribuidora'))
+        self.assertEqual(Supplier.objects.filter(name='Nova Distribuidora').count(), 1)
+        self.assertEqual(Product.objects.get(product_code='P003').supplier, existing_supplier)
+        self.assertEqual(list(product.stock_history.filter(reason='manual_adjustment').values_list('change', 'balance')), [(-18, 2)])
+        self.assertEqual(StockHistory.objects.filter(reason='initial_stock', product__product_code='P007').get().balance, 7)
+        self.assertEqual(StockSnapshot.as_of([product.pk], timezone.localdate()), {product.pk: 2})
+        self.assertTrue(LowStockAlert.objects.filter(product=product).exists())
+
+    def test_export_imports_back_with_its_timestamps(self):
+        product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=20)
+        created_at = product.created_at
+        # Each export is taken after the previous one was imported back
+        for name, export in (
+            ('admin', lambda: ProductResource().export()),
+            ('streaming', lambda: tablib.Dataset().load(''.join(exports.stream_export(Product.objects.all(), exports.PRODUCT_COLUMNS, 'csv', 100)), format='csv')),
+        ):
+            with self.subTest(export=name):
+                dataset = export()
+                self.assertIn('updated_at', dataset.headers)
+                updated_at = Product.objects.get(pk=product.pk).updated_at
+                row = dict(zip(dataset.headers, dataset[0]))
+                row['name'] = f'Caneca ({name})'
+                row['stock'] = str(int(row['stock']) - 1)
+                dataset = tablib.Dataset([row[header] for header in dataset.headers], headers=dataset.headers)
+
+                result = ProductResource().import_data(dataset)
+                self.assertFalse(result.has_errors() or result.has_validation_errors(), [error.error for row_errors in result.row_errors() for error in row_errors[1]])
+                saved = Product.objects.get(pk=product.pk)
+                self.assertEqual(saved.name, row['name'])
+                self.assertEqual(saved.stock, int(row['stock']))
+                self.assertEqual(saved.created_at, created_at)
+                self.assertGreater(saved.updated_at, updated_at)
+
+
+class StreamingExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        cls.vendor = Vendor.objects.create(name='Ana')
+        cls.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=100)
+        for i in range(7):
+            Sale.objects.create(product=cls.product, vendor=cls.vendor if i % 2 else None, quantity=1,
+                                total_price=Decimal('10.00'), platform='shopee' if i < 5 else 'loja_fisica')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, name, export_format, params=None):
+        response = self.client.get(reverse(name, kwargs={'export_format': export_format}), params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_sales_csv_is_streamed_with_filters(self):
+        response, content = self.export('sale-export', 'csv', {'platform': 'shopee', 'product': str(self.product.pk)})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="vendas-', response['Content-Disposition'])
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,product_code,vendor,quantity,total_price,platform,sale_date')
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[2].split(',')[1:6], ['P001', 'Ana', '1', '10.00', 'shopee'])
+        # Chunks of EXPORT_CHUNK_SIZE rows, the header riding with the first
+        response = self.client.get(reverse('sale-export', kwargs={'export_format': 'csv'}))
+        self.assertEqual(len(list(response.streaming_content)), 4)
+
+    def test_jsonl_and_query_count(self):
+        with self.assertNumQueries(1):
+            response, content = self.export('stock-history-export', 'jsonl', {'reason': 'sale'})
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[-1], {**rows[-1], 'product_code': 'P001', 'change': -1, 'reason': 'sale', 'balance': 93})
+
+        response, content = self.export('product-export', 'jsonl', {'min_stock': 50})
+        self.assertEqual([row['product_code'] for row in map(json.loads, content.splitlines())], ['P001'])
+
+    def test_invalid_filter(self):
+        response = self.client.get(reverse('sale-export', kwargs={'export_format': 'csv'}), {'start_date': 'ontem'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start_date', response.json())
+
+
+class SqliteProfileTests(TestCase):
+    def open_connection(self, profile):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        profile = settings.SQLITE_PROFILES[profile]
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(tmp_dir, 'profile.sqlite3'),
+            'OPTIONS': profile['OPTIONS'],
+            'PRAGMAS': profile['PRAGMAS'],
+        }, alias='profile_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_production_profile_is_applied_to_new_connections(self):
+        wrapper = self.open_connection('production')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -65536)
+
+        # Reopening applies them again
+        wrapper.close()
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+
+    def test_default_profile_keeps_sqlite_defaults(self):
+        wrapper = self.open_connection('default')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)  # FULL
+
+
+@override_settings(WRITE_QUEUE_BATCH_WINDOW=0.2, WRITE_QUEUE_MAX_BATCH=3)
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.queue = WriteQueue()
+        self.addCleanup(self.queue.stop)
+        self.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=2)
+
+    def test_writes_arriving_together_share_one_transaction(self):
+        def write(name):
+            Supplier.objects.create(name=name)
+            return connection.atomic_blocks[0]
+
+        futures = [self.queue.submit(write, f'Fornecedor {i}') for i in range(4)]
+        transactions = [future.result(timeout=5) for future in futures]
+        self.assertIs(transactions[0], transactions[1])
+        self.assertIs(transactions[0], transactions[2])
+        self.assertIsNot(transactions[0], transactions[3])  # past WRITE_QUEUE_MAX_BATCH
+        self.assertEqual(Supplier.objects.count(), 4)
+
+    def test_failing_write_only_undoes_itself(self):
+        def fail():
+            Supplier.objects.create(name='B')
+            raise ValueError('falhou')
+
+        first = self.queue.submit(Supplier.objects.create, name='A')
+        failing = self.queue.submit(fail)
+        last = self.queue.submit(Supplier.objects.create, name='C')
+        self.assertEqual(first.result(timeout=5).name, 'A')
+        with self.assertRaisesMessage(ValueError, 'falhou'):
+            failing.result(timeout=5)
+        self.assertEqual(last.result(timeout=5).name, 'C')
+        self.assertEqual(sorted(Supplier.objects.values_list('name', flat=True)), ['A', 'C'])
+
+    @override_settings(ALLOW_NEGATIVE_STOCK=False)
+    def test_batched_sales_are_registered_together_and_errors_reach_their_caller(self):
+        futures = [
+            self.queue.submit_batched(Sale.bulk_register, Sale(product=self.product, quantity=1, total_price=Decimal('10.00')))
+            for _ in range(3)
+        ]
+        self.assertIsNotNone(futures[0].result(timeout=5).pk)
+        self.assertIsNotNone(futures[1].result(timeout=5).pk)
+        with self.assertRaises(ValidationError):
+            futures[2].result(timeout=5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(StockHistory.objects.filter(reason='sale').count(), 2)
+
+    @override_settings(WRITE_QUEUE_ENABLED=True)
+    def test_api_writes_go_through_the_writer_thread(self):
+        self.addCleanup(write_queue.writer.stop)
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('user', password='senha'))
+        threads = []
+
+        def record_thread(sender, **kwargs):
+            threads.append(threading.current_thread().name)
+
+        post_save.connect(record_thread, sender=StockHistory)
+        self.addCleanup(post_save.disconnect, record_thread, sender=StockHistory)
+        sales_bulk_registered.connect(record_thread)
+        self.addCleanup(sales_bulk_registered.disconnect, record_thread)
+
+        response = client.patch(reverse('product-detail', args=[self.product.pk]), {'stock': 7}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = client.post(reverse('sale-bulk'), [{'product_code': 'P001', 'total_price': '10.00'}], format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(threads, ['write-queue', 'write-queue'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+        self.assertEqual(list(StockHistory.objects.order_by('id').values_list('reason', 'balance')), [
+            ('initial_stock', 2), ('manual_adjustment', 7), ('sale', 6),
+        ])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        cls.product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=100)
+        start = timezone.make_aware(datetime(2026, 3, 1, 12, 0))
+        # Three sales share a timestamp, so pages must break ties on the id
+        for offset in (0, 1, 1, 1, 2, 3, 4):
+            Sale.objects.create(product=cls.product, quantity=1, total_price=Decimal('10.00'), sale_date=start + timedelta(minutes=offset))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_ids(self):
+        return list(Sale.objects.order_by('-sale_date', '-id').values_list('pk', flat=True))
+
+    def walk(self, url):
+        ids = []
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            ids.extend(sale['id'] for sale in data['results'])
+            url = data['next']
+        return ids, pages
+
+    def test_pages_return_every_sale_once_in_key_order(self):
+        ids, pages = self.walk(reverse('sale-list') + '?page_size=2')
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(len(pages), 4)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Going back from the last page gives the page before it
+        previous = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(previous['results'], pages[-2]['results'])
+        self.assertIsNotNone(previous['next'])
+
+    def test_new_sales_do_not_shift_later_pages(self):
+        expected = self.expected_ids()
+        first = self.client.get(reverse('sale-list'), {'page_size': 3}).json()
+        Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'))
+        ids, _ = self.walk(first['next'])
+        self.assertEqual([sale['id'] for sale in first['results']] + ids, expected)
+
+    def test_pages_seek_instead_of_offset(self):
+        first = self.client.get(reverse('sale-list'), {'page_size': 2}).json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first['next'])
+        sale_queries = [query['sql'] for query in ctx.captured_queries if 'FROM "project_sale"' in query['sql']]
+        self.assertEqual(len(sale_queries), 1)
+        self.assertIn('LIMIT 3', sale_queries[0])
+        self.assertNotIn('OFFSET', sale_queries[0])
+        self.assertNotIn('COUNT(', sale_queries[0])
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        self.assertEqual(len(self.client.get(reverse('sale-list'), {'page_size': 100}).json()['results']), 3)
+        self.assertEqual(len(self.client.get(reverse('sale-list'), {'page_size': 'x'}).json()['results']), 7)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('sale-list'), {'cursor': 'não-é-um-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_products_are_paged_by_creation(self):
+        for i in range(2, 5):
+            Product.objects.create(product_code=f'P00{i}', name=f'Produto {i}', recommended_price=Decimal('10.00'))
+        ids, _ = self.walk(reverse('product-list') + '?page_size=3')
+        self.assertEqual(ids, [str(pk) for pk in Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True)])
+
+
+class ApiShapeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        cls.vendor = Vendor.objects.create(name='Ana')
+        cls.products = []
+        for i in range(5):
+            supplier = Supplier.objects.create(name=f'Fornecedor {i}')
+            product = Product.objects.create(product_code=f'P{i:03d}', name=f'Produto {i}', supplier=supplier, recommended_price=Decimal('10.00'), stock=50)
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=f'products/{product.pk}/images/{position}.png', position=position)
+                for position in range(2)
+            ])
+            sale = Sale.objects.create(product=product, vendor=cls.vendor, quantity=1, total_price=Decimal('10.00'))
+            Sale.objects.create(product=product, quantity=2, total_price=Decimal('20.00'))
+            cls.products.append(product)
+            if i == 0:
+                cls.sale = sale
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_sales_list_ids_by_default_and_expanded_in_two_queries(self):
+        flat = self.get(reverse('sale-list'), 1)
+        self.assertEqual(len(flat['results']), 10)
+        self.assertEqual(flat['results'][0]['product'], str(self.products[-1].pk))
+
+        data = self.get(reverse('sale-list'), 2, expand='product.supplier,product.images,vendor')
+        sales = {sale['id']: sale for sale in data['results']}
+        sale = sales[self.sale.pk]
+        self.assertEqual(sale['vendor']['name'], 'Ana')
+        self.assertEqual(sale['product']['product_code'], 'P000')
+        self.assertEqual(sale['product']['supplier']['name'], 'Fornecedor 0')
+        self.assertEqual(len(sale['product']['images']), 2)
+
+    def test_sale_detail(self):
+        url = reverse('sale-detail', args=[self.sale.pk])
+        self.assertEqual(self.get(url, 1)['vendor'], self.vendor.pk)
+        # The expanded product lists its image ids, prefetched in one more query
+        product = self.get(url, 2, expand='product,vendor')['product']
+        self.assertEqual(product['name'], 'Produto 0')
+        self.assertEqual(sorted(product['images']), sorted(self.products[0].images.values_list('pk', flat=True)))
+
+    # Product, supplier and vendor responses also run the aggregate behind their ETag
+    def test_product_list_and_detail(self):
+        # Images are listed by id unless expanded, as the supplier is
+        flat = self.get(reverse('product-list'), 3)
+        product = flat['results'][0]
+        self.assertEqual(product['supplier'], self.products[-1].supplier_id)
+        self.assertEqual(sorted(product['images']), sorted(self.products[-1].images.values_list('pk', flat=True)))
+        self.assertEqual(set(self.get(reverse('product-list'), 2, fields='id,name')['results'][0]), {'id', 'name'})
+        data = self.get(reverse('product-list'), 3, expand='supplier,images')
+        self.assertTrue(all(len(product['images']) == 2 and product['supplier']['name'] for product in data['results']))
+
+        url = reverse('product-detail', args=[self.products[0].pk])
+        self.assertEqual(self.get(url, 3, expand='images,supplier')['supplier']['name'], 'Fornecedor 0')
+
+    def test_supplier_and_vendor_endpoints(self):
+        self.assertEqual(len(self.get(reverse('supplier-list'), 2)['results']), 5)
+        self.get(reverse('supplier-detail', args=[self.products[0].supplier_id]), 2)
+        self.assertEqual(self.get(reverse('vendor-list'), 2)['results'][0]['name'], 'Ana')
+        self.get(reverse('vendor-detail', args=[self.vendor.pk]), 2)
+
+    def test_sparse_fields(self):
+        data = self.get(reverse('sale-list'), 2, fields='id,product.name,product.images', expand='product.images')
+        sale = data['results'][0]
+        self.assertEqual(set(sale), {'id', 'product'})
+        self.assertEqual(set(sale['product']), {'name', 'images'})
+
+    def test_unknown_shape_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('sale-list'), {'expand': 'product.vendor'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sale-list'), {'fields': 'id,preço'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sale-list'), {'fields': 'product.name'}).status_code, 400)
+
+    def test_sales_are_created_with_plain_ids(self):
+        product = self.products[0]
+        stock = Product.objects.get(pk=product.pk).stock
+        response = self.client.post(reverse('sale-list') + '?expand=product', {
+            'product': str(product.pk), 'vendor': self.vendor.pk, 'quantity': 3, 'total_price': '30.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['product'], str(product.pk))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, stock - 3)
+        self.assertTrue(StockHistory.objects.filter(product=product, change=-3, reason='sale').exists())
+
+    @override_settings(ALLOW_NEGATIVE_STOCK=False)
+    def test_sale_beyond_stock_is_a_validation_error(self):
+        response = self.client.post(reverse('sale-list'), {
+            'product': str(self.products[0].pk), 'quantity': 500, 'total_price': '10.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json())
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        cls.supplier = Supplier.objects.create(name='Fornecedor')
+        cls.vendor = Vendor.objects.create(name='Ana')
+        cls.products = [
+            Product.objects.create(product_code=f'P{i}', name=f'Produto {i}', supplier=cls.supplier, recommended_price=Decimal('10.00'), stock=20)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url, response, **params):
+        """GETs `url` again with the validators of `response`; returns the new response."""
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        if 'Last-Modified' in response:
+            headers['HTTP_IF_MODIFIED_SINCE'] = response['Last-Modified']
+        return self.client.get(url, params, **headers)
+
+    def test_unchanged_list_costs_one_query(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            again = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+        self.assertEqual(again.content, b'')
+
+    def test_list_etag_follows_edits_sales_and_deletions(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.name = 'Renomeado'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        # Stock leaves through a queryset update, which must touch updated_at too
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(product=product, quantity=1, total_price=Decimal('10.00'))
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[2].delete()
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_list_etag_follows_the_image_ids(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['images'], [])
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+        with override_settings(MEDIA_ROOT=media_root, THUMBNAIL_ASYNC=False), self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.products[-1], image=SimpleUploadedFile('foto.png', buffer.getvalue()))
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['images'], [image.pk])
+
+    def test_etag_depends_on_query_and_expanded_relations(self):
+        url = reverse('product-list')
+        flat = self.client.get(url)
+        expanded = self.client.get(url, {'expand': 'supplier'})
+        self.assertNotEqual(flat['ETag'], expanded['ETag'])
+        self.assertNotEqual(self.client.get(url, {'name': 'Produto 1'})['ETag'], flat['ETag'])
+
+        self.supplier.name = 'Outro nome'
+        self.supplier.save()
+        self.assertEqual(self.revalidate(url, flat).status_code, 304)
+        self.assertEqual(self.revalidate(url, expanded, expand='supplier').status_code, 200)
+
+        flat = self.client.get(url)
+        self.supplier.delete()
+        self.assertEqual(self.revalidate(url, flat).status_code, 200)
+
+    def test_detail_sends_last_modified(self):
+        url = reverse('product-detail', args=[self.products[0].pk])
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        self.products[0].remove_stock(1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        missing = self.client.get(reverse('product-detail', args=[uuid.uuid4()]))
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing)
+
+    def test_supplier_and_vendor_endpoints(self):
+        for url, instance in (
+            (reverse('supplier-list'), self.supplier),
+            (reverse('supplier-detail', args=[self.supplier.pk]), self.supplier),
+            (reverse('vendor-list'), self.vendor),
+            (reverse('vendor-detail', args=[self.vendor.pk]), self.vendor),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+                instance.save()
+                self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        cls.supplier = Supplier.objects.create(name='Fornecedor')
+        cls.vendor = Vendor.objects.create(name='Ana')
+        cls.product = Product.objects.create(product_code='P1', name='Produto', supplier=cls.supplier, recommended_price=Decimal('10.00'), stock=20)
+        Sale.objects.create(product=cls.product, vendor=cls.vendor, quantity=1, total_price=Decimal('10.00'), platform='fisica')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, expected, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['X-Cache'], expected)
+        return response
+
+    def test_identical_filters_are_served_from_cache(self):
+        url = reverse('sale-list')
+        first = self.get(url, 'MISS', vendor=self.vendor.pk, platform='fisica')
+        with self.assertNumQueries(0):
+            again = self.client.get(f'{url}?platform=fisica&min_total_price=&vendor={self.vendor.pk}')
+        self.assertEqual(again['X-Cache'], 'HIT')
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again['Content-Type'], first['Content-Type'])
+        self.get(url, 'MISS', vendor=self.vendor.pk, platform='shopee')
+
+        # A hit carries the ETag its body was first sent with
+        url = reverse('product-list')
+        self.assertEqual(self.get(url, 'MISS')['ETag'], self.get(url, 'HIT')['ETag'])
+
+    def test_writes_invalidate_the_models_they_change(self):
+        sales, products, suppliers = reverse('sale-list'), reverse('product-list'), reverse('supplier-list')
+        for url in (sales, products, suppliers):
+            self.get(url, 'MISS')
+        self.get(sales, 'MISS', expand='vendor')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(product=self.product, quantity=2, total_price=Decimal('20.00'))
+        self.assertEqual(len(self.get(sales, 'MISS').json()['results']), 2)
+        self.assertEqual(self.get(products, 'MISS').json()['results'][0]['stock'], 17)
+        self.get(suppliers, 'HIT')
+
+        self.vendor.name = 'Bia'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.save()
+        self.get(sales, 'HIT')
+        self.assertEqual(self.get(sales, 'MISS', expand='vendor').json()['results'][-1]['vendor']['name'], 'Bia')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supplier.delete()
+        self.get(suppliers, 'MISS')
+        self.assertIsNone(self.get(products, 'MISS').json()['results'][0]['supplier'])
+
+    def test_deleting_a_supplier_clears_it_from_cached_sales(self):
+        sales = reverse('sale-list')
+        self.assertEqual(self.get(sales, 'MISS').json()['results'][0]['supplier'], self.supplier.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supplier.delete()
+        self.assertIsNone(self.get(sales, 'MISS').json()['results'][0]['supplier'])
+
+    @override_settings(API_CACHE_MAX_ENTRY_BYTES=10)
+    def test_large_bodies_are_not_stored(self):
+        url = reverse('product-list')
+        self.get(url, 'MISS')
+        self.get(url, 'MISS')
+
+    def test_scope_and_format(self):
+        url = reverse('vendor-list')
+        self.get(url, 'MISS')
+        staff = get_user_model().objects.create_user('staff', password='senha', is_staff=True)
+        self.client.force_authenticate(staff)
+        self.get(url, 'MISS')
+        self.get(url, 'HIT')
+
+        browsable = self.client.get(url, {'format': 'api'})
+        self.assertEqual(browsable.status_code, 200)
+        self.assertNotIn('X-Cache', browsable)
+        invalid = self.client.get(url, {'cursor': 'inválido'})
+        self.assertEqual(invalid.status_code, 404)
+        self.assertEqual(self.client.get(url, {'cursor': 'inválido'}).status_code, 404)
+
+
+class ResponseCacheCommitTests(TransactionTestCase):
+    """Reads from another connection while a write is open, on a WAL file as in production."""
+
+    def setUp(self):
+        cache.clear()
+        use_file_database(self)
+        self.user = get_user_model().objects.create_user('user', password='senha')
+        self.product = Product.objects.create(product_code='P1', name='Produto', recommended_price=Decimal('10.00'), stock=20)
+
+    def get_from_another_connection(self, url):
+        def get():
+            try:
+                client = APIClient()
+                client.force_authenticate(self.user)
+                return client.get(url)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(get).result(timeout=10)
+
+    def test_read_during_the_write_is_not_cached_as_its_result(self):
+        url = reverse('product-list')
+        with transaction.atomic():
+            self.product.name = 'Renomeado'
+            self.product.save()
+            during = self.get_from_another_connection(url)
+            self.assertEqual(during.json()['results'][0]['name'], 'Produto')
+
+        after = self.get_from_another_connection(url)
+        self.assertEqual(after['X-Cache'], 'MISS')
+        self.assertEqual(after.json()['results'][0]['name'], 'Renomeado')
+        self.assertNotEqual(after['ETag'], during['ETag'])
+
+
+class SaleDayFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user', password='senha')
+        product = Product.objects.create(product_code='P001', name='Caneca', recommended_price=Decimal('10.00'), stock=100)
+        tz = timezone.get_current_timezone()
+        cls.sales = {
+            # 23:30 in São Paulo is already the 11th in UTC
+            name: Sale.objects.create(product=product, quantity=1, total_price=Decimal('10.00'), sale_date=datetime(2024, 5, day, hour, minute, tzinfo=tz))
+            for name, day, hour, minute in (('first', 10, 0, 0), ('late', 10, 23, 30), ('after', 11, 0, 30))
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sales_between(self, **params):
+        response = self.client.get(reverse('sale-list'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        names = {sale.pk: name for name, sale in self.sales.items()}
+        return {names[sale['id']] for sale in response.json()['results']}
+
+    def test_end_date_includes_its_whole_local_day(self):
+        self.assertEqual(self.sales_between(start_date='2024-05-10', end_date='2024-05-10'), {'first', 'late'})
+        self.assertEqual(self.sales_between(end_date='2024-05-10'), {'first', 'late'})
+        self.assertEqual(self.sales_between(start_date='2024-05-11'), {'after'})
+
+    def test_ranges_over_backfilled_sale_days(self):
+        Sale.objects.update(sale_day=date(2000, 1, 1))
+        importlib.import_module('project.migrations.0007_sale_sale_day_indexes').backfill_sale_day(global_apps, None)
+        self.assertEqual(
+            {name: Sale.objects.get(pk=sale.pk).sale_day for name, sale in self.sales.items()},
+            {'first': date(2024, 5, 10), 'late': date(2024, 5, 10), 'after': date(2024, 5, 11)},
+        )
+        self.assertEqual(self.sales_between(start_date='2024-05-10', end_date='2024-05-10'), {'first', 'late'})
+        self.assertEqual(self.sales_between(start_date='2024-05-09', end_date='2024-05-11'), {'first', 'late', 'after'})
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.old_supplier = Supplier.objects.create(name='Antigo')
+        cls.new_supplier = Supplier.objects.create(name='Novo')
+        cls.product = Product.objects.create(product_code='P001', name='Caneca', supplier=cls.old_supplier, recommended_price=Decimal('10.00'), stock=100)
+
+    def rollup(self):
+        rows = SalesDailyRollup.objects.values_list('day', 'product', 'vendor', 'supplier', 'platform') \
+            .annotate(revenue=Sum('revenue'), quantity=Sum('quantity'), sale_count=Sum('sale_count')) \
+            .filter(sale_count__gt=0).order_by('day', 'supplier')
+        return list(rows)
+
+    def assertMatchesRebuild(self):
+        live = self.rollup()
+        SalesDailyRollup.rebuild()
+        self.assertEqual(live, self.rollup())
+
+    def test_edits_and_deletes_keep_the_rollup_in_step_with_sales(self):
+        vendor = Vendor.objects.create(name='Ana')
+        now = timezone.now()
+        sales = [
+            Sale.objects.create(
+                product=self.product, vendor=vendor if i % 2 else None, quantity=1 + i,
+                total_price=Decimal('10.00') * (1 + i), sale_date=now - timedelta(days=i % 3),
+            )
+            for i in range(6)
+        ]
+        sales[0].sale_date = now - timedelta(days=5)
+        sales[0].save()
+        sales[1].vendor = None
+        sales[1].platform = 'shopee'
+        sales[1].save()
+        sales[2].quantity = 10
+        sales[2].total_price = Decimal('100.00')
+        sales[2].save()
+        sales[3].delete()
+        Sale.bulk_register([Sale(product=self.product, vendor=vendor, quantity=1, total_price=Decimal('10.00')) for _ in range(2)])
+
+        self.assertEqual(
+            SalesDailyRollup.objects.aggregate(revenue=Sum('revenue'), sale_count=Sum('sale_count')),
+            {'revenue': Sale.objects.aggregate(total=Sum('total_price'))['total'], 'sale_count': Sale.objects.count()},
+        )
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command_recomputes_only_the_given_days(self):
+        now = timezone.now()
+        Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'), sale_date=now)
+        Sale.objects.create(product=self.product, quantity=2, total_price=Decimal('20.00'), sale_date=now - timedelta(days=2))
+        SalesDailyRollup.objects.update(revenue=0, quantity=0, sale_count=0)
+
+        call_command('rebuild_sales_rollup', start_date=timezone.localdate(now).isoformat(), stdout=StringIO())
+        self.assertEqual(dict(SalesDailyRollup.objects.values_list('day', 'sale_count')), {
+            timezone.localdate(now): 1,
+            timezone.localdate(now - timedelta(days=2)): 0,
+        })
+        with self.assertRaises(CommandError):
+            call_command('rebuild_sales_rollup', start_date='2024-02-02', end_date='2024-02-01')
+
+    def test_sales_keep_the_supplier_they_were_sold_under(self):
+        first = Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'))
+        second = Sale.objects.create(product=self.product, quantity=2, total_price=Decimal('20.00'))
+        self.product.supplier = self.new_supplier
+        self.product.save()
+        Sale.objects.create(product=self.product, quantity=3, total_price=Decimal('30.00'))
+
+        first.quantity = 4
+        first.save()
+        second.delete()
+        self.assertEqual(first.supplier, self.old_supplier)
+        self.assertMatchesRebuild()
+        by_supplier = dict(SalesDailyRollup.objects.values_list('supplier').annotate(Sum('sale_count')))
+        self.assertEqual(by_supplier, {self.old_supplier.pk: 1, self.new_supplier.pk: 1})
+
+    def test_decrement_changes_one_row_of_a_duplicated_bucket(self):
+        sale = Sale.objects.create(product=self.product, quantity=1, total_price=Decimal('10.00'))
+        bucket = SalesDailyRollup.objects.get()
+        bucket.pk = None
+        bucket.save() # As a racing insert would have left it
+        sale.delete()
+        self.assertEqual(SalesDailyRollup.objects.aggregate(total=Sum('sale_count'))['total'], 1)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP indisponível')
+
+
+class AlertingThenFailingEmailBackend(BaseEmailBackend):
+    # A sale queues a new alert while the digest is on its way, then sending fails
+    def send_messages(self, email_messages):
+        for product in Product.objects.all():
+            LowStockAlert.record(product)
+        raise ConnectionError('SMTP indisponível')
@@ -0,0 +1,147 @@
+"""
+WebP thumbnail variants for uploaded images.
+
+Each image field `<name>` has a JSONField `<name>_variants` holding
+{'source': <original file name>, '<width>': <variant file name>, ...}. Variants are
+built after the row is committed, on a small thread pool, and written back with a
+queryset update so no save signals fire again.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.forms.utils import flatatt
+from django.utils import timezone
+from django.utils.html import format_html
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def is_current(field_file, variants):
+    return bool(field_file) and bool(variants) and variants.get('source') == field_file.name
+
+
+def variant_name(source_name, width):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return f'{directory}/variants/{stem}_{width}w.webp'
+
+
+def generate_variants(field_file):
+    """Writes one WebP per configured width (never upscaling) and returns the variants dict."""
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    widths = [width for width in sorted(settings.THUMBNAIL_SIZES) if width < image.width]
+    if image.width <= max(settings.THUMBNAIL_SIZES):
+        widths.append(image.width)
+
+    variants = {'source': field_file.name}
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, max(1, width * image.height // image.width)), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, 'WEBP', quality=settings.THUMBNAIL_QUALITY, method=4)
+        name = variant_name(field_file.name, width)
+        if storage.exists(name):
+            storage.delete(name)
+        variants[str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def build_variants(model, pk, field_name, force=False):
+    """Builds the variants of one row. Returns True when new variants were written."""
+    try:
+        instance = model._default_manager.filter(pk=pk).first()
+        if instance is None:
+            return False
+        field_file = getattr(instance, field_name)
+        old_variants = getattr(instance, variants_field(field_name)) or {}
+        if not force and (is_current(field_file, old_variants) or (not field_file and not old_variants)):
+            return False
+
+        variants = generate_variants(field_file) if field_file else {}
+        stale = {name for key, name in old_variants.items() if key != 'source'} - set(variants.values())
+        for name in stale:
+            field_file.storage.delete(name)
+        # Only record them if the image was not replaced meanwhile; update() skips auto_now,
+        # and the variants are part of what the API returns
+        changes = {variants_field(field_name): variants, 'updated_at': timezone.now()}
+        if field_file:
+            unchanged = Q(**{field_name: field_file.name})
+        else:
+            # A cleared image is NULL in nullable columns, and NULL never equals ''
+            unchanged = Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''})
+        if model._default_manager.filter(unchanged, pk=pk).update(**changes):
+            from . import response_cache  # Imports the models, which import this module
+            response_cache.bump_generation(model)
+        return bool(variants)
+    except Exception:
+        logger.exception('Falha ao gerar miniaturas de %s %s', model.__name__, pk)
+        return False
+
+
+def build_variants_in_thread(model, pk, field_name, force=False):
+    """build_variants for pool threads, which must release their own DB connection."""
+    try:
+        return build_variants(model, pk, field_name, force)
+    finally:
+        connection.close()
+
+
+def schedule_variants(instance, field_name):
+    """Queues variant generation for `instance` once the current transaction commits."""
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field(field_name)) or {}
+    if is_current(field_file, variants) or (not field_file and not variants):
+        return
+    model, pk = type(instance), instance.pk
+
+    def run():
+        if settings.THUMBNAIL_ASYNC:
+            _get_executor().submit(build_variants_in_thread, model, pk, field_name)
+        else:
+            build_variants(model, pk, field_name)
+
+    transaction.on_commit(run)
+
+
+def responsive_img(field_file, variants, sizes, alt='', **attrs):
+    """
+    <img> serving the WebP variants through srcset, or the original upload while
+    the variants are not built yet.
+    """
+    if not field_file:
+        return ''
+    if not is_current(field_file, variants):
+        return format_html('<img src="{}" alt="{}"{}>', field_file.url, alt, flatatt(attrs))
+    storage = field_file.storage
+    widths = sorted((int(key), name) for key, name in variants.items() if key != 'source')
+    srcset = ', '.join(f'{storage.url(name)} {width}w' for width, name in widths)
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>',
+        storage.url(widths[-1][1]), srcset, sizes, alt, flatatt(attrs),
+    )
@@ -1,15 +1,52 @@
-from django.core.mail import send_mail
+from django.core.mail import get_connection, send_mail
 from django.conf import settings
+from django.utils import timezone
 
-def send_low_stock_notification(product):
+from .models import LowStockAlert
+
+
+def send_low_stock_digest():
     """
-    Sends an email notification for low stock.
+    Sends one email listing every product with pending low-stock alerts and marks
+    those alerts as sent. Products restocked in the meantime are marked without
+    being listed. Returns the number of products in the email.
     """
-    subject = f'Alerta de Estoque Baixo: {product.name}'
+    pending = list(
+        LowStockAlert.objects.filter(sent_at__isnull=True)
+        .select_related('product')
+        .order_by('product__name')
+    )
+    if not pending:
+        return 0
+
+    # Claim before sending so signals queue new events in fresh rows, without
+    # holding a write transaction open while the mail server answers. A digest
+    # running alongside keeps the alerts it claimed first
+    pending = LowStockAlert.claim(pending)
+    if not pending:
+        return 0
+
+    still_low = [alert for alert in pending if alert.product.stock < settings.LOW_STOCK_THRESHOLD]
+    if not still_low:
+        return 0
+
+    lines = [
+        f'- {alert.product.name} (Código: {alert.product.product_code}): estoque atual {alert.product.stock} '
+        f'({alert.event_count} alerta(s) desde {timezone.localtime(alert.created_at):%d/%m/%Y %H:%M})'
+        for alert in still_low
+    ]
+    subject = f'Alerta de Estoque Baixo: {len(still_low)} produto(s)'
     message = (
-        f'O produto "{product.name}" (Código: {product.product_code}) está com estoque baixo.\n'
-        f'Estoque atual: {product.stock}\n'
-        f'Por favor, reponha o estoque.'
+        'Os produtos abaixo estão com estoque baixo:\n\n'
+        + '\n'.join(lines)
+        + '\n\nPor favor, reponha o estoque.'
     )
-    recipient_list = [settings.ADMIN_EMAIL]
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
+    try:
+        send_mail(
+            subject, message, settings.DEFAULT_FROM_EMAIL, [settings.ADMIN_EMAIL],
+            connection=get_connection(settings.LOW_STOCK_ALERT_EMAIL_BACKEND),
+        )
+    except Exception:
+        LowStockAlert.release(pending)
+        raise
+    return len(still_low)
@@ -26,7 +26,7 @@ def vendor_list_view(request):
 
 @login_required
 def product_list_view(request):
-    products = Product.objects.all().order_by('-created_at')
+    products = Product.objects.prefetch_related('images').order_by('-created_at')
     context = {
         'products': products,
         'page_title': 'Lista de Produtos'
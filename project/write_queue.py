@@ -0,0 +1,161 @@
+"""
+Optional single writer for the hot write paths.
+
+SQLite takes one writer at a time, and waiting writers poll for the lock rather than
+queue for it, so under concurrent requests some writes keep losing the race until the
+busy timeout fails them with "database is locked". With settings.WRITE_QUEUE_ENABLED,
+run() hands the write to one background thread instead. The thread takes the writes
+that arrive within WRITE_QUEUE_BATCH_WINDOW of each other, in order, and commits them
+in one transaction, each in its own savepoint so a failing write only undoes itself.
+Every caller gets back its own result or exception once the transaction has committed.
+
+run_batched(func, item) goes further: the items queued for the same func are passed
+to one func(items) call, e.g. concurrent sales become one Sale.bulk_register().
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+
+
+class WriteQueue:
+    def __init__(self):
+        self._pending = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Queues func(*args, **kwargs); returns a Future with its result."""
+        return self._put(func, False, args, kwargs)
+
+    def submit_batched(self, func, item):
+        """
+        Queues `item` for func(items), which must return one result per item; returns
+        a Future with this item's result. If the combined call fails, each item is
+        retried alone so the error only reaches the callers it belongs to.
+        """
+        return self._put(func, True, (item,), {})
+
+    def _put(self, func, batched, args, kwargs):
+        future = Future()
+        self._pending.put((future, func, batched, args, kwargs))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+        return future
+
+    def stop(self):
+        """Lets the thread finish the queued writes, then stops it."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._pending.put(None)
+            thread.join()
+
+    def _next_batch(self):
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + settings.WRITE_QUEUE_BATCH_WINDOW
+        while batch[-1] is not None and len(batch) < settings.WRITE_QUEUE_MAX_BATCH:
+            try:
+                batch.append(self._pending.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                jobs = [job for job in batch if job is not None and job[0].set_running_or_notify_cancel()]
+                if jobs:
+                    self._write(jobs)
+                if batch[-1] is None:
+                    return
+        finally:
+            connections.close_all()
+
+    def _write(self, jobs):
+        # Batched jobs for the same func join the group of the first one queued
+        groups = []
+        batched = {}
+        for future, func, is_batched, args, kwargs in jobs:
+            if not is_batched:
+                groups.append((func, [(future, args, kwargs)], False))
+            elif func in batched:
+                batched[func][1].append((future, args, kwargs))
+            else:
+                batched[func] = (func, [(future, args, kwargs)], True)
+                groups.append(batched[func])
+
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for func, calls, is_batched in groups:
+                    if is_batched:
+                        outcomes.extend(self._call_batched(func, calls))
+                    else:
+                        (future, args, kwargs), = calls
+                        outcomes.append(self._call(future, func, *args, **kwargs))
+        except Exception as exc:
+            # The commit failed, so none of the batch was written
+            outcomes = [(future, None, exc) for future, *_ in jobs]
+        finally:
+            close_old_connections()
+
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+    def _call(self, future, func, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return future, func(*args, **kwargs), None
+        except Exception as exc:
+            return future, None, exc
+
+    def _call_batched(self, func, calls):
+        if len(calls) > 1:
+            items = [args[0] for future, args, kwargs in calls]
+            try:
+                with transaction.atomic():
+                    results = func(items)
+                return [(future, result, None) for (future, args, kwargs), result in zip(calls, results)]
+            except Exception:
+                pass # Rolled back; find out whose item failed
+        return [self._call(future, lambda item: func([item])[0], args[0]) for future, args, kwargs in calls]
+
+
+writer = WriteQueue()
+
+
+def _runs_inline():
+    # Inside a transaction the writer could neither see its rows nor get the lock it holds
+    return not settings.WRITE_QUEUE_ENABLED or connection.in_atomic_block
+
+
+def run(func, *args, **kwargs):
+    """
+    Calls func(*args, **kwargs) through the writer thread when the queue is enabled
+    and returns its result or raises its exception. Runs it inline when the queue is
+    off or the caller is already inside a transaction.
+    """
+    if _runs_inline():
+        return func(*args, **kwargs)
+    return writer.submit(func, *args, **kwargs).result()
+
+
+def run_batched(func, item, inline=None):
+    """
+    Like run(), for a func(items) that writes many items at once; returns this item's
+    result. When the write runs inline, inline() is called instead if given: writing a
+    single item is often cheaper another way.
+    """
+    if _runs_inline():
+        return inline() if inline is not None else func([item])[0]
+    return writer.submit_batched(func, item).result()